@@ -1,7 +1,14 @@
+import sys
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# The perftools app (see perftools/__init__.py) is shared by the projects of
+# this repository and lives at its root.
+REPO_DIR = BASE_DIR.parent
+if str(REPO_DIR) not in sys.path:
+    sys.path.append(str(REPO_DIR))
+
 ROOT_URLCONF = 'api_project.urls'
 SECRET_KEY = 'django-insecure-xyz123!supersecretkey!replace-this-value'
 
@@ -16,8 +23,11 @@ INSTALLED_APPS = [
     'rest_framework.authtoken',
     'rest_framework',  # Added DRF
     'api',             # Added your app
+    'perftools',
 ]
 MIDDLEWARE = [
+    'perftools.instrumentation.RequestMetricsMiddleware',
+    'perftools.slow_queries.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',            # Needed for sessions
     'django.middleware.common.CommonMiddleware',
@@ -26,6 +36,20 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',            # Needed for messages
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+
+# Per-request SQL, template and cache metrics (see perftools/instrumentation.py):
+# a Server-Timing header and a JSON line on the "request_metrics" logger.
+# Lower the sample rate to keep it on in production; 0 turns it off.
+REQUEST_METRICS_SAMPLE_RATE = 1.0
+REQUEST_METRICS_SERVER_TIMING = True
+
+# Log statements slower than SLOW_QUERY_THRESHOLD_MS with their query plan
+# (see perftools/slow_queries.py); None turns it off. Summarize
+# SLOW_QUERY_LOG_FILE with "manage.py slow_query_report".
+SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_EXPLAIN = True
+SLOW_QUERY_LOG_FILE = BASE_DIR / 'slow_queries.log'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -45,8 +69,35 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',   # Use SQLite for simplicity
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Reuse connections for a minute, checking them before reuse, so the
+        # PRAGMAs are not re-run on every request.
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # BEGIN IMMEDIATE takes the write lock up front, so busy_timeout
+            # applies instead of a deadlock error on lock upgrade.
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
+
+# PRAGMAs run on every new SQLite connection (see perftools/sqlite_tuning.py).
+# WAL lets readers carry on while a write commits; busy_timeout (ms) makes a
+# writer wait for the lock instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',        # safe with WAL, fsyncs only at checkpoints
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -20000,           # negative means KiB, so about 20 MB
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,
+}
+# Writes still hitting the lock are retried by
+# perftools.sqlite_tuning.retry_on_lock, waiting up to SQLITE_LOCK_BACKOFF
+# seconds, doubled on each retry.
+SQLITE_LOCK_RETRIES = 3
+SQLITE_LOCK_BACKOFF = 0.05
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
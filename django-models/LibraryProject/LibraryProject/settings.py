@@ -10,11 +10,18 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# The perftools app (see perftools/__init__.py) is shared by the projects of
+# this repository and lives at its root, two levels up from this copy.
+REPO_DIR = BASE_DIR.parent.parent
+if str(REPO_DIR) not in sys.path:
+    sys.path.append(str(REPO_DIR))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -38,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'bookshelf.apps.BookshelfConfig',
+    'perftools',
 ]
 
 MIDDLEWARE = [
@@ -77,9 +85,35 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Reuse connections for a minute, checking them before reuse, so the
+        # PRAGMAs are not re-run on every request.
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # BEGIN IMMEDIATE takes the write lock up front, so busy_timeout
+            # applies instead of a deadlock error on lock upgrade.
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# PRAGMAs run on every new SQLite connection (see perftools/sqlite_tuning.py).
+# WAL lets readers carry on while a write commits; busy_timeout (ms) makes a
+# writer wait for the lock instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',        # safe with WAL, fsyncs only at checkpoints
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -20000,           # negative means KiB, so about 20 MB
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,
+}
+# Writes still hitting the lock are retried by
+# perftools.sqlite_tuning.retry_on_lock, waiting up to SQLITE_LOCK_BACKOFF
+# seconds, doubled on each retry.
+SQLITE_LOCK_RETRIES = 3
+SQLITE_LOCK_BACKOFF = 0.05
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
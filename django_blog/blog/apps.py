@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class BlogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blog'
+
+    def ready(self):
+        # Register the signal receivers that maintain the search index.
+        from . import signals  # noqa: F401
+        from .page_cache import check_shared_cache
+
+        # Cached pages are retired through a version in the shared cache.
+        checks.register(check_shared_cache, checks.Tags.caches, deploy=True)
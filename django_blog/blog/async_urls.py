@@ -0,0 +1,16 @@
+from django.urls import path
+
+from . import async_views, urls
+
+# The read-only pages served by blog/async_views.py; every other route is
+# the sync one from blog/urls.py.
+urlpatterns = [
+    path('tags/<slug:tag_slug>/', async_views.post_by_tag, name='post-by-tag'),
+    path('search/', async_views.post_list, name='search-posts'),
+    path('', async_views.post_list, name='post-list'),
+    path('posts/', async_views.post_list, name='post-list-check'),
+    path('post/<int:pk>/', async_views.post_detail, name='post-detail'),
+]
+
+_async_names = {pattern.name for pattern in urlpatterns}
+urlpatterns += [pattern for pattern in urls.urlpatterns if pattern.name not in _async_names]
@@ -0,0 +1,121 @@
+# blog/async_views.py
+"""
+Async (ASGI) versions of the blog's read-only pages.
+
+Under an ASGI server these views run on the event loop and load their data
+with the async ORM (``aget``, ``async for``, ``aprefetch_related_objects``,
+``acount``) instead of tying up a worker thread for every request. They reuse
+the querysets of the class based views in blog/views.py and the same
+templates, so both flavours render the same HTML.
+
+Everything a template touches is loaded before rendering: the templates run
+synchronously and a lazy query from there would raise
+SynchronousOnlyOperation.
+
+Switch them on with ``BLOG_ASYNC_VIEWS = True`` (see django_blog/urls.py) or
+include ``blog.async_urls`` directly.
+"""
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage
+from django.db.models import QuerySet, aprefetch_related_objects
+from django.http import Http404
+from django.shortcuts import render
+
+from . import tag_stats
+from .cards import arender_post_cards
+from .forms import CommentForm
+from .models import Post
+from .page_cache import async_anonymous_page_cache
+from .pagination import AsyncPaginator, CursorPage, CursorPaginator, InvalidCursor
+from .search import search_available
+from .views import PostByTagListView, PostDetailView, PostListView, comment_paginator
+
+# Comment posts on the detail page are writes; they keep using the sync view.
+_sync_post_detail = PostDetailView.as_view()
+
+
+@async_anonymous_page_cache
+async def post_list(request):
+    """Post list and search, like PostListView."""
+    return await _render_post_list(request, PostListView)
+
+
+@async_anonymous_page_cache
+async def post_by_tag(request, tag_slug):
+    """Posts carrying a tag, like PostByTagListView."""
+    return await _render_post_list(request, PostByTagListView, tag_slug=tag_slug)
+
+
+@async_anonymous_page_cache
+async def post_detail(request, pk):
+    """A post with the first page of its comments, like PostDetailView."""
+    if request.method not in ('GET', 'HEAD'):
+        return await sync_to_async(_sync_post_detail)(request, pk=pk)
+
+    request.user = await request.auser()
+    try:
+        post = await Post.objects.select_related('author').prefetch_related('tags').aget(pk=pk)
+    except Post.DoesNotExist:
+        raise Http404('No post found matching the query')
+    context = {
+        'object': post,
+        'post': post,
+        'form': CommentForm(),
+        'post_id': post.pk,
+        'comments_page': await comment_paginator(post.pk).apage(),
+        'tag_cloud': await tag_stats.atag_cloud(),
+    }
+    return render(request, PostDetailView.template_name, context)
+
+
+async def _render_post_list(request, view_class, **kwargs):
+    request.user = await request.auser()
+    # Looked up once per process, but that first lookup is an introspection
+    # query and must not run on the event loop.
+    await sync_to_async(search_available)()
+
+    view = view_class()
+    view.setup(request, **kwargs)
+    queryset = view.get_queryset()
+    page_size = view.get_paginate_by(queryset)
+
+    if view.use_cursor_pagination() and isinstance(queryset, QuerySet):
+        paginator = CursorPaginator(queryset, page_size)
+        cursor, page_number = view.get_cursor_position()
+        try:
+            if cursor:
+                page = await paginator.apage(cursor)
+            else:
+                page = await paginator.aoffset_page(page_number)
+        except InvalidCursor as e:
+            raise Http404(str(e))
+    else:
+        paginator = AsyncPaginator(queryset, page_size)
+        page_number = kwargs.get(view.page_kwarg) or request.GET.get(view.page_kwarg) or 1
+        try:
+            page = await paginator.apage(page_number)
+        except InvalidPage as e:
+            raise Http404(str(e))
+
+    posts = list(page.object_list)
+    context = {
+        'view': view,
+        'paginator': paginator,
+        'page_obj': page,
+        'is_paginated': page.has_other_pages(),
+        'object_list': posts,
+        'posts': posts,
+        'cursor_pagination': isinstance(page, CursorPage),
+        'tag_cloud': await tag_stats.atag_cloud(),
+    }
+    if isinstance(view, PostListView):
+        context['search_query'] = request.GET.get('q', '')
+        context['sort'] = view.get_sort()
+
+    if context.get('search_query'):
+        # Search results are rendered card by card without the fragment
+        # cache; ranked results already have their tags.
+        await aprefetch_related_objects(posts, 'tags')
+    else:
+        context['rendered_cards'] = await arender_post_cards(posts)
+    return render(request, view.template_name, context)
@@ -0,0 +1,416 @@
+# blog/autocomplete.py
+"""
+In-process prefix index behind the search box's type-ahead.
+
+Every word of every post title and tag name is kept in a sorted list of
+(word, key) pairs. A prefix lookup is then two bisects and a scan of the
+matching slice, without touching the database. Short prefixes match a large
+slice ("d" matches half the site), so for single word queries of up to
+``CACHED_PREFIX_LENGTH`` characters the best ``limit`` keys are remembered.
+At most ``CACHED_PREFIXES`` such lists are kept, least recently used
+dropped first, which bounds the extra memory to ``limit`` keys per prefix.
+
+Each process builds its indexes on first use (one query for the posts and
+one for the tags). The receivers in blog/signals.py report the posts and
+tags that were saved, deleted or (re)tagged. Once the transaction commits,
+and only then, the change goes into a journal in the cache under the next
+version number, and this process reloads those few rows into its indexes.
+A process whose indexes are behind the cached version replays the journal
+entries it missed the same way, so with a shared cache backend every worker
+picks up the others' writes on its next lookup without reloading every
+title. When the entries cannot be replayed (evicted, too many, or after
+``reset()``), and once an index is ``BLOG_AUTOCOMPLETE_MAX_AGE`` seconds old,
+the index is rebuilt in a background thread while lookups keep using the
+old one. Suggestions are hints, not search results, so that lag is
+acceptable.
+"""
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.urls import reverse
+
+from .background import run_in_thread
+
+# Suggestions kept per cached prefix, and returned at most per kind.
+SUGGESTION_LIMIT = 10
+# Prefixes up to this length remember their best suggestions...
+CACHED_PREFIX_LENGTH = 6
+# ...for this many prefixes at most.
+CACHED_PREFIXES = 20000
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+# Sorts after every word that starts with a given prefix.
+_PREFIX_END = '\U0010ffff'
+
+VERSION_CACHE_KEY = 'blog:autocomplete-version'
+# The posts and tags changed by the write that moved the version to N.
+JOURNAL_CACHE_KEY = 'blog:autocomplete-change:%d'
+# An index further behind than this many writes is rebuilt, not replayed.
+REPLAY_LIMIT = 500
+
+
+def max_age():
+    return getattr(settings, 'BLOG_AUTOCOMPLETE_MAX_AGE', 60 * 5)
+
+
+def words(text):
+    """The lower-cased words of ``text``, as stored in and looked up from the index."""
+    return [word.casefold() for word in _WORD_RE.findall(text or '')]
+
+
+class PrefixIndex:
+    """
+    Entries (a label and a score under a key) found by the prefixes of the
+    words of their label. Higher scores come first, then labels in
+    alphabetical order.
+    """
+
+    def __init__(self, limit=SUGGESTION_LIMIT, cached_prefix_length=CACHED_PREFIX_LENGTH,
+                 cached_prefixes=CACHED_PREFIXES):
+        self.limit = limit
+        self.cached_prefix_length = cached_prefix_length
+        self.cached_prefixes = cached_prefixes
+        self._lock = threading.RLock()
+        self._entries = {}  # key -> (label, score, data)
+        self._words = {}    # key -> words of the label
+        self._sorted = []   # sorted (word, key) pairs
+        self._top = OrderedDict()  # short prefix -> best keys, best first
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def load(self, entries):
+        """Replace the contents with ``(key, label, score, data)`` tuples in one go."""
+        with self._lock:
+            self._entries = {key: (label, score, data) for key, label, score, data in entries}
+            self._words = {key: set(words(label)) for key, (label, _, _) in self._entries.items()}
+            self._sorted = sorted((word, key) for key, ws in self._words.items() for word in ws)
+            self._top = OrderedDict()
+
+    def add(self, key, label, score=0, data=None):
+        """Add an entry, or replace the one under ``key``."""
+        with self._lock:
+            if key in self._entries:
+                self.remove(key)
+            self._entries[key] = (label, score, data)
+            self._words[key] = set(words(label))
+            for word in self._words[key]:
+                insort(self._sorted, (word, key))
+            self._promote(key)
+
+    def remove(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return
+            for word in self._words[key]:
+                index = bisect_left(self._sorted, (word, key))
+                del self._sorted[index]
+            self._forget(key)
+            del self._entries[key], self._words[key]
+
+    def adjust_score(self, key, delta):
+        """Move an entry's score by ``delta``, e.g. a tag's post count."""
+        with self._lock:
+            if key not in self._entries:
+                return
+            label, score, data = self._entries[key]
+            if delta < 0:
+                self._forget(key)
+            self._entries[key] = (label, score + delta, data)
+            self._promote(key)
+
+    def get(self, key):
+        """Return the (label, score, data) of an entry, or None."""
+        return self._entries.get(key)
+
+    def suggest(self, query, limit=None):
+        """
+        Return the best ``(key, label, score, data)`` entries having, for
+        every word of ``query``, a word starting with it.
+        """
+        limit = min(limit or self.limit, self.limit)
+        prefixes = words(query)
+        if not prefixes:
+            return []
+        # The longest prefix matches the fewest words; the others filter.
+        driver = max(prefixes, key=len)
+        others = [prefix for prefix in prefixes if prefix != driver]
+        with self._lock:
+            if not others and len(driver) <= self.cached_prefix_length:
+                return [(key, *self._entries[key]) for key in self._best(driver)[:limit]]
+            candidates = self._matching(driver)
+            if others:
+                candidates = [
+                    key for key in candidates
+                    if all(any(word.startswith(prefix) for word in self._words[key]) for prefix in others)
+                ]
+            best = heapq.nsmallest(limit, candidates, key=self._rank)
+            return [(key, *self._entries[key]) for key in best]
+
+    def _rank(self, key):
+        label, score, _ = self._entries[key]
+        return (-score, label.casefold(), key)
+
+    def _matching(self, prefix):
+        start = bisect_left(self._sorted, (prefix,))
+        end = bisect_left(self._sorted, (prefix + _PREFIX_END,), start)
+        return {key for _, key in self._sorted[start:end]}
+
+    def _best(self, prefix):
+        """The best ``limit`` keys matching a short prefix, best first."""
+        top = self._top.get(prefix)
+        if top is None:
+            top = self._top[prefix] = heapq.nsmallest(self.limit, self._matching(prefix), key=self._rank)
+            if len(self._top) > self.cached_prefixes:
+                self._top.popitem(last=False)
+        else:
+            self._top.move_to_end(prefix)
+        return top
+
+    def _short_prefixes(self, key):
+        return {
+            word[:length]
+            for word in self._words[key]
+            for length in range(1, min(len(word), self.cached_prefix_length) + 1)
+        }
+
+    def _promote(self, key):
+        """Put a new or improved entry into the remembered lists it now belongs to."""
+        rank = self._rank(key)
+        for prefix in self._short_prefixes(key):
+            top = self._top.get(prefix)
+            if top is None:
+                continue
+            if key in top:
+                top.remove(key)
+            if len(top) < self.limit or rank < self._rank(top[-1]):
+                insort(top, key, key=self._rank)
+                del top[self.limit:]
+
+    def _forget(self, key):
+        # Whatever should replace the entry is unknown here, so drop the
+        # lists it was in and let the next lookup rebuild them.
+        for prefix in self._short_prefixes(key):
+            if key in self._top.get(prefix, ()):
+                del self._top[prefix]
+
+
+_indexes = {}
+# Index name -> (version, monotonic time) it was built at.
+_built = {}
+_build_lock = threading.Lock()
+# Index names being rebuilt in a background thread.
+_rebuilding = set()
+
+
+def current_version():
+    return cache.get(VERSION_CACHE_KEY, 0)
+
+
+def post_index(version=None):
+    """The process's post title index, built on first use."""
+    return _get_index('posts', version)
+
+
+def tag_index(version=None):
+    """The process's tag name index (scored by post count), built on first use."""
+    return _get_index('tags', version)
+
+
+def _get_index(name, version=None):
+    """
+    The named index: built on first use, caught up with the journal when
+    behind ``version``, rebuilt in the background when that is not possible
+    or it expired.
+    """
+    if version is None:
+        version = current_version()
+    index = _indexes.get(name)
+    if index is None:
+        with _build_lock:
+            index = _indexes.get(name)
+            if index is None:
+                index = PrefixIndex()
+                index.load(_LOADERS[name]())
+                _indexes[name] = index
+                _built[name] = (version, time.monotonic())
+    built = _built.get(name)
+    if built is not None and (built[0] != version or time.monotonic() - built[1] >= max_age()):
+        if not _catch_up(name, version):
+            _rebuild_in_background(name)
+    return _indexes.get(name, index)
+
+
+def _catch_up(name, version):
+    """Replay the journal entries the index missed; False when it has to be rebuilt instead."""
+    with _build_lock:
+        if name not in _built:
+            return True
+        built_version, built_at = _built[name]
+        if time.monotonic() - built_at >= max_age():
+            return False
+        if built_version == version:
+            return True
+        if not built_version < version <= built_version + REPLAY_LIMIT:
+            return False
+        keys = [JOURNAL_CACHE_KEY % number for number in range(built_version + 1, version + 1)]
+        entries = cache.get_many(keys)
+        if len(entries) < len(keys):
+            return False
+        _refresh(name, set().union(*(entries[key][name] for key in keys)))
+        _built[name] = (version, built_at)
+        return True
+
+
+def _refresh(name, keys):
+    """Reload the entries under ``keys`` from the database; entries whose row is gone are removed."""
+    if not keys:
+        return
+    index = _indexes[name]
+    rows = {key: entry for key, *entry in _LOADERS[name](keys)}
+    for key in keys:
+        if key in rows:
+            index.add(key, *rows[key])
+        else:
+            index.remove(key)
+
+
+def _rebuild_in_background(name):
+    """Rebuild the named index in a thread; lookups keep using the old one meanwhile."""
+    with _build_lock:
+        if name in _rebuilding:
+            return
+        _rebuilding.add(name)
+    run_in_thread(_rebuild, name, name='autocomplete-rebuild')
+
+
+def _rebuild(name):
+    try:
+        version = current_version()
+        index = PrefixIndex()
+        index.load(_LOADERS[name]())
+        with _build_lock:
+            _indexes[name] = index
+            _built[name] = (version, time.monotonic())
+    finally:
+        _rebuilding.discard(name)
+
+
+def _bump_version():
+    """Move the shared version on; returns the new version, or None when it was lost."""
+    cache.add(VERSION_CACHE_KEY, 0, None)
+    try:
+        return cache.incr(VERSION_CACHE_KEY)
+    except ValueError:
+        # Evicted in between: start over.
+        cache.add(VERSION_CACHE_KEY, 1, None)
+        return None
+
+
+def _committed(posts=(), tags=()):
+    """
+    Journal a committed change for the other processes, and apply it to this
+    process's indexes that were current. Indexes that were behind catch up
+    on their next lookup.
+    """
+    changes = {'posts': set(posts), 'tags': set(tags)}
+    version = _bump_version()
+    if version is not None:
+        cache.set(JOURNAL_CACHE_KEY % version, changes, max_age())
+    with _build_lock:
+        for name, (built_version, built_at) in list(_built.items()):
+            if version is not None and built_version == version - 1:
+                _refresh(name, changes[name])
+                _built[name] = (version, built_at)
+
+
+def _changed(posts=(), tags=()):
+    transaction.on_commit(lambda: _committed(posts, tags))
+
+
+def _reset_committed():
+    _indexes.clear()
+    _built.clear()
+    # No journal entry: every other process rebuilds.
+    _bump_version()
+
+
+def reset():
+    """
+    Drop the indexes, after bulk writes that send no signals; the next
+    lookup in every process rebuilds them from the database.
+    """
+    _indexes.clear()
+    _built.clear()
+    transaction.on_commit(_reset_committed)
+
+
+def _load_posts(keys=None):
+    from .models import Post
+
+    # Newer posts first; the score is the publication timestamp.
+    rows = Post.objects.all() if keys is None else Post.objects.filter(pk__in=keys)
+    rows = rows.values_list('pk', 'title', 'published_date').iterator(chunk_size=5000)
+    return [(pk, title, published.timestamp(), None) for pk, title, published in rows]
+
+
+def _load_tags(keys=None):
+    from taggit.models import Tag
+
+    rows = Tag.objects.all() if keys is None else Tag.objects.filter(pk__in=keys)
+    rows = rows.values_list('pk', 'name', 'slug', 'blog_stats__post_count')
+    return [(pk, name, count or 0, slug) for pk, name, slug, count in rows]
+
+
+_LOADERS = {'posts': _load_posts, 'tags': _load_tags}
+
+
+# Signal hooks. Each records which posts or tags changed; the indexes here
+# and in the other processes take the change once the transaction commits.
+
+def post_saved(post):
+    _changed(posts=[post.pk])
+
+
+def post_deleted(post_id):
+    _changed(posts=[post_id])
+
+
+def tag_saved(tag):
+    _changed(tags=[tag.pk])
+
+
+def tag_deleted(tag_id):
+    _changed(tags=[tag_id])
+
+
+def tags_counted(tag_ids):
+    """Posts were tagged or untagged with ``tag_ids``, moving their post counts."""
+    if tag_ids:
+        _changed(tags=list(tag_ids))
+
+
+def suggestions(query, limit=SUGGESTION_LIMIT):
+    """Tag and post title suggestions for ``query``, as JSON-ready dicts."""
+    # One cache read checks both indexes.
+    version = current_version()
+    tags = [
+        {'name': name, 'url': reverse('post-by-tag', args=[slug]), 'posts': count}
+        for _, name, count, slug in tag_index(version).suggest(query, limit)
+        if count > 0
+    ]
+    posts = [
+        {'title': title, 'url': reverse('post-detail', args=[pk])}
+        for pk, title, _, _ in post_index(version).suggest(query, limit)
+    ]
+    return {'query': query, 'tags': tags, 'posts': posts}
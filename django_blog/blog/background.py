@@ -0,0 +1,21 @@
+# blog/background.py
+"""
+Work taken off the request path: rebuilding the type-ahead index
+(blog/autocomplete.py) and the sitemaps (blog/sitemaps.py).
+"""
+import threading
+
+from django.db import connections
+
+
+def run_in_thread(func, *args, name=None):
+    """Call ``func(*args)`` in a daemon thread, closing its database connections afterwards."""
+
+    def run():
+        try:
+            func(*args)
+        finally:
+            # The thread's own connections.
+            connections.close_all()
+
+    threading.Thread(target=run, name=name, daemon=True).start()
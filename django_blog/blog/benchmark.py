@@ -0,0 +1,218 @@
+# blog/benchmark.py
+"""
+In-process load test for the blog's URLs.
+
+Every GET-able route in blog/urls.py is requested through Django's test
+client by ``concurrency`` threads. Each thread has its own client and
+database connections. Each request is timed and its SQL queries (on every
+database alias) are counted.
+The report is a plain dict (dumped as JSON by ``manage.py benchmark_blog``)
+with throughput, latency percentiles and queries per request for every URL,
+so runs can be diffed between releases.
+
+URL arguments are filled from the data in the database: ``pk`` with a post
+(or, for comment routes, a comment) and ``tag_slug`` with one of the
+popular tags. Run ``manage.py generate_blog_data`` first for meaningful
+numbers.
+"""
+import math
+import platform
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+import django
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connection, connections, router
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from taggit.models import Tag
+
+from . import urls
+from .models import Comment, Post
+
+# Routes that only make sense as POSTs, the full export and the sitemap
+# files, which are served from disk.
+SKIPPED_ROUTES = {'logout', 'export-posts', 'sitemap-index', 'sitemap-segment'}
+
+# Extra query string per route.
+ROUTE_PARAMS = {
+    'search-posts': {'q': 'django'},
+    'autocomplete': {'q': 'dj'},
+}
+
+# How many objects URL arguments are drawn from.
+SAMPLE_SIZE = 100
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(fraction * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class Target:
+    """One route of blog/urls.py and how to build URLs for it."""
+
+    def __init__(self, pattern, samples):
+        self.name = pattern.name
+        self.route = str(pattern.pattern)
+        self.arguments = list(pattern.pattern.converters)
+        self.params = ROUTE_PARAMS.get(self.name, {})
+        self.samples = samples
+
+    def url(self, rng):
+        kwargs = {}
+        for argument in self.arguments:
+            if argument == 'pk':
+                pool = self.samples['comments' if self.name.startswith('comment-') else 'posts']
+            else:
+                pool = self.samples['tags']
+            if not pool:
+                return None
+            kwargs[argument] = rng.choice(pool)
+        return reverse(self.name, kwargs=kwargs)
+
+
+class BlogBenchmark:
+    """
+    Sends ``requests`` requests to each target, spread over ``concurrency``
+    threads, after ``warmup`` untimed requests per target. With
+    ``username`` the clients are logged in as that user.
+    """
+
+    def __init__(self, requests=200, concurrency=4, warmup=10, names=None, username=None,
+                 host='localhost', seed=None):
+        self.requests = requests
+        self.concurrency = max(concurrency, 1)
+        self.warmup = warmup
+        self.names = set(names or ())
+        self.username = username
+        self.host = host
+        self.seed = seed
+
+    def targets(self):
+        samples = {
+            'posts': list(Post.objects.order_by('-published_date').values_list('pk', flat=True)[:SAMPLE_SIZE]),
+            'comments': list(Comment.objects.order_by('-created_at').values_list('pk', flat=True)[:SAMPLE_SIZE]),
+            'tags': list(
+                Tag.objects.filter(blog_stats__post_count__gt=0)
+                .order_by('-blog_stats__post_count').values_list('slug', flat=True)[:SAMPLE_SIZE]
+            ),
+        }
+        targets = []
+        for pattern in urls.urlpatterns:
+            if not pattern.name or pattern.name in SKIPPED_ROUTES:
+                continue
+            if self.names and pattern.name not in self.names:
+                continue
+            targets.append(Target(pattern, samples))
+        return targets
+
+    def client(self):
+        # Count view errors as 500s instead of aborting the run.
+        client = Client(raise_request_exception=False, HTTP_HOST=self.host)
+        if self.username:
+            client.force_login(User.objects.get(username=self.username))
+        return client
+
+    def run(self):
+        """Benchmark every target in turn; returns the report dict."""
+        results = [self.run_target(target) for target in self.targets()]
+        return {
+            'started': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'config': {
+                'requests': self.requests,
+                'concurrency': self.concurrency,
+                'warmup': self.warmup,
+                'user': self.username,
+            },
+            'data': {
+                'posts': Post.objects.count(),
+                'comments': Comment.objects.count(),
+                'tags': Tag.objects.count(),
+            },
+            'results': results,
+        }
+
+    def run_target(self, target):
+        shares = [self.requests // self.concurrency] * self.concurrency
+        for i in range(self.requests % self.concurrency):
+            shares[i] += 1
+        shares = [share for share in shares if share]
+        seeds = [None if self.seed is None else self.seed + i for i in range(len(shares))]
+
+        self.worker(target, self.warmup, seeds[0])
+        started = time.perf_counter()
+        if len(shares) == 1:
+            samples = [self.worker(target, shares[0], seeds[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=len(shares)) as pool:
+                samples = list(pool.map(self.threaded_worker, [target] * len(shares), shares, seeds))
+        elapsed = time.perf_counter() - started
+        return self.summarize(target, [sample for chunk in samples for sample in chunk], elapsed)
+
+    def threaded_worker(self, target, count, seed):
+        try:
+            return self.worker(target, count, seed)
+        finally:
+            connections.close_all()
+
+    def worker(self, target, count, seed):
+        """Make ``count`` requests; returns (status, seconds, queries) per request."""
+        rng = random.Random(seed)
+        client = self.client()
+        # Reads may be routed to another alias than the writes.
+        aliases = {DEFAULT_DB_ALIAS, router.db_for_read(Post)}
+        samples = []
+        for _ in range(count):
+            url = target.url(rng)
+            if url is None:
+                break
+            with ExitStack() as stack:
+                captured = [
+                    stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in aliases
+                ]
+                started = time.perf_counter()
+                response = client.get(url, target.params)
+                elapsed = time.perf_counter() - started
+            samples.append((response.status_code, elapsed, sum(len(queries) for queries in captured)))
+        return samples
+
+    def summarize(self, target, samples, elapsed):
+        latencies = sorted(seconds * 1000 for _, seconds, _ in samples)
+        queries = [count for _, _, count in samples]
+        statuses = Counter(str(status) for status, _, _ in samples)
+        result = {
+            'name': target.name,
+            'route': target.route,
+            'requests': len(samples),
+            'errors': sum(count for status, count in statuses.items() if status.startswith('5')),
+            'status_codes': dict(sorted(statuses.items())),
+            'seconds': round(elapsed, 4),
+            'throughput_rps': round(len(samples) / elapsed, 2) if samples and elapsed else 0,
+            'latency_ms': None,
+            'queries_per_request': None,
+        }
+        if samples:
+            result['latency_ms'] = {
+                'mean': round(sum(latencies) / len(latencies), 3),
+                'p50': round(percentile(latencies, 0.50), 3),
+                'p95': round(percentile(latencies, 0.95), 3),
+                'p99': round(percentile(latencies, 0.99), 3),
+                'max': round(latencies[-1], 3),
+            }
+            result['queries_per_request'] = {
+                'mean': round(sum(queries) / len(queries), 2),
+                'max': max(queries),
+            }
+        return result
@@ -0,0 +1,64 @@
+# blog/cards.py
+"""
+Fragment cache for the post cards on the list pages.
+
+Each card is cached under its post id and ``Post.card_version``. The version
+lives on the post row itself and is bumped (see blog/signals.py) when the
+post, its tags or its author change, so a stale card is simply never looked
+up again and no explicit invalidation is needed.
+
+A page of cards costs one ``get_many``; the misses get their tags prefetched
+together, are rendered in one pass and stored with one ``set_many``.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, aprefetch_related_objects, prefetch_related_objects
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import Post
+
+CARD_TEMPLATE = 'blog/post_card.html'
+
+
+def card_cache_timeout():
+    return getattr(settings, 'BLOG_CARD_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def card_cache_key(post):
+    return 'blog:post-card:%d:%d' % (post.pk, post.card_version)
+
+
+def bump_card_version(**filters):
+    """Invalidate the cached cards of every post matching ``filters``."""
+    Post.objects.filter(**filters).update(card_version=F('card_version') + 1)
+
+
+def render_post_cards(posts):
+    """Return the HTML of the cards for ``posts``, in order."""
+    keys = [card_cache_key(post) for post in posts]
+    cards = cache.get_many(keys)
+    missing = [post for key, post in zip(keys, posts) if key not in cards]
+    if missing:
+        prefetch_related_objects(missing, 'tags')
+        fresh = _render_cards(missing)
+        cache.set_many(fresh, card_cache_timeout())
+        cards.update(fresh)
+    return mark_safe(''.join(cards[key] for key in keys))
+
+
+async def arender_post_cards(posts):
+    """render_post_cards() for async views."""
+    keys = [card_cache_key(post) for post in posts]
+    cards = await cache.aget_many(keys)
+    missing = [post for key, post in zip(keys, posts) if key not in cards]
+    if missing:
+        await aprefetch_related_objects(missing, 'tags')
+        fresh = _render_cards(missing)
+        await cache.aset_many(fresh, card_cache_timeout())
+        cards.update(fresh)
+    return mark_safe(''.join(cards[key] for key in keys))
+
+
+def _render_cards(posts):
+    return {card_cache_key(post): render_to_string(CARD_TEMPLATE, {'post': post}) for post in posts}
@@ -0,0 +1,87 @@
+# blog/comment_stats.py
+"""
+Denormalized comment statistics on Post.
+
+``Post.comment_count`` and ``Post.last_comment_at`` are adjusted with a
+single UPDATE using F() expressions whenever a comment is created or deleted
+(see blog/signals.py), so list pages can show and sort by them without
+counting the Comment table. The same UPDATE bumps ``card_version`` so the
+cached post card picks up the new count.
+"""
+from django.db.models import Count, F, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Post
+
+
+def record_comment_added(comment):
+    Post.objects.filter(pk=comment.post_id).update(
+        comment_count=F('comment_count') + 1,
+        last_comment_at=Greatest(
+            Coalesce(F('last_comment_at'), Value(comment.created_at)), Value(comment.created_at),
+        ),
+        card_version=F('card_version') + 1,
+    )
+
+
+def record_comment_removed(comment):
+    Post.objects.filter(pk=comment.post_id).update(
+        comment_count=Greatest(F('comment_count') - 1, Value(0)),
+        last_comment_at=_latest_comment(),
+        card_version=F('card_version') + 1,
+    )
+
+
+def _latest_comment():
+    return Subquery(
+        Comment.objects.filter(post=OuterRef('pk'))
+        .order_by('-created_at', '-id')
+        .values('created_at')[:1]
+    )
+
+
+def _comment_count():
+    return Coalesce(
+        Subquery(
+            Comment.objects.filter(post=OuterRef('pk'))
+            .order_by()
+            .values('post')
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        Value(0),
+    )
+
+
+def repair_comment_stats(chunk_size=10000):
+    """
+    Recompute comment_count and last_comment_at for every post.
+
+    Works through the posts in primary key ranges of ``chunk_size`` so each
+    query stays short, and only rewrites posts whose values were wrong.
+    Returns the number of posts fixed.
+    """
+    last_pk = Post.objects.aggregate(last=Max('pk'))['last'] or 0
+    fixed = 0
+    for start in range(0, last_pk + 1, chunk_size):
+        rows = (
+            Post.objects.filter(pk__gte=start, pk__lt=start + chunk_size)
+            .annotate(real_count=_comment_count(), real_last=_latest_comment())
+            .values_list('pk', 'comment_count', 'last_comment_at', 'real_count', 'real_last')
+        )
+        stale_ids = [
+            pk for pk, count, last, real_count, real_last in rows
+            if (count, last) != (real_count, real_last)
+        ]
+        if stale_ids:
+            fixed += refresh_comment_stats(stale_ids)
+    return fixed
+
+
+def refresh_comment_stats(post_ids):
+    """Recompute the statistics of the given posts in one UPDATE; returns the rows updated."""
+    return Post.objects.filter(pk__in=post_ids).update(
+        comment_count=_comment_count(),
+        last_comment_at=_latest_comment(),
+        card_version=F('card_version') + 1,
+    )
@@ -0,0 +1,17 @@
+# blog/context_processors.py
+from django.utils.functional import SimpleLazyObject
+
+from . import tag_stats
+
+
+def popular_tags(request):
+    """
+    Expose the cached ``popular_tags`` and ``tag_cloud`` to every template.
+
+    Both are lazy, so pages that do not render the sidebar never touch the
+    cache, and neither ever runs an aggregate query.
+    """
+    return {
+        'popular_tags': SimpleLazyObject(tag_stats.popular_tags),
+        'tag_cloud': SimpleLazyObject(tag_stats.tag_cloud),
+    }
@@ -0,0 +1,98 @@
+# blog/feeds.py
+"""
+RSS and Atom feeds of the latest posts, site-wide and per tag.
+
+Feed readers poll often and all get the same document, so the feeds are
+served through ``shared_page_cache`` (see blog/page_cache.py). A feed is
+rendered once per content change; after that a poll is answered from the
+cache. A poll sending the ETag or Last-Modified it got last time gets a
+304, and neither case touches the database.
+"""
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.text import Truncator
+from taggit.models import Tag
+
+from .models import Post
+from .page_cache import shared_page_cache
+
+# Words of the post kept in an item's description.
+SUMMARY_WORDS = 60
+
+
+def feed_size():
+    return getattr(settings, 'BLOG_FEED_ITEMS', 20)
+
+
+class LatestPostsFeed(Feed):
+    title = 'Django Blog'
+    description = 'The latest posts.'
+
+    def link(self):
+        return reverse('post-list')
+
+    def items(self):
+        return self.latest(Post.objects.all())
+
+    def latest(self, queryset):
+        return (
+            queryset
+            .select_related('author')
+            .prefetch_related('tags')
+            .order_by('-published_date', '-id')[:feed_size()]
+        )
+
+    def item_title(self, item):
+        return item.title
+
+    def item_description(self, item):
+        return Truncator(item.content).words(SUMMARY_WORDS)
+
+    def item_pubdate(self, item):
+        return item.published_date
+
+    def item_author_name(self, item):
+        return item.author.username
+
+    def item_categories(self, item):
+        return [tag.name for tag in item.tags.all()]
+
+
+class LatestPostsAtomFeed(LatestPostsFeed):
+    feed_type = Atom1Feed
+    subtitle = LatestPostsFeed.description
+
+
+class TagFeed(LatestPostsFeed):
+    """The latest posts with a tag, matched on ``tags__slug`` like PostByTagListView."""
+
+    def get_object(self, request, tag_slug):
+        return get_object_or_404(Tag, slug=tag_slug)
+
+    def title(self, tag):
+        return 'Django Blog: posts tagged %s' % tag.name
+
+    def description(self, tag):
+        return 'The latest posts tagged %s.' % tag.name
+
+    def link(self, tag):
+        return reverse('post-by-tag', args=[tag.slug])
+
+    def items(self, tag):
+        return self.latest(Post.objects.filter(tags__slug=tag.slug))
+
+
+class TagAtomFeed(TagFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, tag):
+        return self.description(tag)
+
+
+latest_posts_rss = shared_page_cache(LatestPostsFeed())
+latest_posts_atom = shared_page_cache(LatestPostsAtomFeed())
+tag_posts_rss = shared_page_cache(TagFeed())
+tag_posts_atom = shared_page_cache(TagAtomFeed())
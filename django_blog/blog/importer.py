@@ -0,0 +1,370 @@
+# blog/importer.py
+"""
+Streaming bulk import of posts, comments and tags.
+
+Records are read one at a time from JSON lines or CSV. They are written in
+batches of ``batch_size``, one transaction per batch with a bulk_create per
+model. The authors of a batch are resolved with one query. So are its tags,
+plus one insert and one query for the tags that do not exist yet. Tags are
+attached with a bulk insert into taggit's TaggedItem. Only the current batch
+is held in memory, however large the input is.
+
+bulk_create sends no signals, so each batch also updates what
+blog/signals.py would have: tag statistics, comment counts, the search
+index and the sitemap segments. The page cache and the autocomplete
+indexes are reset at the end.
+
+Records (JSON keys or CSV columns) by kind:
+
+``post``
+    ``title``, ``content``, ``author`` (a username), optional
+    ``published_date`` (ISO 8601), ``tags`` (a list, or a comma separated
+    string as in the post form) and, in JSON only, ``comments``: a list of
+    comment records without ``post``.
+``comment``
+    ``post`` (the id of an existing post), ``author``, ``content`` and
+    optional ``created_at``.
+``tag``
+    ``name`` and optional ``slug``.
+
+A JSON record's kind is its ``type`` key (default ``post``). A CSV file
+holds records of one kind. Used by ``manage.py import_blog_data``.
+"""
+import csv
+import json
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from taggit.models import Tag, TaggedItem
+from taggit.utils import parse_tags
+
+from . import autocomplete, page_cache, search, sitemaps, tag_stats
+from .comment_stats import refresh_comment_stats
+from .models import Comment, Post
+from .synthetic import explicit_dates
+
+KINDS = ('post', 'comment', 'tag')
+# Invalid records reported with a message; the others are only counted.
+REPORTED_ERRORS = 20
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def read_jsonl(lines):
+    """Yield (line number, record) for each non-blank line of JSON."""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, InvalidRecord('invalid JSON: %s' % e)
+
+
+def read_csv(lines, kind='post'):
+    """Yield (line number, record) for each row of a CSV file with a header row."""
+    reader = csv.DictReader(lines)
+    for row in reader:
+        row['type'] = row.get('type') or kind
+        yield reader.line_num, row
+
+
+def _text(record, key, required=False, max_length=None):
+    value = record.get(key)
+    if value is None:
+        value = ''
+    if not isinstance(value, str):
+        raise InvalidRecord('%s must be a string' % key)
+    if required and not value.strip():
+        raise InvalidRecord('%s is required' % key)
+    if max_length and len(value) > max_length:
+        raise InvalidRecord('%s is longer than %d characters' % (key, max_length))
+    return value
+
+
+def _date(record, key):
+    value = record.get(key)
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value) if isinstance(value, str) else None
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise InvalidRecord('%s is not an ISO 8601 date and time: %r' % (key, value))
+    if settings.USE_TZ and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _tags(record):
+    value = record.get('tags')
+    if not value:
+        return []
+    if isinstance(value, str):
+        names = parse_tags(value)
+    elif isinstance(value, list) and all(isinstance(name, str) for name in value):
+        names = [name.strip() for name in value]
+    else:
+        raise InvalidRecord('tags must be a list of strings or a comma separated string')
+    max_length = Tag._meta.get_field('name').max_length
+    if any(len(name) > max_length for name in names):
+        raise InvalidRecord('tag names are limited to %d characters' % max_length)
+    return list(dict.fromkeys(name for name in names if name))
+
+
+class BlogImporter:
+    """
+    Imports ``(line number, record)`` pairs, as yielded by read_jsonl and
+    read_csv. Records with an unknown author are skipped like invalid ones,
+    unless ``create_authors`` is set: then the authors are created, with
+    unusable passwords.
+    """
+
+    def __init__(self, batch_size=1000, create_authors=False, log=None):
+        self.batch_size = batch_size
+        self.create_authors = create_authors
+        self.log = log or (lambda message: None)
+        self.counts = Counter()
+        self.errors = []
+
+    def run(self, records):
+        """Import everything; returns a dict of counts and the throughput."""
+        started = time.perf_counter()
+        batch = []
+        for number, record in records:
+            self.counts['records'] += 1
+            try:
+                batch.append((number, *self.clean(record)))
+            except InvalidRecord as e:
+                self.skip(number, e)
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = []
+                self.log('Imported %d records (%.0f rows/s).' % (
+                    self.counts['records'], self.counts['records'] / (time.perf_counter() - started),
+                ))
+        if batch:
+            self.write(batch)
+        if self.counts['posts'] or self.counts['comments'] or self.counts['tags']:
+            page_cache.content_changed()
+            autocomplete.reset()
+        elapsed = time.perf_counter() - started
+        result = {key: self.counts[key] for key in (
+            'records', 'posts', 'comments', 'tags', 'tagged', 'authors', 'skipped',
+        )}
+        result['seconds'] = elapsed
+        result['rows_per_second'] = self.counts['records'] / elapsed if elapsed else 0
+        return result
+
+    def skip(self, number, error):
+        self.counts['skipped'] += 1
+        if len(self.errors) < REPORTED_ERRORS:
+            self.errors.append('Line %d: %s' % (number, error))
+
+    # Validation, one record at a time.
+
+    def clean(self, record):
+        """Return the (kind, fields) of a valid record; raises InvalidRecord."""
+        if isinstance(record, InvalidRecord):
+            raise record
+        if not isinstance(record, dict):
+            raise InvalidRecord('expected an object')
+        kind = record.get('type') or 'post'
+        if kind == 'post':
+            return kind, self.clean_post(record)
+        if kind == 'comment':
+            return kind, self.clean_comment(record)
+        if kind == 'tag':
+            return kind, self.clean_tag(record)
+        raise InvalidRecord('unknown type %r, expected one of %s' % (kind, ', '.join(KINDS)))
+
+    def clean_post(self, record):
+        comments = record.get('comments') or []
+        if not isinstance(comments, list):
+            raise InvalidRecord('comments must be a list')
+        return {
+            'title': _text(record, 'title', required=True,
+                           max_length=Post._meta.get_field('title').max_length),
+            'content': _text(record, 'content'),
+            'author': _text(record, 'author', required=True).strip(),
+            'published_date': _date(record, 'published_date'),
+            'tags': _tags(record),
+            'comments': [self.clean_comment(comment, nested=True) for comment in comments],
+        }
+
+    def clean_comment(self, record, nested=False):
+        if not isinstance(record, dict):
+            raise InvalidRecord('a comment must be an object')
+        fields = {
+            'author': _text(record, 'author', required=True).strip(),
+            'content': _text(record, 'content', required=True),
+            'created_at': _date(record, 'created_at'),
+        }
+        if not nested:
+            try:
+                fields['post'] = int(record.get('post'))
+            except (TypeError, ValueError):
+                raise InvalidRecord('post must be the id of a post')
+        return fields
+
+    def clean_tag(self, record):
+        return {
+            'name': _text(record, 'name', required=True,
+                          max_length=Tag._meta.get_field('name').max_length).strip(),
+            'slug': _text(record, 'slug', max_length=Tag._meta.get_field('slug').max_length).strip(),
+        }
+
+    # Writing, one batch at a time.
+
+    def write(self, batch):
+        posts = [(number, fields) for number, kind, fields in batch if kind == 'post']
+        comments = [(number, fields) for number, kind, fields in batch if kind == 'comment']
+        tags = [fields for _, kind, fields in batch if kind == 'tag']
+        usernames = {fields['author'] for _, fields in posts + comments}
+        usernames.update(comment['author'] for _, fields in posts for comment in fields['comments'])
+        tag_names = {fields['name'] for fields in tags}
+        tag_names.update(name for _, fields in posts for name in fields['tags'])
+
+        with transaction.atomic():
+            authors = self.resolve_authors(usernames)
+            tag_ids = self.resolve_tags(tag_names, {fields['name']: fields['slug'] for fields in tags})
+            commented = self.write_posts(posts, authors, tag_ids)
+            commented |= self.write_comments(comments, authors)
+            if commented:
+                refresh_comment_stats(commented)
+                sitemaps.mark_dirty('posts', commented)
+
+    def resolve_authors(self, usernames):
+        """Map the usernames to user ids, creating the missing users if allowed."""
+        found = dict(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+        missing = usernames - found.keys()
+        if missing and self.create_authors:
+            # One unusable hash for everyone, as in blog/synthetic.py.
+            password = make_password(None)
+            User.objects.bulk_create(
+                [User(username=name, password=password) for name in missing], ignore_conflicts=True,
+            )
+            created = dict(User.objects.filter(username__in=missing).values_list('username', 'pk'))
+            self.counts['authors'] += len(created)
+            found.update(created)
+        return found
+
+    def resolve_tags(self, names, slugs):
+        """
+        Map the tag names to tag ids, creating the missing tags. A new name
+        whose slug is already taken (say "Django" next to "django") maps to
+        the tag that has the slug, as taggit's slugs are unique.
+        """
+        if not names:
+            return {}
+        found = dict(Tag.objects.filter(name__in=names).values_list('name', 'pk'))
+        missing = {}
+        for name in names - found.keys():
+            slug = slugs.get(name) or Tag().slugify(name)
+            if slug:
+                missing[name] = slug
+        if not missing:
+            return found
+        Tag.objects.bulk_create(
+            [Tag(name=name, slug=slug) for name, slug in missing.items()], ignore_conflicts=True,
+        )
+        created = dict(Tag.objects.filter(name__in=missing).values_list('name', 'pk'))
+        self.counts['tags'] += len(created)
+        found.update(created)
+        by_slug = {missing[name]: name for name in missing.keys() - created.keys()}
+        if by_slug:
+            for slug, pk in Tag.objects.filter(slug__in=by_slug).values_list('slug', 'pk'):
+                found[by_slug[slug]] = pk
+        return found
+
+    def write_posts(self, posts, authors, tag_ids):
+        """Insert the posts, their tags and comments; returns the ids of the commented posts."""
+        rows = []
+        for number, fields in posts:
+            if fields['author'] in authors:
+                rows.append((number, fields))
+            else:
+                self.skip(number, 'unknown author %r' % fields['author'])
+        if not rows:
+            return set()
+
+        now = timezone.now()
+        with explicit_dates(Post._meta.get_field('published_date')):
+            created = Post.objects.bulk_create([
+                Post(
+                    title=fields['title'], content=fields['content'],
+                    author_id=authors[fields['author']],
+                    published_date=fields['published_date'] or now,
+                )
+                for _, fields in rows
+            ])
+        self.counts['posts'] += len(created)
+
+        content_type = ContentType.objects.get_for_model(Post)
+        items = []
+        usage = Counter()
+        documents = []
+        comments = []
+        for post, (number, fields) in zip(created, rows):
+            names = [name for name in fields['tags'] if name in tag_ids]
+            post_tag_ids = {tag_ids[name] for name in names}
+            items.extend(
+                TaggedItem(content_type=content_type, object_id=post.pk, tag_id=tag_id)
+                for tag_id in post_tag_ids
+            )
+            usage.update(post_tag_ids)
+            documents.append((post.pk, post.title, post.content, ' '.join(names)))
+            for comment in fields['comments']:
+                comments.append((number, dict(comment, post=post.pk)))
+        TaggedItem.objects.bulk_create(items, batch_size=self.batch_size)
+        self.counts['tagged'] += len(items)
+        tag_stats.record_tag_usage(usage)
+        search.index_new_posts(documents)
+        sitemaps.mark_dirty('posts', [post.pk for post in created])
+        sitemaps.mark_dirty('tags', usage)
+        return self.insert_comments(comments, authors)
+
+    def write_comments(self, comments, authors):
+        """Insert comments on existing posts; returns the ids of the commented posts."""
+        post_ids = {fields['post'] for _, fields in comments}
+        existing = set(Post.objects.filter(pk__in=post_ids).values_list('pk', flat=True))
+        rows = []
+        for number, fields in comments:
+            if fields['post'] in existing:
+                rows.append((number, fields))
+            else:
+                self.skip(number, 'unknown post %r' % fields['post'])
+        return self.insert_comments(rows, authors)
+
+    def insert_comments(self, comments, authors):
+        rows = []
+        for number, fields in comments:
+            if fields['author'] in authors:
+                rows.append(fields)
+            else:
+                self.skip(number, 'unknown comment author %r' % fields['author'])
+        if not rows:
+            return set()
+        now = timezone.now()
+        dates = (Comment._meta.get_field('created_at'), Comment._meta.get_field('updated_at'))
+        with explicit_dates(*dates):
+            Comment.objects.bulk_create([
+                Comment(
+                    post_id=fields['post'], author_id=authors[fields['author']],
+                    content=fields['content'],
+                    created_at=fields['created_at'] or now, updated_at=fields['created_at'] or now,
+                )
+                for fields in rows
+            ], batch_size=self.batch_size)
+        self.counts['comments'] += len(rows)
+        return {fields['post'] for fields in rows}
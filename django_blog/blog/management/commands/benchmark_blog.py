@@ -0,0 +1,51 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from blog.benchmark import BlogBenchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test every blog URL with concurrent in-process clients and report '
+        'throughput, p50/p95/p99 latency and queries per request as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=200, help='Timed requests per URL (default: 200).',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=4, help='Number of client threads (default: 4).',
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=10, help='Untimed requests per URL first (default: 10).',
+        )
+        parser.add_argument(
+            '--url', action='append', dest='names', metavar='NAME',
+            help='Only benchmark this URL name; may be repeated.',
+        )
+        parser.add_argument('--user', help='Log the clients in as this username.')
+        parser.add_argument(
+            '--host', default='localhost', help='Host header sent; must be in ALLOWED_HOSTS (default: localhost).',
+        )
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for the URL arguments.')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        report = BlogBenchmark(
+            requests=options['requests'],
+            concurrency=options['concurrency'],
+            warmup=options['warmup'],
+            names=options['names'],
+            username=options['user'],
+            host=options['host'],
+            seed=options['seed'],
+        ).run()
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS('Wrote %s.' % options['output']))
+        else:
+            self.stdout.write(output)
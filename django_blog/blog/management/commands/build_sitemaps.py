@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from blog import sitemaps
+
+
+class Command(BaseCommand):
+    help = (
+        'Rewrite the sitemap segments touched by new or changed posts and tags, '
+        'and the sitemap index, in BLOG_SITEMAP_DIR.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rewrite every segment.')
+
+    def handle(self, *args, **options):
+        written = sitemaps.build_sitemaps(force=options['force'])
+        if options['verbosity'] > 1:
+            for name in written:
+                self.stdout.write(name)
+        self.stdout.write(self.style.SUCCESS(
+            'Wrote %d sitemap files to %s.' % (len(written), sitemaps.sitemap_dir())
+        ))
@@ -0,0 +1,49 @@
+import sys
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.exporter import CHUNK_SIZE, FORMATS, export_stream
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream every post with its author, tags and comment counts as NDJSON or CSV, '
+        'to a file or standard output.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format', choices=sorted(FORMATS), default='ndjson', help='Output format (default: ndjson).',
+        )
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip.')
+        parser.add_argument('--output', '-o', help='File to write (default: standard output).')
+        parser.add_argument(
+            '--chunk-size', type=int, default=CHUNK_SIZE,
+            help='Posts read per query chunk and tag lookup (default: %d).' % CHUNK_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1.')
+        stream = export_stream(options['format'], options['gzip'], chunk_size=options['chunk_size'])
+        path = options['output']
+        if path:
+            if options['gzip']:
+                opener = partial(open, path, 'wb')
+            else:
+                opener = partial(open, path, 'w', newline='', encoding='utf-8')
+            try:
+                with opener() as f:
+                    for piece in stream:
+                        f.write(piece)
+            except OSError as e:
+                raise CommandError('Cannot write %s: %s' % (path, e))
+            self.stderr.write('Exported posts to %s.' % path)
+        elif options['gzip']:
+            for piece in stream:
+                sys.stdout.buffer.write(piece)
+            sys.stdout.buffer.flush()
+        else:
+            for piece in stream:
+                self.stdout.write(piece, ending='')
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+
+from blog.synthetic import BlogDataGenerator
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with synthetic users, tags, posts and comments for '
+        'benchmarks. Authors, commented posts and tags follow a Zipf distribution.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of users (default: 1000).')
+        parser.add_argument('--posts', type=int, default=100000, help='Number of posts (default: 100000).')
+        parser.add_argument(
+            '--comments', type=int, default=1000000, help='Number of comments (default: 1000000).',
+        )
+        parser.add_argument('--tags', type=int, default=5000, help='Number of tags (default: 5000).')
+        parser.add_argument(
+            '--tags-per-post', type=int, default=3, help='Tags drawn for each post (default: 3).',
+        )
+        parser.add_argument(
+            '--zipf', type=float, default=1.1,
+            help='Zipf exponent; 0 spreads everything evenly (default: 1.1).',
+        )
+        parser.add_argument(
+            '--days', type=int, default=365, help='Spread post dates over this many days (default: 365).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000, help='Rows per bulk insert (default: 5000).',
+        )
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for repeatable data.')
+        parser.add_argument(
+            '--prefix', default='bench', help='Prefix of the generated user and tag names (default: bench).',
+        )
+
+    def handle(self, *args, **options):
+        generator = BlogDataGenerator(
+            users=options['users'],
+            posts=options['posts'],
+            comments=options['comments'],
+            tags=options['tags'],
+            tags_per_post=options['tags_per_post'],
+            exponent=options['zipf'],
+            days=options['days'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+            prefix=options['prefix'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        counts = generator.run()
+        self.stdout.write(self.style.SUCCESS(
+            'Generated %(users)d users, %(tags)d tags, %(posts)d posts and %(comments)d comments.' % counts
+        ))
@@ -0,0 +1,58 @@
+import sys
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.importer import KINDS, BlogImporter, read_csv, read_jsonl
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream posts, comments and tags from a JSON lines or CSV file into the blog, '
+        'with batched bulk inserts. See blog/importer.py for the record format.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import; '-' reads standard input.")
+        parser.add_argument(
+            '--format', choices=['jsonl', 'csv'],
+            help='Input format (default: csv for .csv files, jsonl otherwise).',
+        )
+        parser.add_argument(
+            '--type', choices=KINDS, default='post',
+            help='Kind of record in a CSV file without a type column (default: post).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000, help='Records per transaction (default: 1000).',
+        )
+        parser.add_argument(
+            '--create-authors', action='store_true',
+            help='Create unknown authors (with unusable passwords) instead of skipping their records.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        importer = BlogImporter(
+            batch_size=options['batch_size'],
+            create_authors=options['create_authors'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        try:
+            source = nullcontext(sys.stdin) if path == '-' else open(path, newline='', encoding='utf-8')
+        except OSError as e:
+            raise CommandError('Cannot read %s: %s' % (path, e))
+        with source as lines:
+            records = read_csv(lines, options['type']) if fmt == 'csv' else read_jsonl(lines)
+            result = importer.run(records)
+
+        for error in importer.errors:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            'Imported %(posts)d posts, %(comments)d comments and %(tags)d new tags from '
+            '%(records)d records in %(seconds).2fs (%(rows_per_second).0f rows/s).' % result
+        ))
+        if result['skipped']:
+            self.stdout.write(self.style.WARNING('Skipped %d invalid records.' % result['skipped']))
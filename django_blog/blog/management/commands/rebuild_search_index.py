@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for blog posts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Number of posts read and inserted per batch (default: 1000).',
+        )
+
+    def handle(self, *args, **options):
+        if not search.search_available():
+            raise CommandError(
+                'The %s table does not exist. Run "manage.py migrate blog" on an '
+                'SQLite database built with FTS5.' % search.FTS_TABLE
+            )
+        indexed = search.rebuild_index(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS('Indexed %d posts.' % indexed))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from blog.tag_stats import rebuild_tag_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-tag post counts used by the tag cloud.'
+
+    def handle(self, *args, **options):
+        count = rebuild_tag_stats()
+        self.stdout.write(self.style.SUCCESS('Rebuilt statistics for %d tags.' % count))
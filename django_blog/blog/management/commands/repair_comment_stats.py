@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from blog.comment_stats import repair_comment_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute Post.comment_count and Post.last_comment_at from the Comment table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=10000,
+            help='Number of post ids checked per batch (default: 10000).',
+        )
+
+    def handle(self, *args, **options):
+        fixed = repair_comment_stats(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS('Fixed comment statistics on %d posts.' % fixed))
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+FTS_TABLE = 'blog_post_fts'
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        # Other backends use the icontains fallback in blog.search.
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5("
+            "title, content, tags, tokenize = 'unicode61 remove_diacritics 2')" % FTS_TABLE
+        )
+        # Backfill existing posts together with their tag names.
+        cursor.execute(
+            "INSERT INTO %s (rowid, title, content, tags) "
+            "SELECT p.id, p.title, p.content, COALESCE(("
+            "  SELECT group_concat(t.name, ' ') FROM taggit_tag t"
+            "  INNER JOIN taggit_taggeditem ti ON ti.tag_id = t.id"
+            "  INNER JOIN django_content_type ct ON ct.id = ti.content_type_id"
+            "  WHERE ti.object_id = p.id AND ct.app_label = 'blog' AND ct.model = 'post'"
+            "), '') FROM blog_post p" % FTS_TABLE
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS %s' % FTS_TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_post_tags'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_tag_stats(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+    Post = apps.get_model('blog', 'Post')
+    TagStats = apps.get_model('blog', 'TagStats')
+
+    content_type = ContentType.objects.filter(app_label='blog', model='post').first()
+    if content_type is None:
+        return
+    items = TaggedItem.objects.filter(content_type=content_type)
+    tagged_posts = {}
+    for row in items.values('tag_id', 'object_id'):
+        tagged_posts.setdefault(row['tag_id'], set()).add(row['object_id'])
+    published = dict(Post.objects.values_list('pk', 'published_date'))
+    TagStats.objects.bulk_create([
+        TagStats(
+            tag_id=tag_id,
+            post_count=len(post_ids),
+            last_used=max((published[pk] for pk in post_ids if pk in published), default=None),
+        )
+        for tag_id, post_ids in tagged_posts.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_post_published_idx'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagStats',
+            fields=[
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='blog_stats', serialize=False, to='taggit.tag')),
+                ('post_count', models.PositiveIntegerField(default=0)),
+                ('last_used', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'tag stats',
+                'indexes': [models.Index(fields=['-post_count', '-last_used'], name='blog_tagstats_popular_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_tag_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_post_comment_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SitemapSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('section', models.CharField(max_length=20)),
+                ('number', models.PositiveIntegerField()),
+                ('dirty', models.BooleanField(default=True)),
+                ('url_count', models.PositiveIntegerField(default=0)),
+                ('lastmod', models.DateTimeField(blank=True, null=True)),
+                ('built_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('section', 'number'), name='blog_sitemap_segment_unique')],
+            },
+        ),
+    ]
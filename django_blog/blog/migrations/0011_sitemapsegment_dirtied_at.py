@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_sitemapsegment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sitemapsegment',
+            name='dirtied_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -3,6 +3,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.urls import reverse 
 from taggit.managers import TaggableManager
+from taggit.models import Tag
 
 class Post(models.Model):
     title = models.CharField(max_length=200)
@@ -10,6 +11,24 @@ class Post(models.Model):
     published_date = models.DateTimeField(auto_now_add=True)
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     tags = TaggableManager()
+    # Bumped whenever the post, its tags or its author change; part of the
+    # cache key of the rendered post card (see blog/cards.py).
+    card_version = models.PositiveIntegerField(default=0, editable=False)
+    # Denormalized from Comment and kept current by blog/comment_stats.py;
+    # saves leave them as they are in the database unless they save nothing
+    # else (blog/signals.py).
+    # Repair with ``manage.py repair_comment_stats``.
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    last_comment_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Serves the newest-first lists and their keyset pagination.
+            models.Index(fields=['-published_date', '-id'], name='blog_post_published_idx'),
+            # "Most discussed" ordering without aggregating comments.
+            models.Index(fields=['-comment_count', '-published_date', '-id'], name='blog_post_discussed_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -24,5 +43,57 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # A post's thread, newest first, paged by (created_at, id) cursors.
+            models.Index(fields=['post', '-created_at', '-id'], name='blog_comment_thread_idx'),
+        ]
+
     def __str__(self):
         return f'Comment by {self.author} on {self.post}'
+
+
+class TagStats(models.Model):
+    """
+    Materialized per-tag statistics, maintained incrementally by
+    blog/signals.py whenever posts are tagged, untagged or deleted.
+    Rebuild from scratch with ``manage.py rebuild_tag_stats``.
+    """
+    tag = models.OneToOneField(Tag, on_delete=models.CASCADE, primary_key=True, related_name='blog_stats')
+    post_count = models.PositiveIntegerField(default=0)
+    last_used = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'tag stats'
+        indexes = [
+            # The tag cloud reads "most posts first" straight off this index.
+            models.Index(fields=['-post_count', '-last_used'], name='blog_tagstats_popular_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.tag_id}: {self.post_count} posts'
+
+
+class SitemapSegment(models.Model):
+    """
+    One file of the segmented sitemap built by blog/sitemaps.py. Saving a
+    post or tag marks the segment holding it dirty; ``manage.py
+    build_sitemaps`` rewrites the dirty segments only.
+    """
+    section = models.CharField(max_length=20)
+    number = models.PositiveIntegerField()
+    dirty = models.BooleanField(default=True)
+    # When it was last marked dirty: a build only clears ``dirty`` if this
+    # has not moved while it wrote the file.
+    dirtied_at = models.DateTimeField(null=True, blank=True)
+    url_count = models.PositiveIntegerField(default=0)
+    lastmod = models.DateTimeField(null=True, blank=True)
+    built_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['section', 'number'], name='blog_sitemap_segment_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.section}-{self.number}'
@@ -0,0 +1,198 @@
+# blog/page_cache.py
+"""
+Whole-page cache for logged-out readers.
+
+Anonymous visitors all see the same HTML for a given URL, so the list, tag
+and detail pages are stored in the cache the first time they are rendered
+and replayed afterwards without touching the ORM or the templates.
+
+Keys contain the path (so the tag slug and post id) and the normalized query
+string, plus a site-wide content version. Any write to posts, comments or
+tags calls ``content_changed()`` (see blog/signals.py), which moves the
+version on and so retires every cached page at once; the old entries just
+expire. The same version timestamp is the pages' Last-Modified, and the ETag
+is a hash of the body, so repeat visitors get a 304.
+
+The version only retires the pages and feeds of every worker when they
+share the default cache. With the per-process LocMemCache, the workers that
+did not handle a write keep serving their copies until
+BLOG_PAGE_CACHE_TIMEOUT (BLOG_FEED_CACHE_TIMEOUT for feeds) runs out, so
+``manage.py check --deploy`` warns about it (blog.W001).
+
+``shared_page_cache`` does the same for views whose response is the same
+for every user, such as the feeds in blog/feeds.py: they are cached for
+logged-in users too, and a conditional request is answered from the cache
+without a database query.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag, urlencode
+from perftools.caches import shared_cache_check
+
+CONTENT_STATE_KEY = 'blog:content-state'
+
+# Deploy check, registered in BlogConfig.ready().
+check_shared_cache = shared_cache_check('The page and feed cache', 'blog.W001', 'blog/page_cache.py')
+
+
+def page_cache_enabled():
+    return getattr(settings, 'BLOG_PAGE_CACHE', True)
+
+
+def page_cache_timeout():
+    return getattr(settings, 'BLOG_PAGE_CACHE_TIMEOUT', 60 * 5)
+
+
+def feed_cache_timeout():
+    # content_changed() only retires the entries of every worker with a
+    # shared cache, so this bounds how stale a feed can get without one.
+    return getattr(settings, 'BLOG_FEED_CACHE_TIMEOUT', 60 * 5)
+
+
+def content_changed():
+    """Retire every cached page; call after any write that readers can see."""
+    cache.set(CONTENT_STATE_KEY, time.time_ns(), None)
+
+
+def content_version():
+    """Return the current content version (a nanosecond timestamp)."""
+    version = cache.get(CONTENT_STATE_KEY)
+    if version is None:
+        # Cache was flushed or never primed: start a new version now.
+        version = time.time_ns()
+        if not cache.add(CONTENT_STATE_KEY, version, None):
+            version = cache.get(CONTENT_STATE_KEY, version)
+    return version
+
+
+async def acontent_version():
+    """content_version() for async views."""
+    version = await cache.aget(CONTENT_STATE_KEY)
+    if version is None:
+        version = time.time_ns()
+        if not await cache.aadd(CONTENT_STATE_KEY, version, None):
+            version = await cache.aget(CONTENT_STATE_KEY, version)
+    return version
+
+
+def page_cache_key(request, version):
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    digest = hashlib.md5(('%s?%s' % (request.path, query)).encode(), usedforsecurity=False)
+    return 'blog:page:%d:%s' % (version, digest.hexdigest())
+
+
+def _page_entry(response):
+    """Return the cache entry for a rendered response, or None if it must not be cached."""
+    if hasattr(response, 'render') and callable(response.render):
+        response.render()
+    if response.status_code != 200 or response.streaming:
+        return None
+    return {
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        'etag': quote_etag(hashlib.md5(response.content, usedforsecurity=False).hexdigest()),
+    }
+
+
+def _cached_response(request, entry, version, response=None, per_user=True):
+    """Add the validators to ``response`` (or a replay of ``entry``) and answer conditional requests."""
+    if response is None:
+        response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    last_modified = version // 10 ** 9
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'max-age=0, must-revalidate'
+    if per_user:
+        patch_vary_headers(response, ('Cookie',))
+    return get_conditional_response(
+        request, etag=entry['etag'], last_modified=last_modified, response=response,
+    )
+
+
+class AnonymousPageCacheMixin:
+    """
+    View mixin serving GET/HEAD requests of anonymous users from the page
+    cache, with ETag and Last-Modified validators.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if (
+            not page_cache_enabled()
+            or request.method not in ('GET', 'HEAD')
+            or request.user.is_authenticated
+        ):
+            return super().dispatch(request, *args, **kwargs)
+
+        return serve_cached(
+            request, lambda: super(AnonymousPageCacheMixin, self).dispatch(request, *args, **kwargs),
+        )
+
+
+def serve_cached(request, render, timeout=None, per_user=True):
+    """
+    Answer ``request`` from the page cache, calling ``render()`` for the
+    response on a miss. ``per_user`` adds ``Vary: Cookie`` for pages that
+    only anonymous users share.
+    """
+    version = content_version()
+    key = page_cache_key(request, version)
+
+    entry = cache.get(key)
+    if entry is not None:
+        return _cached_response(request, entry, version, per_user=per_user)
+    response = render()
+    entry = _page_entry(response)
+    if entry is None:
+        return response
+    cache.set(key, entry, page_cache_timeout() if timeout is None else timeout)
+    return _cached_response(request, entry, version, response, per_user=per_user)
+
+
+def shared_page_cache(view):
+    """Cache a view whose GET/HEAD response is the same for everyone, logged in or not."""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not page_cache_enabled() or request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        return serve_cached(
+            request, lambda: view(request, *args, **kwargs),
+            timeout=feed_cache_timeout(), per_user=False,
+        )
+
+    return wrapper
+
+
+def async_anonymous_page_cache(view):
+    """AnonymousPageCacheMixin for async function views."""
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        if (
+            not page_cache_enabled()
+            or request.method not in ('GET', 'HEAD')
+            or user.is_authenticated
+        ):
+            return await view(request, *args, **kwargs)
+
+        version = await acontent_version()
+        key = page_cache_key(request, version)
+
+        entry = await cache.aget(key)
+        if entry is not None:
+            return _cached_response(request, entry, version)
+        response = await view(request, *args, **kwargs)
+        entry = _page_entry(response)
+        if entry is None:
+            return response
+        await cache.aset(key, entry, page_cache_timeout())
+        return _cached_response(request, entry, version, response)
+
+    return wrapper
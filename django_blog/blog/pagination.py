@@ -0,0 +1,250 @@
+# blog/pagination.py
+"""
+Keyset (cursor) pagination for the post lists and comment threads.
+
+Django's Paginator pages with OFFSET and runs a COUNT(*) on every request, so
+deep pages get slower the further you go. Cursor pagination instead remembers
+the (published_date, id) of the last post shown and asks for the posts that
+come after it, which costs the same on page 1 and on page 10,000 and needs no
+COUNT at all.
+
+Cursor mode is opt-in: set ``BLOG_CURSOR_PAGINATION = True`` in settings (or
+``cursor_pagination = True`` on a view). Old ``?page=N`` links keep working
+for the first ``max_offset_page`` pages.
+"""
+import base64
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q, QuerySet
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(obj, reverse=False, date_field='published_date'):
+    """Build an opaque token pointing just past ``obj``."""
+    payload = [getattr(obj, date_field).isoformat(), obj.pk, int(reverse)]
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return (date, pk, reverse) for a token from encode_cursor()."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        date, pk, reverse = json.loads(raw)
+        date = parse_datetime(date)
+        pk = int(pk)
+    except (TypeError, ValueError):
+        raise InvalidCursor('Invalid cursor %r' % token)
+    # Tokens come from the query string, so anything encode_cursor() would
+    # not produce is refused, down to primary keys the database cannot hold.
+    if date is None or not 0 < pk < 2 ** 63 or reverse not in (0, 1):
+        raise InvalidCursor('Invalid cursor %r' % token)
+    return date, pk, bool(reverse)
+
+
+class CursorPage:
+    """
+    One page of a cursor paginated list.
+
+    Quacks enough like django.core.paginator.Page for the templates:
+    ``has_next``, ``has_previous`` and ``has_other_pages`` work the same, and
+    the links are built from ``next_cursor`` / ``previous_cursor`` instead of
+    page numbers.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, number=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.number = number
+
+    def __repr__(self):
+        return '<CursorPage of %d items>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Pages a queryset newest first on (``date_field``, id); posts by default,
+    comments with ``date_field='created_at'``.
+    """
+
+    def __init__(self, queryset, per_page, date_field='published_date'):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.date_field = date_field
+
+    def page(self, cursor=None):
+        """Return the page after (or, for a reverse cursor, before) ``cursor``."""
+        rows, kind, number = self._page_query(cursor)
+        return self._build_page(list(rows), kind, number)
+
+    def offset_page(self, number):
+        """
+        Return page ``number`` using OFFSET, without a COUNT query.
+
+        Only used for page 1 and for old ``?page=`` links, so the offset stays
+        small.
+        """
+        return self._build_page(list(self._offset_query(number)), 'offset', number)
+
+    async def apage(self, cursor=None):
+        """page() for async views."""
+        rows, kind, number = self._page_query(cursor)
+        return self._build_page([obj async for obj in rows], kind, number)
+
+    async def aoffset_page(self, number):
+        """offset_page() for async views."""
+        return self._build_page([obj async for obj in self._offset_query(number)], 'offset', number)
+
+    def _page_query(self, cursor):
+        """Return (queryset, kind, number) for the page after ``cursor``."""
+        if not cursor:
+            return self._offset_query(1), 'offset', 1
+        date, pk, reverse = decode_cursor(cursor)
+        field = self.date_field
+
+        if reverse:
+            # Walk back towards newer rows; _build_page() flips them into
+            # display order.
+            rows = (
+                self.queryset
+                .filter(**{field + '__gte': date})
+                .filter(Q(**{field + '__gt': date}) | Q(pk__gt=pk))
+                .order_by(field, 'pk')[:self.per_page + 1]
+            )
+            return rows, 'reverse', None
+        rows = (
+            self.queryset
+            .filter(**{field + '__lte': date})
+            .filter(Q(**{field + '__lt': date}) | Q(pk__lt=pk))
+            .order_by('-' + field, '-pk')[:self.per_page + 1]
+        )
+        return rows, 'forward', None
+
+    def _offset_query(self, number):
+        bottom = (number - 1) * self.per_page
+        return self.queryset.order_by('-' + self.date_field, '-pk')[bottom:bottom + self.per_page + 1]
+
+    def _build_page(self, rows, kind, number=None):
+        # One extra row was fetched to tell whether there is a further page.
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if kind == 'reverse':
+            rows = rows[::-1]
+            has_next, has_previous = True, more
+        elif kind == 'forward':
+            has_next, has_previous = more, True
+        else:
+            if not rows and number > 1:
+                raise InvalidCursor('Page %d is empty' % number)
+            has_next, has_previous = more, number > 1
+
+        field = self.date_field
+        next_cursor = encode_cursor(rows[-1], date_field=field) if rows and has_next else None
+        previous_cursor = (
+            encode_cursor(rows[0], reverse=True, date_field=field) if rows and has_previous else None
+        )
+        return CursorPage(rows, next_cursor, previous_cursor, number=number if kind == 'offset' else None)
+
+
+class AsyncPaginator(Paginator):
+    """
+    Django's Paginator with an ``apage()`` coroutine for async views.
+
+    The COUNT and the page rows are fetched with the async ORM. Object lists
+    that are not querysets (SearchResults) are run in a worker thread.
+    """
+
+    async def apage(self, number):
+        if 'count' not in self.__dict__:
+            if isinstance(self.object_list, QuerySet):
+                self.count = await self.object_list.acount()
+            else:
+                self.count = await sync_to_async(self.object_list.count)()
+        if number == 'last':
+            number = self.num_pages
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = min(bottom + self.per_page, self.count)
+        if isinstance(self.object_list, QuerySet):
+            rows = [obj async for obj in self.object_list[bottom:top]]
+        else:
+            rows = await sync_to_async(lambda: list(self.object_list[bottom:top]))()
+        return self._get_page(rows, number, self)
+
+
+class CursorPaginationMixin:
+    """
+    ListView mixin that swaps OFFSET pagination for CursorPaginator.
+
+    Only applies to querysets; ranked search results keep the regular
+    paginator.
+    """
+    cursor_pagination = None  # None means "use settings.BLOG_CURSOR_PAGINATION"
+    cursor_kwarg = 'cursor'
+    max_offset_page = 20
+
+    def use_cursor_pagination(self):
+        if self.cursor_pagination is None:
+            return getattr(settings, 'BLOG_CURSOR_PAGINATION', False)
+        return self.cursor_pagination
+
+    def get_cursor_position(self):
+        """
+        Return (cursor, page_number) for the requested page, exactly one of
+        them set. Raises Http404 for unusable ``?page=`` values.
+        """
+        cursor = self.request.GET.get(self.cursor_kwarg)
+        if cursor:
+            return cursor, None
+        page_number = self.kwargs.get(self.page_kwarg) or self.request.GET.get(self.page_kwarg) or 1
+        try:
+            page_number = int(page_number)
+        except (TypeError, ValueError):
+            raise Http404('Page is not an integer.')
+        if not 1 <= page_number <= self.max_offset_page:
+            raise Http404('Page %s is not available, follow the "older" links instead.' % page_number)
+        return None, page_number
+
+    def paginate_queryset(self, queryset, page_size):
+        if not (self.use_cursor_pagination() and isinstance(queryset, QuerySet)):
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = CursorPaginator(queryset, page_size)
+        cursor, page_number = self.get_cursor_position()
+        try:
+            page = paginator.page(cursor) if cursor else paginator.offset_page(page_number)
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cursor_pagination'] = isinstance(context.get('page_obj'), CursorPage)
+        return context
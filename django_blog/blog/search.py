@@ -0,0 +1,233 @@
+# blog/search.py
+"""
+Full-text search for blog posts.
+
+Posts are indexed in an SQLite FTS5 virtual table (``blog_post_fts``) whose
+rowid is the Post primary key. The table holds the post title, content and a
+space separated list of tag names. It is kept in sync by the receivers in
+blog/signals.py and can be rebuilt with ``manage.py rebuild_search_index``.
+
+When the database is not SQLite (or was built without FTS5) search falls back
+to the old ``icontains`` filters so the site keeps working.
+"""
+import re
+
+from django.db import connection, connections, router, transaction
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+FTS_TABLE = 'blog_post_fts'
+
+# Column weights for bm25(): title matches count most, then tags, then body.
+TITLE_WEIGHT = 10.0
+CONTENT_WEIGHT = 1.0
+TAGS_WEIGHT = 5.0
+
+# Control characters never show up in user text, so they are safe markers for
+# snippet() output. They are swapped for <mark> tags *after* escaping.
+_HIGHLIGHT_START = '\x02'
+_HIGHLIGHT_END = '\x03'
+_SNIPPET_TOKENS = 24
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Database NAME -> whether the FTS table exists there. Looked up once per
+# process so a search does not pay for an introspection query every time.
+_available = {}
+
+
+def search_available():
+    """Return True if the FTS5 table exists on the default database."""
+    if connection.vendor != 'sqlite':
+        return False
+    name = connection.settings_dict['NAME']
+    if name not in _available:
+        _available[name] = FTS_TABLE in connection.introspection.table_names()
+    return _available[name]
+
+
+def build_match_expression(query):
+    """
+    Turn free text typed into the search box into a safe FTS5 query.
+
+    Every word becomes a quoted prefix term, so operators and stray quotes in
+    the input cannot produce a syntax error. Terms are ANDed together.
+    """
+    tokens = _TOKEN_RE.findall(query or '')
+    return ' '.join('"%s"*' % token for token in tokens)
+
+
+def highlight(snippet):
+    """Escape an FTS5 snippet and wrap the matched terms in <mark> tags."""
+    escaped = escape(snippet or '')
+    escaped = escaped.replace(_HIGHLIGHT_START, '<mark>').replace(_HIGHLIGHT_END, '</mark>')
+    return mark_safe(escaped)
+
+
+def post_document(post):
+    """
+    Return the (title, content, tags) tuple stored in the index for a post.
+
+    Uses ``post.tags.all()`` so prefetched tags are honoured.
+    """
+    tag_names = ' '.join(tag.name for tag in post.tags.all())
+    return post.title, post.content, tag_names
+
+
+def index_post(post):
+    """Insert or refresh the index row for a single post."""
+    if not search_available():
+        return
+    # names() always hits the database, so a stale prefetch cache on the
+    # instance cannot leak old tags into the index.
+    title, content, tags = post.title, post.content, ' '.join(post.tags.names())
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE rowid = %%s' % FTS_TABLE, [post.pk])
+        cursor.execute(
+            'INSERT INTO %s (rowid, title, content, tags) VALUES (%%s, %%s, %%s, %%s)' % FTS_TABLE,
+            [post.pk, title, content, tags],
+        )
+
+
+def index_new_posts(documents):
+    """
+    Add index rows for posts that are not indexed yet, such as bulk
+    created ones, from ``(pk, title, content, tags)`` tuples.
+    """
+    if not search_available():
+        return
+    with connection.cursor() as cursor:
+        _insert_rows(cursor, documents)
+
+
+def remove_post(post_id):
+    """Drop a post from the index."""
+    if not search_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE rowid = %%s' % FTS_TABLE, [post_id])
+
+
+def rebuild_index(chunk_size=1000):
+    """
+    Rebuild the whole index from the Post table.
+
+    Posts are read in chunks with their tags prefetched, so memory use does
+    not grow with the number of posts. Returns the number of posts indexed.
+    """
+    from .models import Post
+
+    indexed = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % FTS_TABLE)
+        posts = Post.objects.order_by('pk').prefetch_related('tags')
+        batch = []
+        for post in posts.iterator(chunk_size=chunk_size):
+            batch.append((post.pk, *post_document(post)))
+            if len(batch) >= chunk_size:
+                _insert_rows(cursor, batch)
+                indexed += len(batch)
+                batch = []
+        if batch:
+            _insert_rows(cursor, batch)
+            indexed += len(batch)
+        # Merge the b-tree segments left behind by the bulk insert.
+        cursor.execute("INSERT INTO %s (%s) VALUES ('optimize')" % (FTS_TABLE, FTS_TABLE))
+    return indexed
+
+
+def _insert_rows(cursor, rows):
+    cursor.executemany(
+        'INSERT INTO %s (rowid, title, content, tags) VALUES (%%s, %%s, %%s, %%s)' % FTS_TABLE,
+        rows,
+    )
+
+
+class SearchResults:
+    """
+    A lazily evaluated, relevance ranked list of posts matching a query.
+
+    It implements just enough of the sequence protocol (``count()``, ``len()``
+    and slicing) for Django's Paginator, so ListView can paginate it like a
+    queryset. Each slice runs one ranked query against the FTS table and one
+    ``pk__in`` query to load the matching posts. Returned posts carry a
+    ``search_rank`` plus highlighted ``title_snippet`` and ``content_snippet``.
+
+    ``queryset`` supplies the select_related/prefetch_related used to load a
+    page. ``restrict_to`` is an optional queryset limiting the candidates, for
+    example to the posts carrying a tag.
+    """
+
+    def __init__(self, query, queryset, restrict_to=None):
+        self.query = query
+        self.match = build_match_expression(query)
+        self.queryset = queryset
+        self.restrict_to = restrict_to
+        self._count = None
+
+    def _connection(self):
+        # The index is read where the router sends the posts' reads.
+        return connections[router.db_for_read(self.queryset.model)]
+
+    def _where(self):
+        sql = '%s MATCH %%s' % FTS_TABLE
+        params = [self.match]
+        if self.restrict_to is not None:
+            inner_sql, inner_params = self.restrict_to.order_by().values('pk').query.sql_with_params()
+            sql += ' AND rowid IN (%s)' % inner_sql
+            params.extend(inner_params)
+        return sql, params
+
+    def count(self):
+        if self._count is None:
+            if not self.match:
+                self._count = 0
+            else:
+                where, params = self._where()
+                with self._connection().cursor() as cursor:
+                    cursor.execute('SELECT COUNT(*) FROM %s WHERE %s' % (FTS_TABLE, where), params)
+                    self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        limit = -1 if key.stop is None else max(key.stop - start, 0)
+        if not self.match or limit == 0:
+            return []
+
+        where, params = self._where()
+        sql = (
+            'SELECT rowid, bm25({table}, %s, %s, %s) AS rank, '
+            'snippet({table}, 0, %s, %s, \'…\', %s), '
+            'snippet({table}, 1, %s, %s, \'…\', %s) '
+            'FROM {table} WHERE {where} ORDER BY rank LIMIT %s OFFSET %s'
+        ).format(table=FTS_TABLE, where=where)
+        head = [
+            TITLE_WEIGHT, CONTENT_WEIGHT, TAGS_WEIGHT,
+            _HIGHLIGHT_START, _HIGHLIGHT_END, _SNIPPET_TOKENS,
+            _HIGHLIGHT_START, _HIGHLIGHT_END, _SNIPPET_TOKENS,
+        ]
+        with self._connection().cursor() as cursor:
+            cursor.execute(sql, head + params + [limit, start])
+            rows = cursor.fetchall()
+
+        posts = self.queryset.order_by().in_bulk([row[0] for row in rows])
+        results = []
+        for pk, rank, title_snippet, content_snippet in rows:
+            post = posts.get(pk)
+            if post is None:
+                # Index row for a post that no longer exists; skip it.
+                continue
+            post.search_rank = rank
+            post.title_snippet = highlight(title_snippet)
+            post.content_snippet = highlight(content_snippet)
+            results.append(post)
+        return results
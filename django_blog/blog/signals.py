@@ -0,0 +1,199 @@
+# blog/signals.py
+"""
+Signal receivers that keep derived data (the search index, the tag and
+comment statistics, the post card versions and the page cache) in sync with
+posts, comments, tags and authors. Connected in BlogConfig.ready().
+"""
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.db.models.expressions import Combinable
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from taggit.models import Tag, TaggedItem
+
+from . import autocomplete, comment_stats, page_cache, search, sitemaps, tag_stats
+from .cards import bump_card_version
+from .models import Comment, Post
+
+
+# Post fields a card shows (its tags and comment count are handled by the
+# m2m_changed receiver and blog/comment_stats.py).
+CARD_FIELDS = frozenset({'title', 'content', 'author', 'author_id', 'published_date'})
+# Counters blog/comment_stats.py keeps in SQL.
+COMMENT_STAT_FIELDS = frozenset({'comment_count', 'last_comment_at'})
+
+
+@receiver(pre_save, sender=Post)
+def bump_saved_post_card(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Increment in SQL: the in-memory value may be stale if tags or the
+    # author changed since this instance was loaded.
+    if raw or instance._state.adding:
+        return
+    if update_fields is None:
+        instance.card_version = F('card_version') + 1
+    elif not CARD_FIELDS.isdisjoint(update_fields):
+        # card_version is not among the fields saved, so bump it on its own;
+        # index_saved_post() reads the new value back.
+        bump_card_version(pk=instance.pk)
+        instance.card_version = F('card_version')
+
+
+@receiver(pre_save, sender=Post)
+def keep_post_comment_stats(sender, instance, raw=False, update_fields=None, **kwargs):
+    # The counters move in SQL (blog/comment_stats.py); writing back the
+    # values loaded with the instance would undo comments added since.
+    # Saving only the counters is a deliberate write and goes through.
+    if raw or instance._state.adding:
+        return
+    if update_fields is None:
+        fields = COMMENT_STAT_FIELDS
+    elif update_fields <= COMMENT_STAT_FIELDS:
+        return
+    else:
+        fields = COMMENT_STAT_FIELDS & update_fields
+    for field in fields:
+        setattr(instance, field, F(field))
+
+
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, raw=False, **kwargs):
+    stale = [
+        field for field in ('card_version', 'comment_count', 'last_comment_at')
+        if isinstance(getattr(instance, field), Combinable)
+    ]
+    if stale:
+        instance.refresh_from_db(fields=stale)
+    if raw:
+        # loaddata: the rebuild_search_index command takes care of fixtures.
+        return
+    search.index_post(instance)
+    autocomplete.post_saved(instance)
+
+
+@receiver(pre_delete, sender=Post)
+def remember_post_tags(sender, instance, **kwargs):
+    # The TaggedItem rows go away with the post without an m2m_changed.
+    instance._deleted_tag_ids = list(instance.tags.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Post)
+def unindex_deleted_post(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
+    autocomplete.post_deleted(instance.pk)
+    tag_stats.record_tags_removed(getattr(instance, '_deleted_tag_ids', None))
+    autocomplete.tags_counted(getattr(instance, '_deleted_tag_ids', None))
+
+
+@receiver(m2m_changed, sender=TaggedItem)
+def reindex_retagged_post(sender, instance, action, pk_set=None, **kwargs):
+    # taggit sends m2m_changed from post.tags.add/remove/set/clear, with
+    # pk_set holding only the tags that were really added or removed.
+    if not isinstance(instance, Post):
+        return
+    if action == 'pre_clear':
+        instance._cleared_tag_ids = list(instance.tags.values_list('pk', flat=True))
+    elif action == 'post_add':
+        tag_stats.record_tags_added(pk_set)
+        autocomplete.tags_counted(pk_set)
+    elif action == 'post_remove':
+        tag_stats.record_tags_removed(pk_set)
+        autocomplete.tags_counted(pk_set)
+    elif action == 'post_clear':
+        tag_stats.record_tags_removed(getattr(instance, '_cleared_tag_ids', None))
+        autocomplete.tags_counted(getattr(instance, '_cleared_tag_ids', None))
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_card_version(pk=instance.pk)
+        search.index_post(instance)
+
+
+@receiver(post_save, sender=Tag)
+def reindex_renamed_tag(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    autocomplete.tag_saved(instance)
+    if created:
+        return
+    tag_stats.invalidate_tag_cloud()
+    bump_card_version(tags=instance)
+    for post in Post.objects.filter(tags=instance):
+        search.index_post(post)
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tagged_posts(sender, instance, **kwargs):
+    instance._tagged_post_ids = list(
+        Post.objects.filter(tags=instance).values_list('pk', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+def reindex_untagged_posts(sender, instance, **kwargs):
+    # The TagStats row is removed by the cascade; only the cache is stale.
+    tag_stats.invalidate_tag_cloud()
+    autocomplete.tag_deleted(instance.pk)
+    post_ids = getattr(instance, '_tagged_post_ids', [])
+    bump_card_version(pk__in=post_ids)
+    for post in Post.objects.filter(pk__in=post_ids):
+        search.index_post(post)
+
+
+@receiver(post_save, sender=User)
+def bump_author_cards(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    # Logging in only touches last_login, which no card shows.
+    if created or raw or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    bump_card_version(author_id=instance.pk)
+    page_cache.content_changed()
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        comment_stats.record_comment_added(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_deleted_comment(sender, instance, **kwargs):
+    comment_stats.record_comment_removed(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(m2m_changed, sender=TaggedItem)
+def retire_cached_pages(sender, action='post_', **kwargs):
+    if action.startswith('post_'):
+        page_cache.content_changed()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def mark_post_sitemap(sender, instance, **kwargs):
+    sitemaps.mark_dirty('posts', [instance.pk])
+    # A post leaving a tag can empty the tag's page.
+    sitemaps.mark_dirty('tags', getattr(instance, '_deleted_tag_ids', None))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def mark_commented_post_sitemap(sender, instance, created=True, **kwargs):
+    # The post's lastmod is its latest comment.
+    if created:
+        sitemaps.mark_dirty('posts', [instance.post_id])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def mark_tag_sitemap(sender, instance, **kwargs):
+    sitemaps.mark_dirty('tags', [instance.pk])
+
+
+@receiver(m2m_changed, sender=TaggedItem)
+def mark_retagged_sitemap(sender, instance, action, pk_set=None, **kwargs):
+    if isinstance(instance, Post) and action in ('post_add', 'post_remove'):
+        sitemaps.mark_dirty('tags', pk_set)
+    elif isinstance(instance, Post) and action == 'post_clear':
+        sitemaps.mark_dirty('tags', getattr(instance, '_cleared_tag_ids', None))
@@ -0,0 +1,284 @@
+# blog/sitemaps.py
+"""
+Segmented sitemaps, built ahead of time and served from disk.
+
+Post and tag URLs are split into segments by primary key range: segment
+``n`` of a section holds the rows with ``n * SEGMENT_SIZE <= pk < (n + 1) *
+SEGMENT_SIZE``, so no file exceeds the 50,000 URL limit of the sitemap
+protocol. A new post only lands in the last segment, and an edited post
+stays in the segment it was in.
+
+blog/signals.py marks a segment dirty (one upsert into SitemapSegment) when
+a post or tag in it is saved, deleted, tagged or commented on.
+``build_sitemaps()`` rewrites only the dirty segments, the segments not
+built yet and those whose file is missing, then the index if anything
+changed. A segment is only marked clean once its file is written, and only
+if nothing marked it dirty again meanwhile. It runs from ``manage.py
+build_sitemaps``. The index view also starts it in a background thread at
+most once per ``BLOG_SITEMAP_MAX_AGE`` seconds, and keeps serving the files
+already on disk; a crawler never waits for a build.
+
+Files are written to a temporary name and renamed, so a crawler never sees
+a half-written file. They are served with ETag and Last-Modified from the
+file's stat, and a public max-age.
+
+Settings:
+
+``BLOG_SITE_URL``
+    Scheme and host put in front of every path (default
+    ``http://localhost:8000``).
+``BLOG_SITEMAP_DIR``
+    Where the files are written (default ``BASE_DIR / 'sitemaps'``).
+``BLOG_SITEMAP_MAX_AGE``
+    Seconds crawlers may cache a file and between two rebuild checks from
+    the index view (default 3600).
+"""
+import os
+import tempfile
+import threading
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.http import FileResponse, Http404
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from taggit.models import Tag
+
+from .background import run_in_thread
+from .models import Post, SitemapSegment
+
+SEGMENT_SIZE = 50000
+SECTIONS = ('posts', 'tags')
+INDEX_FILE = 'sitemap.xml'
+CHECKED_CACHE_KEY = 'blog:sitemap-checked'
+
+_XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+_NAMESPACE = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+# Stands in for the pk when reversing a URL pattern once per segment.
+_PK_SENTINEL = 8642097531
+
+
+def site_url():
+    return getattr(settings, 'BLOG_SITE_URL', 'http://localhost:8000').rstrip('/')
+
+
+def sitemap_dir():
+    return Path(getattr(settings, 'BLOG_SITEMAP_DIR', settings.BASE_DIR / 'sitemaps'))
+
+
+def sitemap_max_age():
+    return getattr(settings, 'BLOG_SITEMAP_MAX_AGE', 60 * 60)
+
+
+def segment_of(pk):
+    return pk // SEGMENT_SIZE
+
+
+def segment_filename(section, number):
+    return 'sitemap-%s-%d.xml' % (section, number)
+
+
+def mark_dirty(section, pks):
+    """Mark the segments of ``section`` holding the given primary keys for a rebuild."""
+    numbers = {segment_of(pk) for pk in pks or () if pk is not None}
+    if not numbers:
+        return
+    now = timezone.now()
+    SitemapSegment.objects.bulk_create(
+        [SitemapSegment(section=section, number=number, dirtied_at=now) for number in numbers],
+        update_conflicts=True, unique_fields=['section', 'number'], update_fields=['dirty', 'dirtied_at'],
+    )
+
+
+def mark_all_dirty():
+    """Rebuild every segment next time, e.g. after bulk inserts that sent no signals."""
+    SitemapSegment.objects.update(dirty=True, dirtied_at=timezone.now())
+
+
+# The URLs of each section, as (path, lastmod) pairs.
+
+def _post_urls(start, stop):
+    template = reverse('post-detail', args=[_PK_SENTINEL]).replace('%', '%%')
+    template = template.replace(str(_PK_SENTINEL), '%d')
+    rows = (
+        Post.objects.filter(pk__gte=start, pk__lt=stop)
+        .order_by('pk')
+        .values_list('pk', 'published_date', 'last_comment_at')
+        .iterator(chunk_size=5000)
+    )
+    for pk, published, last_comment in rows:
+        yield template % pk, max(published, last_comment) if last_comment else published
+
+
+def _tag_urls(start, stop):
+    rows = (
+        Tag.objects.filter(pk__gte=start, pk__lt=stop, blog_stats__post_count__gt=0)
+        .order_by('pk')
+        .values_list('slug', 'blog_stats__last_used')
+    )
+    for slug, last_used in rows.iterator(chunk_size=5000):
+        yield reverse('post-by-tag', args=[slug]), last_used
+
+
+_SECTION_SOURCES = {
+    'posts': (Post, _post_urls),
+    'tags': (Tag, _tag_urls),
+}
+
+
+def build_sitemaps(force=False):
+    """
+    Write the dirty and missing segments (every segment with ``force``),
+    then the index if needed. Returns the names of the files written.
+    """
+    directory = sitemap_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    written = []
+    for section in SECTIONS:
+        model, urls = _SECTION_SOURCES[section]
+        last_pk = model.objects.aggregate(last=Max('pk'))['last']
+        expected = set(range(segment_of(last_pk) + 1)) if last_pk is not None else set()
+        known = {
+            number: (dirty, dirtied_at, url_count)
+            for number, dirty, dirtied_at, url_count in SitemapSegment.objects.filter(section=section)
+            .values_list('number', 'dirty', 'dirtied_at', 'url_count')
+        }
+        if force:
+            numbers = expected | known.keys()
+        else:
+            # A segment with URLs whose file is gone (a fresh deploy, a
+            # cleaned-out BLOG_SITEMAP_DIR) is rebuilt like a dirty one.
+            numbers = (expected - known.keys()) | {
+                number for number, (dirty, _, url_count) in known.items()
+                if dirty or (url_count and not (directory / segment_filename(section, number)).exists())
+            }
+        for number in sorted(numbers):
+            name = segment_filename(section, number)
+            start = number * SEGMENT_SIZE
+            count, lastmod = _write_urlset(directory / name, urls(start, start + SEGMENT_SIZE))
+            # Only once the file is in place, and only if no write marked the
+            # segment dirty again while it was rendered, is it clean.
+            dirtied_at = known[number][1] if number in known else None
+            with transaction.atomic():
+                SitemapSegment.objects.update_or_create(
+                    section=section, number=number,
+                    defaults={'url_count': count, 'lastmod': lastmod, 'built_at': timezone.now()},
+                    create_defaults={
+                        'url_count': count, 'lastmod': lastmod, 'built_at': timezone.now(), 'dirty': False,
+                    },
+                )
+                SitemapSegment.objects.filter(
+                    section=section, number=number, dirtied_at=dirtied_at,
+                ).update(dirty=False)
+            written.append(name)
+    if written or force or not (directory / INDEX_FILE).exists():
+        _write_index(directory / INDEX_FILE)
+        written.append(INDEX_FILE)
+    return written
+
+
+_building = threading.Lock()
+
+
+def build_in_background():
+    """Run build_sitemaps() in a thread, unless this process is building already."""
+    if not _building.acquire(blocking=False):
+        return
+
+    def build():
+        try:
+            build_sitemaps()
+        finally:
+            _building.release()
+
+    run_in_thread(build, name='sitemap-build')
+
+
+def _write_urlset(path, urls):
+    """Write a segment; returns its URL count and newest lastmod. Empty segments are removed."""
+    base = site_url()
+    count, newest = 0, None
+    with _AtomicFile(path) as f:
+        f.write(_XML_HEADER)
+        f.write('<urlset xmlns="%s">\n' % _NAMESPACE)
+        for location, lastmod in urls:
+            f.write('<url><loc>%s</loc>' % escape(base + location))
+            if lastmod is not None:
+                f.write('<lastmod>%s</lastmod>' % lastmod.isoformat(timespec='seconds'))
+                newest = lastmod if newest is None else max(newest, lastmod)
+            f.write('</url>\n')
+            count += 1
+        f.write('</urlset>\n')
+        if not count:
+            f.discard = True
+    return count, newest
+
+
+def _write_index(path):
+    base = site_url()
+    segments = SitemapSegment.objects.filter(url_count__gt=0).order_by('section', 'number')
+    with _AtomicFile(path) as f:
+        f.write(_XML_HEADER)
+        f.write('<sitemapindex xmlns="%s">\n' % _NAMESPACE)
+        for segment in segments:
+            location = reverse('sitemap-segment', args=[segment.section, segment.number])
+            f.write('<sitemap><loc>%s</loc>' % escape(base + location))
+            if segment.lastmod is not None:
+                f.write('<lastmod>%s</lastmod>' % segment.lastmod.isoformat(timespec='seconds'))
+            f.write('</sitemap>\n')
+        f.write('</sitemapindex>\n')
+
+
+class _AtomicFile:
+    """Write to a temporary file renamed over ``path`` on success (or removed, with ``discard``)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.discard = False
+
+    def __enter__(self):
+        fd, self.temp = tempfile.mkstemp(dir=self.path.parent, prefix='.', suffix='.tmp')
+        self.file = os.fdopen(fd, 'w', encoding='utf-8')
+        return self
+
+    def write(self, text):
+        self.file.write(text)
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.file.close()
+        if exc_type is None and not self.discard:
+            # mkstemp creates the file readable by its owner only.
+            os.chmod(self.temp, 0o644)
+            os.replace(self.temp, self.path)
+        else:
+            os.unlink(self.temp)
+            if exc_type is None:
+                self.path.unlink(missing_ok=True)
+
+
+def sitemap_response(request, name):
+    """Serve a built sitemap file with validators, or raise Http404."""
+    path = sitemap_dir() / name
+    if name == INDEX_FILE:
+        due = cache.add(CHECKED_CACHE_KEY, True, sitemap_max_age())
+        if due or not path.exists():
+            build_in_background()
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        raise Http404('No such sitemap.')
+    etag = quote_etag('%x-%x' % (stat.st_mtime_ns, stat.st_size))
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = FileResponse(open(path, 'rb'), content_type='application/xml')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'public, max-age=%d' % sitemap_max_age()
+    return response
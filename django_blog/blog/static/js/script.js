@@ -2,3 +2,53 @@
 document.addEventListener('DOMContentLoaded', function() {
     console.log('Blog page loaded');
 });
+
+// "Load more comments": fetch the next page as an HTML fragment and put it
+// in place of the link (the fragment brings its own link for the page after).
+document.addEventListener('click', function(event) {
+    var link = event.target.closest('.load-more-comments');
+    if (!link) {
+        return;
+    }
+    event.preventDefault();
+    link.textContent = 'Loading...';
+    fetch(link.href, {headers: {'X-Requested-With': 'XMLHttpRequest'}})
+        .then(function(response) { return response.text(); })
+        .then(function(html) { link.outerHTML = html; });
+});
+
+// Search-as-you-type: fill the search box's datalist with tag and post
+// title suggestions. Requests are debounced and stale answers dropped.
+document.addEventListener('DOMContentLoaded', function() {
+    var input = document.querySelector('[data-autocomplete-url]');
+    if (!input) {
+        return;
+    }
+    var list = document.getElementById(input.getAttribute('list'));
+    var timer = null;
+    var latest = 0;
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        var query = input.value.trim();
+        if (!query) {
+            list.innerHTML = '';
+            return;
+        }
+        timer = setTimeout(function() {
+            var request = ++latest;
+            fetch(input.dataset.autocompleteUrl + '?q=' + encodeURIComponent(query))
+                .then(function(response) { return response.json(); })
+                .then(function(data) {
+                    if (request !== latest) {
+                        return;
+                    }
+                    list.innerHTML = '';
+                    data.tags.concat(data.posts).forEach(function(item) {
+                        var option = document.createElement('option');
+                        option.value = item.name || item.title;
+                        list.appendChild(option);
+                    });
+                });
+        }, 150);
+    });
+});
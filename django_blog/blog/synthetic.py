@@ -0,0 +1,206 @@
+# blog/synthetic.py
+"""
+Synthetic blog data for load tests and benchmarks.
+
+Generates users, tags, posts and comments in bulk with a Zipf distribution:
+a few authors write most posts, a few posts get most comments and a few tags
+are on most posts, as on a real site. Everything is written with
+bulk_create in batches, so signals do not fire; the derived data (tag
+statistics, search index, comment counts, page cache, autocomplete,
+sitemaps) is rebuilt once at the end instead.
+
+Used by ``manage.py generate_blog_data``.
+"""
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+from taggit.models import Tag, TaggedItem
+
+from . import autocomplete, page_cache, search, sitemaps, tag_stats
+from .comment_stats import repair_comment_stats
+from .models import Comment, Post
+
+WORDS = (
+    'django python query index cache cursor page template signal model view '
+    'async server client latency throughput database sqlite postgres schema '
+    'migration test deploy profile benchmark search tag comment author post '
+    'release feature bug fix refactor stream batch chunk worker thread event'
+).split()
+
+
+def zipf_cum_weights(n, exponent):
+    """Cumulative weights giving rank ``k`` (1-based) a weight of 1/k**exponent."""
+    return list(accumulate(1 / rank ** exponent for rank in range(1, n + 1)))
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """Let bulk_create store the dates we set instead of auto_now(_add)."""
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class BlogDataGenerator:
+    """
+    Writes ``users`` users, ``tags`` tags, ``posts`` posts and ``comments``
+    comments. ``exponent`` is the Zipf exponent (0 gives uniform picks) and
+    ``seed`` makes runs repeatable.
+    """
+
+    def __init__(self, users=1000, posts=100000, comments=1000000, tags=5000,
+                 tags_per_post=3, exponent=1.1, days=365, batch_size=5000, seed=None,
+                 prefix='bench', log=None):
+        self.users = users
+        self.posts = posts
+        self.comments = comments
+        self.tags = tags
+        self.tags_per_post = tags_per_post
+        self.exponent = exponent
+        self.days = days
+        self.batch_size = batch_size
+        self.prefix = prefix
+        self.random = random.Random(seed)
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+
+    def run(self):
+        """Generate everything; returns a dict of the row counts written."""
+        user_ids = self.create_users()
+        tag_ids = self.create_tags()
+        posts = self.create_posts(user_ids)
+        self.tag_posts(posts, tag_ids)
+        written = self.create_comments(posts, user_ids)
+        self.rebuild_derived_data()
+        return {
+            'users': len(user_ids),
+            'tags': len(tag_ids),
+            'posts': len(posts),
+            'comments': written,
+        }
+
+    def pick(self, population, cum_weights, k):
+        return self.random.choices(population, cum_weights=cum_weights, k=k)
+
+    def weights(self, n):
+        return zipf_cum_weights(n, self.exponent)
+
+    def text(self, words):
+        return ' '.join(self.random.choice(WORDS) for _ in range(words))
+
+    def batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield start, min(self.batch_size, total - start)
+
+    def create_users(self):
+        start = User.objects.filter(username__startswith=self.prefix + '-').count()
+        # One unusable hash for everyone; hashing a password per user would
+        # dominate the run.
+        password = make_password(None)
+        users = [
+            User(username='%s-%d' % (self.prefix, start + i), password=password)
+            for i in range(self.users)
+        ]
+        User.objects.bulk_create(users, batch_size=self.batch_size)
+        self.log('Created %d users.' % len(users))
+        return list(
+            User.objects.filter(username__in=[user.username for user in users])
+            .order_by('pk').values_list('pk', flat=True)
+        )
+
+    def create_tags(self):
+        names = ['%s-topic-%d' % (self.prefix, i) for i in range(self.tags)]
+        Tag.objects.bulk_create(
+            [Tag(name=name, slug=name) for name in names],
+            batch_size=self.batch_size, ignore_conflicts=True,
+        )
+        ids = dict(Tag.objects.filter(name__in=names).values_list('name', 'pk'))
+        self.log('Created %d tags.' % len(ids))
+        # Keep the Zipf rank order: topic-0 is the most used tag.
+        return [ids[name] for name in names]
+
+    def create_posts(self, user_ids):
+        """Returns (pk, published_date) pairs of the new posts."""
+        weights = self.weights(len(user_ids))
+        span = timedelta(days=self.days).total_seconds()
+        created = []
+        with explicit_dates(Post._meta.get_field('published_date')):
+            for start, size in self.batches(self.posts):
+                authors = self.pick(user_ids, weights, size)
+                batch = [
+                    Post(
+                        title=self.text(6).capitalize(),
+                        content=self.text(120),
+                        author_id=author_id,
+                        published_date=self.now - timedelta(seconds=self.random.uniform(0, span)),
+                    )
+                    for author_id in authors
+                ]
+                with transaction.atomic():
+                    Post.objects.bulk_create(batch)
+                created.extend((post.pk, post.published_date) for post in batch)
+                self.log('Created %d/%d posts.' % (start + size, self.posts))
+        return created
+
+    def tag_posts(self, posts, tag_ids):
+        if not tag_ids or not self.tags_per_post:
+            return
+        content_type = ContentType.objects.get_for_model(Post)
+        weights = self.weights(len(tag_ids))
+        per_post = min(self.tags_per_post, len(tag_ids))
+        for start, size in self.batches(len(posts)):
+            items = []
+            for pk, _ in posts[start:start + size]:
+                for tag_id in set(self.pick(tag_ids, weights, per_post)):
+                    items.append(TaggedItem(content_type=content_type, object_id=pk, tag_id=tag_id))
+            with transaction.atomic():
+                TaggedItem.objects.bulk_create(items, batch_size=self.batch_size)
+        self.log('Tagged %d posts.' % len(posts))
+
+    def create_comments(self, posts, user_ids):
+        if not posts:
+            return 0
+        # Shuffle before ranking so the busiest threads are not simply the
+        # oldest posts.
+        ranked = posts[:]
+        self.random.shuffle(ranked)
+        post_weights = self.weights(len(ranked))
+        user_weights = self.weights(len(user_ids))
+        fields = (Comment._meta.get_field('created_at'), Comment._meta.get_field('updated_at'))
+        with explicit_dates(*fields):
+            for start, size in self.batches(self.comments):
+                batch = []
+                targets = self.pick(ranked, post_weights, size)
+                for (pk, published), author_id in zip(targets, self.pick(user_ids, user_weights, size)):
+                    age = (self.now - published).total_seconds()
+                    created_at = published + timedelta(seconds=self.random.uniform(0, age))
+                    batch.append(Comment(
+                        post_id=pk, author_id=author_id, content=self.text(25),
+                        created_at=created_at, updated_at=created_at,
+                    ))
+                with transaction.atomic():
+                    Comment.objects.bulk_create(batch)
+                self.log('Created %d/%d comments.' % (start + size, self.comments))
+        return self.comments
+
+    def rebuild_derived_data(self):
+        tag_stats.rebuild_tag_stats()
+        repair_comment_stats()
+        if search.search_available():
+            search.rebuild_index()
+        page_cache.content_changed()
+        autocomplete.reset()
+        sitemaps.mark_all_dirty()
+        self.log('Rebuilt tag statistics, comment counts and the search index.')
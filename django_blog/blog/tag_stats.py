@@ -0,0 +1,168 @@
+# blog/tag_stats.py
+"""
+Incremental tag statistics and the cached tag cloud built from them.
+
+TagStats rows are adjusted with F() expressions as tags are attached to or
+detached from posts, so reading "how many posts does this tag have" never
+needs a COUNT over taggit's TaggedItem table. The tag cloud is a plain
+indexed read of TagStats, cached until the next tag change.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Max, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Post, TagStats
+
+TAG_CLOUD_CACHE_KEY = 'blog:tag-cloud'
+TAG_CLOUD_TIMEOUT = 60 * 60
+# Number of font-size steps used by the tag cloud (css classes tag-size-1..N).
+TAG_CLOUD_STEPS = 5
+
+
+def tag_cloud_size():
+    return getattr(settings, 'BLOG_TAG_CLOUD_SIZE', 30)
+
+
+def record_tags_added(tag_ids):
+    """Count one more post for each tag in ``tag_ids``."""
+    record_tag_usage(dict.fromkeys(tag_ids or (), 1))
+
+
+def record_tag_usage(counts):
+    """
+    Count ``counts[tag_id]`` more posts for each tag, e.g. for a batch of
+    imported posts. Runs one UPDATE per distinct count.
+    """
+    by_count = defaultdict(list)
+    for tag_id, count in counts.items():
+        by_count[count].append(tag_id)
+    if not by_count:
+        return
+    now = timezone.now()
+    with transaction.atomic():
+        TagStats.objects.bulk_create(
+            [TagStats(tag_id=tag_id) for tag_id in counts], ignore_conflicts=True,
+        )
+        for count, tag_ids in by_count.items():
+            TagStats.objects.filter(tag_id__in=tag_ids).update(
+                post_count=F('post_count') + count, last_used=now,
+            )
+    invalidate_tag_cloud()
+
+
+def record_tags_removed(tag_ids):
+    """Count one post fewer for each tag in ``tag_ids``."""
+    tag_ids = list(tag_ids or ())
+    if not tag_ids:
+        return
+    TagStats.objects.filter(tag_id__in=tag_ids).update(
+        post_count=Greatest(F('post_count') - 1, Value(0)),
+    )
+    invalidate_tag_cloud()
+
+
+def rebuild_tag_stats():
+    """
+    Recompute every TagStats row from TaggedItem in one aggregate query.
+
+    Returns the number of tags with statistics.
+    """
+    from django.contrib.contenttypes.models import ContentType
+    from taggit.models import TaggedItem
+
+    content_type = ContentType.objects.get_for_model(Post)
+    totals = (
+        TaggedItem.objects.filter(content_type=content_type)
+        .values('tag_id')
+        .annotate(post_count=Count('object_id', distinct=True))
+    )
+    # TaggedItem has no timestamp, so the newest tagged post stands in for
+    # the time the tag was last used.
+    latest = dict(
+        Post.objects.filter(tags__isnull=False)
+        .values_list('tags__id')
+        .annotate(latest=Max('published_date'))
+    )
+    rows = [
+        TagStats(tag_id=row['tag_id'], post_count=row['post_count'], last_used=latest.get(row['tag_id']))
+        for row in totals
+    ]
+    with transaction.atomic():
+        TagStats.objects.all().delete()
+        TagStats.objects.bulk_create(rows, batch_size=500)
+    invalidate_tag_cloud()
+    return len(rows)
+
+
+def invalidate_tag_cloud():
+    cache.delete(TAG_CLOUD_CACHE_KEY)
+
+
+def _cached_tags():
+    tags = cache.get(TAG_CLOUD_CACHE_KEY)
+    if tags is None:
+        tags = _load_tags(tag_cloud_size())
+        cache.set(TAG_CLOUD_CACHE_KEY, tags, TAG_CLOUD_TIMEOUT)
+    return tags
+
+
+async def _acached_tags():
+    tags = await cache.aget(TAG_CLOUD_CACHE_KEY)
+    if tags is None:
+        tags = _tag_weights([stat async for stat in _popular_stats(tag_cloud_size())])
+        await cache.aset(TAG_CLOUD_CACHE_KEY, tags, TAG_CLOUD_TIMEOUT)
+    return tags
+
+
+def popular_tags(limit=10):
+    """
+    Return the ``limit`` most used tags, most posts first, as dicts with
+    ``name``, ``slug``, ``post_count`` and a ``weight`` from 1 to
+    TAG_CLOUD_STEPS.
+
+    Served from the cache; a miss is one indexed read of TagStats.
+    """
+    return _cached_tags()[:limit]
+
+
+def tag_cloud():
+    """The cached popular tags in alphabetical order, for the tag cloud."""
+    return sorted(_cached_tags(), key=lambda tag: tag['name'].lower())
+
+
+async def atag_cloud():
+    """tag_cloud() for async views."""
+    return sorted(await _acached_tags(), key=lambda tag: tag['name'].lower())
+
+
+def _popular_stats(size):
+    return (
+        TagStats.objects.filter(post_count__gt=0)
+        .select_related('tag')
+        .order_by('-post_count', '-last_used')[:size]
+    )
+
+
+def _load_tags(size):
+    return _tag_weights(list(_popular_stats(size)))
+
+
+def _tag_weights(stats):
+    if not stats:
+        return []
+    most, least = stats[0].post_count, stats[-1].post_count
+    spread = max(most - least, 1)
+    return [
+        {
+            'name': stat.tag.name,
+            'slug': stat.tag.slug,
+            'post_count': stat.post_count,
+            'weight': 1 + (stat.post_count - least) * (TAG_CLOUD_STEPS - 1) // spread,
+        }
+        for stat in stats
+    ]
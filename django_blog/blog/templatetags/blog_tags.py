@@ -0,0 +1,18 @@
+from django import template
+
+from ..cards import render_post_cards
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    """
+    Render the (fragment cached) cards for a page of posts.
+
+    Async views render the cards before the template (blog/async_views.py)
+    and pass them in as ``rendered_cards``.
+    """
+    if 'rendered_cards' in context:
+        return context['rendered_cards']
+    return render_post_cards(list(posts))
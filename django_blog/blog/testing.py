@@ -0,0 +1,38 @@
+# blog/testing.py
+"""
+Test helpers shared by the blog test suite.
+
+QueryBudgetMixin adds assertMaxQueries(), a relaxed assertNumQueries(): it
+fails only when a block runs *more* queries than its budget, and lists every
+query it saw so the offending N+1 is easy to spot.
+"""
+from contextlib import contextmanager
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """Mix into a TestCase to get assertMaxQueries()."""
+
+    @contextmanager
+    def assertMaxQueries(self, budget, using='default'):
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        executed = len(context.captured_queries)
+        if executed > budget:
+            queries = '\n'.join(
+                '%d. %s' % (i, query['sql'])
+                for i, query in enumerate(context.captured_queries, start=1)
+            )
+            self.fail(
+                '%d queries executed, budget is %d.\nCaptured queries were:\n%s'
+                % (executed, budget, queries)
+            )
+
+    def assertQueryBudget(self, budget, url, using='default', **params):
+        """GET ``url`` with self.client within ``budget`` queries; return the response."""
+        with self.assertMaxQueries(budget, using=using):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response
@@ -1,3 +1,1610 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import json
+import os
+import re
+import tempfile
+import time
+from io import StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from perftools.db_router import PRIMARY_COOKIE, PrimaryReplicaRouter, pin_to_primary
+from perftools.instrumentation import RequestMetrics
+from perftools.slow_queries import fingerprint, normalize
+from perftools.sqlite_tuning import apply_pragmas, retry_on_lock
+from taggit.models import Tag
+
+from . import autocomplete, page_cache, sitemaps, tag_stats
+from .autocomplete import PrefixIndex
+from .benchmark import BlogBenchmark, percentile
+from .context_processors import popular_tags
+from .exporter import post_records
+from .models import Comment, Post, SitemapSegment, TagStats
+from .pagination import CursorPaginator, decode_cursor, encode_cursor
+from .search import FTS_TABLE, SearchResults, build_match_expression, highlight, search_available
+from .testing import QueryBudgetMixin
+from .views import COMMENTS_PER_PAGE, PostListView, PostUpdateView, get_comment_page
+
+
+class BlogTestData:
+    """A few authors, tagged posts and comment threads shared by the tests."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user('user%d' % i, password='pass-%d-word' % i)
+            for i in range(4)
+        ]
+        cls.posts = []
+        for i in range(8):
+            post = Post.objects.create(
+                title='Post %d about django' % i,
+                content='Body of post %d' % i,
+                author=cls.users[i % len(cls.users)],
+            )
+            post.tags.add('django', 'tag%d' % (i % 3))
+            cls.posts.append(post)
+        cls.post = cls.posts[-1]
+        for i in range(6):
+            Comment.objects.create(
+                post=cls.post, author=cls.users[i % len(cls.users)], content='Comment %d' % i,
+            )
+
+    @classmethod
+    def add_posts(cls, count):
+        """Grow the data set, to check that query counts do not grow with it."""
+        for i in range(count):
+            post = Post.objects.create(
+                title='Extra %d' % i, content='More django', author=cls.users[i % len(cls.users)],
+            )
+            post.tags.add('django', 'extra%d' % i)
+            for j in range(3):
+                Comment.objects.create(post=post, author=cls.users[j], content='Reply %d' % j)
+            Comment.objects.create(post=cls.post, author=cls.users[i % len(cls.users)], content='More')
+
+    @staticmethod
+    def warm_caches():
+        """Fill the per-process lookups and the tag cloud, as in a warmed-up server."""
+        cache.clear()
+        search_available()
+        tag_stats.popular_tags()
+
+
+@override_settings(BLOG_PAGE_CACHE=False)
+class SearchTests(BlogTestData, TestCase):
+
+    def setUp(self):
+        self.warm_caches()
+        if not search_available():
+            self.skipTest('SQLite was built without FTS5.')
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('search-posts'), {'q': query, **params})
+        return list(response.context['posts'])
+
+    def test_ranked_by_bm25(self):
+        in_content = Post.objects.create(title='Plain', content='A zebra walks by', author=self.users[0])
+        in_title = Post.objects.create(title='Zebra', content='Nothing here', author=self.users[0])
+        in_tags = Post.objects.create(title='Tagged', content='Nothing here', author=self.users[0])
+        in_tags.tags.add('zebra')
+        results = self.search('zebra')
+        self.assertEqual(results, [in_title, in_tags, in_content])
+        self.assertLess(results[0].search_rank, results[-1].search_rank)
+
+    def test_words_are_prefixes_and_anded(self):
+        self.assertEqual(build_match_expression('djan "post 3'), '"djan"* "post"* "3"*')
+        self.assertEqual(build_match_expression('AND OR *'), '"AND"* "OR"*')
+        self.assertEqual(self.search('djan 3'), [self.posts[3]])
+        self.assertEqual(self.search('"*'), [])
+
+    def test_snippets_are_escaped(self):
+        self.assertEqual(
+            highlight('<b>\x02x&y\x03</b>'), '&lt;b&gt;<mark>x&amp;y</mark>&lt;/b&gt;',
+        )
+        Post.objects.create(
+            title='<script>alert(1)</script> zebra', content='<i>zebra</i>', author=self.users[0],
+        )
+        response = self.client.get(reverse('search-posts'), {'q': 'zebra'})
+        self.assertContains(response, '&lt;script&gt;alert(1)&lt;/script&gt; <mark>zebra</mark>')
+        self.assertContains(response, '&lt;i&gt;<mark>zebra</mark>&lt;/i&gt;')
+        self.assertNotContains(response, '<script>alert')
+
+    def test_tag_rename_and_delete_reindex(self):
+        self.posts[2].tags.add('quokka')
+        self.assertEqual(self.search('quokka'), [self.posts[2]])
+        tag = Tag.objects.get(name='quokka')
+        tag.name = 'wombat'
+        tag.save()
+        self.assertEqual(self.search('quokka'), [])
+        self.assertEqual(self.search('wombat'), [self.posts[2]])
+        tag.delete()
+        self.assertEqual(self.search('wombat'), [])
+
+    def test_restricted_to_a_tag(self):
+        results = SearchResults('django', Post.objects.all(), Post.objects.filter(tags__slug='tag1'))
+        self.assertEqual(results.count(), 3)
+        self.assertEqual(
+            sorted(post.pk for post in results), [post.pk for post in self.posts[1::3]],
+        )
+
+    def test_rebuild_index_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s' % FTS_TABLE)
+        self.assertEqual(self.search('django'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', chunk_size=3, stdout=out)
+        self.assertIn('Indexed 8 posts.', out.getvalue())
+        self.assertEqual(len(self.search('django')), 5)  # one page
+        self.assertEqual(SearchResults('django', Post.objects.all()).count(), 8)
+        self.assertEqual(self.search('quokka'), [])
+
+    def test_rebuild_index_command_needs_fts5(self):
+        with patch('blog.search.search_available', return_value=False):
+            with self.assertRaisesMessage(CommandError, FTS_TABLE):
+                call_command('rebuild_search_index', stdout=StringIO())
+
+
+class SearchFallbackTests(BlogTestData, TestCase):
+    """Without FTS5 the search box filters with icontains."""
+
+    def setUp(self):
+        cache.clear()
+        patcher = patch('blog.views.search_available', return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_icontains(self):
+        response = self.client.get(reverse('search-posts'), {'q': 'BODY OF POST 3'})
+        self.assertEqual(list(response.context['posts']), [self.posts[3]])
+        self.assertNotContains(response, '<mark>')
+
+    def test_tags_match_once(self):
+        response = self.client.get(reverse('search-posts'), {'q': 'tag'})
+        self.assertEqual(response.context['paginator'].count, 8)
+        self.assertEqual(
+            list(self.client.get(reverse('search-posts'), {'q': 'tag0'}).context['posts']),
+            [self.posts[6], self.posts[3], self.posts[0]],
+        )
+
+
+@override_settings(BLOG_CURSOR_PAGINATION=True, BLOG_PAGE_CACHE=False)
+class CursorPaginationTests(BlogTestData, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Half the posts share one published_date, so only the id breaks ties.
+        tie = Post.objects.get(pk=cls.posts[4].pk).published_date
+        Post.objects.filter(pk__lte=cls.posts[4].pk).update(published_date=tie)
+        cls.newest_first = list(
+            Post.objects.order_by('-published_date', '-id').values_list('pk', flat=True)
+        )
+
+    def get_page(self, **params):
+        response = self.client.get(reverse('post-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['page_obj']
+
+    def test_paginator_round_trip_with_ties(self):
+        paginator = CursorPaginator(Post.objects.all(), 3)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        self.assertEqual([[post.pk for post in page] for page in pages], [
+            self.newest_first[:3], self.newest_first[3:6], self.newest_first[6:],
+        ])
+        self.assertFalse(pages[0].has_previous())
+        # Reverse cursors walk back through the same pages.
+        back = pages[-1]
+        for page in reversed(pages[:-1]):
+            back = paginator.page(back.previous_cursor)
+            self.assertEqual(back.object_list, page.object_list)
+        self.assertFalse(back.has_previous())
+        self.assertTrue(back.has_next())
+
+    def test_view_round_trip(self):
+        seen = []
+        page = self.get_page()
+        self.assertEqual(page.number, 1)
+        seen += [post.pk for post in page]
+        while page.has_next():
+            page = self.get_page(cursor=page.next_cursor)
+            seen += [post.pk for post in page]
+        self.assertEqual(seen, self.newest_first)
+
+        previous = self.get_page(cursor=page.previous_cursor)
+        self.assertEqual([post.pk for post in previous], self.newest_first[:5])
+        self.assertFalse(previous.has_previous())
+        self.assertEqual(
+            [post.pk for post in self.get_page(cursor=previous.next_cursor)], self.newest_first[5:],
+        )
+
+    def test_reverse_cursor(self):
+        after = Post.objects.get(pk=self.newest_first[5])
+        page = self.get_page(cursor=encode_cursor(after, reverse=True))
+        self.assertEqual([post.pk for post in page], self.newest_first[:5])
+        self.assertFalse(page.has_previous())
+        self.assertTrue(page.has_next())
+        self.assertEqual(decode_cursor(page.next_cursor)[1:], (self.newest_first[4], False))
+
+    def test_old_page_links(self):
+        self.assertEqual([post.pk for post in self.get_page(page=2)], self.newest_first[5:])
+        url = reverse('post-list')
+        self.assertEqual(self.client.get(url, {'page': 3}).status_code, 404)
+        max_page = PostListView.max_offset_page
+        self.assertEqual(self.client.get(url, {'page': max_page + 1}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'page': 0}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'page': 'last'}).status_code, 404)
+
+    def test_bad_cursors(self):
+        def token(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+        date = self.post.published_date.isoformat()
+        for cursor in [
+            'garbage', '!!!', token('abc'), token([date, 1]), token([date, 1, 0, 4]),
+            token([None, 1, 0]), token(['9999-99-99T00:00', 1, 0]), token([date, 'x', 0]),
+            token([date, 10 ** 30, 0]), token({'a': 1, 'b': 2, 'c': 3}),
+        ]:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('post-list'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+
+class QueryBudgetMixinTests(QueryBudgetMixin, TestCase):
+
+    def test_within_budget(self):
+        with self.assertMaxQueries(1):
+            list(User.objects.all())
+
+    def test_over_budget_lists_queries(self):
+        with self.assertRaises(AssertionError) as cm:
+            with self.assertMaxQueries(1):
+                list(User.objects.all())
+                list(Post.objects.all())
+        self.assertIn('2 queries executed, budget is 1', str(cm.exception))
+        self.assertIn('blog_post', str(cm.exception))
+
+
+class AnonymousQueryBudgetTests(QueryBudgetMixin, BlogTestData, TestCase):
+    """
+    Budgets for logged-out readers. Each view must load authors, tags and
+    comment authors in bulk, so adding data must not add queries.
+    """
+    LIST_BUDGET = 3      # COUNT, posts + authors, tags
+    SEARCH_BUDGET = 4    # COUNT, ranked FTS rows, posts + authors, tags
+    DETAIL_BUDGET = 3    # post + author, tags, comments + authors
+
+    def setUp(self):
+        self.warm_caches()
+
+    def check_budget_is_flat(self, budget, url, **params):
+        self.assertQueryBudget(budget, url, **params)
+        self.add_posts(10)
+        self.warm_caches()
+        self.assertQueryBudget(budget, url, **params)
+
+    def test_post_list(self):
+        self.check_budget_is_flat(self.LIST_BUDGET, reverse('post-list'))
+
+    def test_post_list_page_two(self):
+        self.check_budget_is_flat(self.LIST_BUDGET, reverse('post-list'), page=2)
+
+    def test_post_by_tag(self):
+        self.check_budget_is_flat(self.LIST_BUDGET, reverse('post-by-tag', args=['django']))
+
+    def test_search(self):
+        self.check_budget_is_flat(self.SEARCH_BUDGET, reverse('search-posts'), q='django')
+
+    def test_post_detail(self):
+        self.check_budget_is_flat(self.DETAIL_BUDGET, reverse('post-detail', args=[self.post.pk]))
+
+    def test_post_detail_renders_every_comment(self):
+        response = self.assertQueryBudget(
+            self.DETAIL_BUDGET, reverse('post-detail', args=[self.post.pk]),
+        )
+        self.assertContains(response, 'class="comment"', count=6)
+
+
+class AuthenticatedQueryBudgetTests(QueryBudgetMixin, BlogTestData, TestCase):
+    """Logged-in pages pay two extra queries: the session and the user."""
+    AUTH = 2
+
+    def setUp(self):
+        self.warm_caches()
+        self.client.force_login(self.post.author)
+
+    def test_post_list(self):
+        self.assertQueryBudget(AnonymousQueryBudgetTests.LIST_BUDGET + self.AUTH, reverse('post-list'))
+
+    def test_post_detail(self):
+        # Edit/delete links for the user's own comments must not re-fetch
+        # comment authors.
+        url = reverse('post-detail', args=[self.post.pk])
+        self.assertQueryBudget(AnonymousQueryBudgetTests.DETAIL_BUDGET + self.AUTH, url)
+        self.add_posts(10)
+        self.warm_caches()
+        self.assertQueryBudget(AnonymousQueryBudgetTests.DETAIL_BUDGET + self.AUTH, url)
+
+    def test_post_create_form(self):
+        self.assertQueryBudget(self.AUTH, reverse('post-create'))
+
+    def test_post_update_form(self):
+        # get_object() runs twice: once for the permission check, once for the form.
+        self.assertQueryBudget(self.AUTH + 3, reverse('post-update', args=[self.post.pk]))
+
+    def test_profile(self):
+        self.assertQueryBudget(self.AUTH, reverse('profile'))
+
+
+class TagStatsTests(QueryBudgetMixin, BlogTestData, TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def stats(self):
+        return dict(TagStats.objects.values_list('tag__name', 'post_count'))
+
+    def test_counts_follow_tagging(self):
+        self.assertEqual(self.stats(), {'django': 8, 'tag0': 3, 'tag1': 3, 'tag2': 2})
+        post = self.posts[0]
+        post.tags.add('django', 'fresh')  # 'django' is already there
+        post.tags.remove('tag0')
+        self.assertEqual(self.stats(), {'django': 8, 'tag0': 2, 'tag1': 3, 'tag2': 2, 'fresh': 1})
+        post.tags.clear()
+        self.assertEqual(self.stats(), {'django': 7, 'tag0': 2, 'tag1': 3, 'tag2': 2, 'fresh': 0})
+        self.posts[1].delete()
+        self.assertEqual(self.stats(), {'django': 6, 'tag0': 2, 'tag1': 2, 'tag2': 2, 'fresh': 0})
+
+    def test_rebuild_matches_incremental_counts(self):
+        self.posts[2].tags.set(['tag1'])
+        incremental = self.stats()
+        TagStats.objects.update(post_count=99)
+        call_command('rebuild_tag_stats', stdout=StringIO())
+        self.assertEqual(self.stats(), {k: v for k, v in incremental.items() if v})
+
+    def test_popular_tags_and_cloud(self):
+        popular = tag_stats.popular_tags(2)
+        self.assertEqual(len(popular), 2)
+        self.assertEqual(popular[0]['name'], 'django')
+        self.assertEqual(popular[0]['weight'], tag_stats.TAG_CLOUD_STEPS)
+        cloud = tag_stats.tag_cloud()
+        self.assertEqual([tag['name'] for tag in cloud], ['django', 'tag0', 'tag1', 'tag2'])
+
+    def test_cloud_is_invalidated_by_tag_changes(self):
+        tag_stats.popular_tags()
+        self.posts[0].tags.add('brand-new')
+        self.assertIn('brand-new', [tag['name'] for tag in tag_stats.tag_cloud()])
+        Tag.objects.filter(name='brand-new').get().delete()
+        self.assertNotIn('brand-new', [tag['name'] for tag in tag_stats.tag_cloud()])
+
+    def test_sidebar_never_aggregates(self):
+        context = popular_tags(RequestFactory().get('/'))
+        with self.assertMaxQueries(1) as cold:
+            list(context['tag_cloud'])
+        self.assertNotIn('COUNT(', cold.captured_queries[0]['sql'])
+        with self.assertNumQueries(0):
+            list(popular_tags(RequestFactory().get('/'))['tag_cloud'])
+
+
+@override_settings(BLOG_PAGE_CACHE=False)
+class PostCardCacheTests(QueryBudgetMixin, BlogTestData, TestCase):
+
+    def setUp(self):
+        self.warm_caches()
+        self.url = reverse('post-list')
+
+    def test_warm_page_skips_tag_queries(self):
+        self.client.get(self.url)
+        with patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            # COUNT and the posts themselves; every card comes from the cache.
+            self.assertQueryBudget(2, self.url)
+        get_many.assert_called_once()
+
+    def test_cold_page_renders_misses_in_one_pass(self):
+        with patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            self.assertQueryBudget(3, self.url)
+        set_many.assert_called_once()
+        self.assertEqual(len(set_many.call_args[0][0]), 5)
+
+    def test_post_edit_bumps_card(self):
+        self.client.get(self.url)
+        post = Post.objects.get(pk=self.post.pk)
+        post.title = 'Edited title'
+        post.save()
+        self.assertIsInstance(post.card_version, int)
+        self.assertContains(self.client.get(self.url), 'Edited title')
+
+    def test_partial_saves_bump_card(self):
+        self.client.get(self.url)
+        post = Post.objects.get(pk=self.post.pk)
+        before = post.card_version
+        post.title = 'Edited title'
+        post.save(update_fields=['title'])
+        self.assertEqual(post.card_version, before + 1)
+        self.assertContains(self.client.get(self.url), 'Edited title')
+        post.content = 'Edited content'
+        post.save(update_fields=['content'])
+        self.assertContains(self.client.get(self.url), 'Edited content')
+        # Counter-only saves leave the card alone.
+        post.save(update_fields=['comment_count'])
+        self.assertEqual(Post.objects.get(pk=post.pk).card_version, before + 2)
+
+    def test_tag_changes_bump_card(self):
+        self.client.get(self.url)
+        self.post.tags.add('shiny')
+        self.assertContains(self.client.get(self.url), 'shiny')
+        tag = Tag.objects.get(name='shiny')
+        tag.name = 'polished'
+        tag.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'polished')
+        self.assertNotContains(response, '>shiny<')
+
+    def test_author_rename_bumps_card(self):
+        self.client.get(self.url)
+        author = self.post.author
+        author.username = 'renamed-author'
+        author.save()
+        self.assertContains(self.client.get(self.url), 'renamed-author')
+
+    def test_login_does_not_bump_cards(self):
+        before = Post.objects.get(pk=self.post.pk).card_version
+        self.client.login(username=self.post.author.username, password='pass-3-word')
+        self.assertEqual(Post.objects.get(pk=self.post.pk).card_version, before)
+
+
+class AnonymousPageCacheTests(QueryBudgetMixin, BlogTestData, TestCase):
+
+    def setUp(self):
+        self.warm_caches()
+
+    def test_repeat_visit_is_served_from_cache(self):
+        for url in (
+            reverse('post-list'),
+            reverse('post-by-tag', args=['tag1']),
+            reverse('post-detail', args=[self.post.pk]),
+        ):
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+            self.assertEqual(second.content, first.content)
+            self.assertEqual(second['ETag'], first['ETag'])
+            self.assertIn('Last-Modified', second)
+            self.assertIn('Cookie', second['Vary'])
+
+    def test_query_string_is_part_of_the_key(self):
+        url = reverse('post-list')
+        self.assertNotEqual(
+            self.client.get(url, {'page': 1}).content, self.client.get(url, {'page': 2}).content,
+        )
+        # Parameter order does not matter.
+        self.client.get(url + '?page=2&q=')
+        with self.assertNumQueries(0):
+            self.client.get(url + '?q=&page=2')
+
+    def test_conditional_get_returns_304(self):
+        url = reverse('post-detail', args=[self.post.pk])
+        response = self.client.get(url)
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        not_modified = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_writes_retire_cached_pages(self):
+        url = reverse('post-detail', args=[self.post.pk])
+        self.client.get(url)
+        Comment.objects.create(post=self.post, author=self.users[0], content='Fresh comment')
+        self.assertContains(self.client.get(url), 'Fresh comment')
+        self.post.tags.add('retagged')
+        self.assertContains(self.client.get(url), 'retagged')
+        Post.objects.get(pk=self.post.pk).delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_logged_in_users_bypass_the_cache(self):
+        url = reverse('post-detail', args=[self.post.pk])
+        self.client.get(url)
+        self.client.force_login(self.users[0])
+        response = self.client.get(url)
+        self.assertContains(response, 'Leave a comment')
+        self.assertNotIn('ETag', response)
+
+    def test_deploy_check_wants_a_shared_cache(self):
+        [warning] = page_cache.check_shared_cache()
+        self.assertEqual(warning.id, 'blog.W001')
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}
+        with self.settings(CACHES=redis):
+            self.assertEqual(page_cache.check_shared_cache(), [])
+
+
+class CommentPaginationTests(QueryBudgetMixin, BlogTestData, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(COMMENTS_PER_PAGE + 5):
+            Comment.objects.create(post=cls.post, author=cls.users[i % 4], content='Thread reply %d' % i)
+        cls.total = 6 + COMMENTS_PER_PAGE + 5
+
+    def setUp(self):
+        self.warm_caches()
+
+    def test_detail_shows_newest_page_only(self):
+        response = self.client.get(reverse('post-detail', args=[self.post.pk]))
+        self.assertContains(response, 'class="comment"', count=COMMENTS_PER_PAGE)
+        self.assertContains(response, 'Thread reply %d' % (COMMENTS_PER_PAGE + 4))
+        self.assertNotContains(response, 'Comment 0')
+        self.assertContains(response, 'load-more-comments')
+
+    def test_load_more_walks_the_whole_thread(self):
+        seen = []
+        url = reverse('post-comments', args=[self.post.pk])
+        page = self.client.get(reverse('post-detail', args=[self.post.pk])).context['comments_page']
+        seen += [comment.pk for comment in page]
+        next_url = '%s?cursor=%s' % (url, page.next_cursor)
+        while next_url:
+            self.assertLess(len(seen), self.total)
+            with self.assertMaxQueries(2):  # post exists + comments with authors
+                data = self.client.get(next_url + '&format=json').json()
+            seen += [comment['id'] for comment in data['comments']]
+            next_url = data['next_url']
+        expected = list(
+            Comment.objects.filter(post=self.post).order_by('-created_at', '-id').values_list('pk', flat=True)
+        )
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(seen), self.total)
+
+    def test_fragment(self):
+        page = get_comment_page(self.post.pk)
+        response = self.client.get(
+            reverse('post-comments', args=[self.post.pk]), {'cursor': page.next_cursor},
+        )
+        self.assertContains(response, 'class="comment"', count=self.total - COMMENTS_PER_PAGE)
+        self.assertNotContains(response, '<html')
+        self.assertNotContains(response, 'load-more-comments')
+
+    def test_bad_requests(self):
+        url = reverse('post-comments', args=[self.post.pk])
+        self.assertEqual(self.client.get(url, {'cursor': 'garbage'}).status_code, 404)
+        self.assertEqual(self.client.get(reverse('post-comments', args=[9999])).status_code, 404)
+
+
+class CommentStatsTests(BlogTestData, TestCase):
+
+    def setUp(self):
+        self.warm_caches()
+
+    def test_counts_follow_comment_views(self):
+        post = self.posts[0]
+        self.client.force_login(self.users[1])
+        self.client.post(reverse('post-detail', args=[post.pk]), {'content': 'From the detail page'})
+        self.client.post(reverse('comment-create', args=[post.pk]), {'content': 'From the create view'})
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 2)
+        newest = Comment.objects.filter(post=post).latest('created_at')
+        self.assertEqual(post.last_comment_at, newest.created_at)
+
+        self.client.post(reverse('comment-delete', args=[newest.pk]))
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(post.last_comment_at, Comment.objects.get(post=post).created_at)
+
+    def test_saving_a_stale_post_keeps_the_counts(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        newest = Comment.objects.create(post=self.post, author=self.users[1], content='Meanwhile')
+        stale.title = 'Saved from an old copy'
+        stale.save()
+        self.assertEqual(stale.comment_count, 7)
+        self.assertEqual(stale.last_comment_at, newest.created_at)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.title, 'Saved from an old copy')
+        self.assertEqual(self.post.comment_count, 7)
+        self.assertEqual(self.post.last_comment_at, newest.created_at)
+
+    def test_partial_saves_keep_the_counts(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        Comment.objects.create(post=self.post, author=self.users[1], content='Meanwhile')
+        stale.title = 'Saved from an old copy'
+        stale.save(update_fields=['title', 'comment_count', 'last_comment_at'])
+        self.assertEqual(stale.comment_count, 7)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.title, 'Saved from an old copy')
+        self.assertEqual(self.post.comment_count, 7)
+        # Saving only the counters is a deliberate write.
+        stale.comment_count = 3
+        stale.save(update_fields=['comment_count'])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 3)
+
+    def test_post_update_view_keeps_the_counts(self):
+        self.client.force_login(self.post.author)
+        with patch('blog.views.PostUpdateView.form_valid', autospec=True, side_effect=self.comment_then_save):
+            self.client.post(
+                reverse('post-update', args=[self.post.pk]),
+                {'title': 'Edited', 'content': 'Edited body', 'tags': 'django'},
+            )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.title, 'Edited')
+        self.assertEqual(self.post.comment_count, 7)
+
+    def comment_then_save(self, view, form):
+        # Another request comments between the form loading the post and saving it.
+        Comment.objects.create(post=self.post, author=self.users[1], content='Meanwhile')
+        form.instance.author = view.request.user
+        return super(PostUpdateView, view).form_valid(form)
+
+    def test_list_shows_count(self):
+        self.assertContains(self.client.get(reverse('post-list')), '6 comments')
+
+    def test_most_discussed_ordering(self):
+        Comment.objects.create(post=self.posts[2], author=self.users[0], content='Only one')
+        response = self.client.get(reverse('post-list'), {'sort': 'discussed'})
+        posts = list(response.context['posts'])
+        self.assertEqual(posts[:2], [self.post, self.posts[2]])
+
+    def test_repair(self):
+        Post.objects.update(comment_count=42, last_comment_at=None)
+        out = StringIO()
+        call_command('repair_comment_stats', chunk_size=3, stdout=out)
+        self.assertIn('Fixed comment statistics on 8 posts', out.getvalue())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 6)
+        self.assertIsNotNone(self.post.last_comment_at)
+        self.assertEqual(Post.objects.filter(comment_count=0).count(), 7)
+        out = StringIO()
+        call_command('repair_comment_stats', stdout=out)
+        self.assertIn('on 0 posts', out.getvalue())
+
+
+@override_settings(ROOT_URLCONF='blog.async_urls', BLOG_PAGE_CACHE=False)
+class AsyncViewTests(QueryBudgetMixin, BlogTestData, TestCase):
+
+    def setUp(self):
+        self.warm_caches()
+
+    def sync_content(self, url, **params):
+        with override_settings(ROOT_URLCONF='django_blog.urls'):
+            return self.client.get(url, params).content
+
+    async def test_pages_match_the_sync_views(self):
+        for url, params in (
+            (reverse('post-list'), {}),
+            (reverse('post-list'), {'page': 2}),
+            (reverse('post-list'), {'sort': 'discussed'}),
+            (reverse('search-posts'), {'q': 'django'}),
+            (reverse('post-by-tag', args=['tag1']), {}),
+            (reverse('post-detail', args=[self.post.pk]), {}),
+        ):
+            with self.subTest(url=url, params=params):
+                response = await self.async_client.get(url, params)
+                self.assertEqual(response.status_code, 200)
+                expected = await sync_to_async(self.sync_content)(url, **params)
+                self.assertEqual(response.content, expected)
+
+    async def test_cursor_pagination(self):
+        with self.settings(BLOG_CURSOR_PAGINATION=True):
+            first = await self.async_client.get(reverse('post-list'))
+            self.assertTrue(first.context['cursor_pagination'])
+            cursor = first.context['page_obj'].next_cursor
+            second = await self.async_client.get(reverse('post-list'), {'cursor': cursor})
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(len(second.context['posts']), 3)
+        self.assertNotIn(first.context['posts'][0], second.context['posts'])
+
+    async def test_missing_pages_are_404(self):
+        for url, params in (
+            (reverse('post-list'), {'page': 99}),
+            (reverse('post-list'), {'page': 'nope'}),
+            (reverse('post-detail', args=[0]), {}),
+        ):
+            with self.subTest(url=url, params=params):
+                response = await self.async_client.get(url, params)
+                self.assertEqual(response.status_code, 404)
+
+    def test_query_budget(self):
+        self.assertQueryBudget(AnonymousQueryBudgetTests.LIST_BUDGET, reverse('post-list'))
+        self.assertQueryBudget(AnonymousQueryBudgetTests.DETAIL_BUDGET, reverse('post-detail', args=[self.post.pk]))
+
+    def test_comment_post_uses_the_sync_view(self):
+        self.client.force_login(self.users[0])
+        url = reverse('post-detail', args=[self.post.pk])
+        response = self.client.post(url, {'content': 'Posted through the async route'})
+        self.assertRedirects(response, url)
+        self.assertContains(self.client.get(url), 'Posted through the async route')
+
+    def test_page_cache(self):
+        url = reverse('post-list')
+        with self.settings(BLOG_PAGE_CACHE=True):
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+
+class SyntheticDataTests(TestCase):
+
+    def test_generate_blog_data(self):
+        out = StringIO()
+        call_command(
+            'generate_blog_data', users=5, posts=40, comments=200, tags=10,
+            batch_size=16, seed=1, stdout=out,
+        )
+        self.assertIn('Generated 5 users, 10 tags, 40 posts and 200 comments.', out.getvalue())
+        self.assertEqual(Comment.objects.count(), 200)
+        # Derived data is rebuilt after the bulk inserts.
+        post = Post.objects.order_by('-comment_count').first()
+        self.assertEqual(post.comment_count, post.comments.count())
+        self.assertEqual(
+            TagStats.objects.get(tag__name='bench-topic-0').post_count,
+            Post.objects.filter(tags__name='bench-topic-0').count(),
+        )
+        # Zipf: the first author writes more than the last one.
+        counts = {user.username: user.post_set.count() for user in User.objects.all()}
+        self.assertGreater(counts['bench-0'], counts['bench-4'])
+        # Dates are spread out instead of all being "now".
+        self.assertGreater(Post.objects.values('published_date').distinct().count(), 1)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([7], 0.95), 7)
+        self.assertIsNone(percentile([], 0.5))
+
+
+class FeedTests(BlogTestData, TestCase):
+
+    def setUp(self):
+        self.warm_caches()
+
+    def test_site_feeds(self):
+        response = self.client.get(reverse('post-feed'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('application/rss+xml', response['Content-Type'])
+        content = response.content.decode()
+        for post in self.posts:
+            self.assertIn('<title>%s</title>' % post.title, content)
+        self.assertIn('<category>django</category>', content)
+
+        response = self.client.get(reverse('post-feed-atom'))
+        self.assertIn('application/atom+xml', response['Content-Type'])
+        self.assertIn('<subtitle>The latest posts.</subtitle>', response.content.decode())
+
+    def test_tag_feed(self):
+        tagged = {post.title for post in self.posts if 'tag1' in post.tags.names()}
+        content = self.client.get(reverse('tag-feed', args=['tag1'])).content.decode()
+        for post in self.posts:
+            if post.title in tagged:
+                self.assertIn('<title>%s</title>' % post.title, content)
+            else:
+                self.assertNotIn('<title>%s</title>' % post.title, content)
+        self.assertEqual(self.client.get(reverse('tag-feed-atom', args=['missing'])).status_code, 404)
+
+    def test_polls_are_answered_from_cache(self):
+        url = reverse('tag-feed', args=['django'])
+        first = self.client.get(url)
+        self.client.force_login(self.users[0])
+        # The same document for everyone, with no Vary: Cookie.
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+            since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(second.content, first.content)
+        self.assertNotIn('Vary', second)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(since.status_code, 304)
+
+    def test_new_post_changes_the_feed(self):
+        url = reverse('post-feed')
+        first = self.client.get(url)
+        post = Post.objects.create(title='Fresh news', content='New', author=self.users[0])
+        post.tags.add('django')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Fresh news', response.content.decode())
+
+    def test_pages_link_their_feeds(self):
+        content = self.client.get(reverse('post-by-tag', args=['tag1'])).content.decode()
+        self.assertIn(reverse('post-feed'), content)
+        self.assertIn(reverse('tag-feed', args=['tag1']), content)
+
+
+class SitemapTests(BlogTestData, TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        override = self.settings(BLOG_SITEMAP_DIR=self.directory, BLOG_SITE_URL='https://blog.example')
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name)) as f:
+            return f.read()
+
+    def test_build(self):
+        written = sitemaps.build_sitemaps()
+        self.assertEqual(written, ['sitemap-posts-0.xml', 'sitemap-tags-0.xml', 'sitemap.xml'])
+        posts = self.read('sitemap-posts-0.xml')
+        for post in self.posts:
+            self.assertIn('<loc>https://blog.example%s</loc>' % post.get_absolute_url(), posts)
+        self.assertIn('<loc>https://blog.example/tags/tag1/</loc>', self.read('sitemap-tags-0.xml'))
+        index = self.read('sitemap.xml')
+        self.assertIn('<loc>https://blog.example/sitemap-posts-0.xml</loc>', index)
+        self.assertIn('<loc>https://blog.example/sitemap-tags-0.xml</loc>', index)
+        # Nothing changed, nothing to write.
+        self.assertEqual(sitemaps.build_sitemaps(), [])
+
+    def test_missing_files_are_rebuilt(self):
+        sitemaps.build_sitemaps()
+        for name in ('sitemap-posts-0.xml', 'sitemap.xml'):
+            os.remove(os.path.join(self.directory, name))
+        self.assertEqual(sitemaps.build_sitemaps(), ['sitemap-posts-0.xml', 'sitemap.xml'])
+        self.assertIn(self.post.get_absolute_url(), self.read('sitemap-posts-0.xml'))
+        self.assertIn('sitemap-posts-0.xml', self.read('sitemap.xml'))
+
+    @patch('blog.sitemaps.SEGMENT_SIZE', 3)
+    def test_only_touched_segments_are_rebuilt(self):
+        sitemaps.build_sitemaps(force=True)
+        last = sitemaps.segment_of(self.post.pk)
+        self.assertGreater(last, 0)
+        first = self.posts[0]
+        first.title = 'Edited title'
+        first.save()
+        self.assertEqual(
+            sitemaps.build_sitemaps(),
+            ['sitemap-posts-%d.xml' % sitemaps.segment_of(first.pk), 'sitemap.xml'],
+        )
+        # A comment moves its post's lastmod.
+        Comment.objects.create(post=self.post, author=self.users[0], content='New')
+        self.assertEqual(sitemaps.build_sitemaps(), ['sitemap-posts-%d.xml' % last, 'sitemap.xml'])
+        # Segments stay within their key range.
+        for number in range(last + 1):
+            content = self.read('sitemap-posts-%d.xml' % number)
+            self.assertLessEqual(content.count('<url>'), 3)
+
+    @patch('blog.sitemaps.SEGMENT_SIZE', 3)
+    def test_emptied_segment_leaves_the_index(self):
+        sitemaps.build_sitemaps()
+        number = sitemaps.segment_of(self.posts[0].pk)
+        Post.objects.filter(pk__gte=number * 3, pk__lt=number * 3 + 3).delete()
+        sitemaps.build_sitemaps()
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'sitemap-posts-%d.xml' % number)))
+        self.assertNotIn('sitemap-posts-%d.xml' % number, self.read('sitemap.xml'))
+
+    def test_written_segments_stay_dirty_when_marked_meanwhile(self):
+        sitemaps.build_sitemaps()
+        sitemaps.mark_dirty('posts', [self.post.pk])
+        write_urlset = sitemaps._write_urlset
+
+        def edit_while_rendering(path, urls):
+            # A post saved while the segment is rendered.
+            sitemaps.mark_dirty('posts', [self.post.pk])
+            return write_urlset(path, urls)
+
+        with patch('blog.sitemaps._write_urlset', side_effect=edit_while_rendering):
+            self.assertEqual(sitemaps.build_sitemaps(), ['sitemap-posts-0.xml', 'sitemap.xml'])
+        self.assertTrue(SitemapSegment.objects.get(section='posts', number=0).dirty)
+        self.assertEqual(sitemaps.build_sitemaps(), ['sitemap-posts-0.xml', 'sitemap.xml'])
+        self.assertFalse(SitemapSegment.objects.get(section='posts', number=0).dirty)
+
+    def test_failed_write_keeps_the_segment_dirty(self):
+        sitemaps.build_sitemaps()
+        sitemaps.mark_dirty('posts', [self.post.pk])
+        with patch('blog.sitemaps._write_urlset', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                sitemaps.build_sitemaps()
+        self.assertTrue(SitemapSegment.objects.get(section='posts', number=0).dirty)
+        self.assertEqual(sitemaps.build_sitemaps(), ['sitemap-posts-0.xml', 'sitemap.xml'])
+
+    def test_index_view_builds_in_the_background(self):
+        with patch('blog.sitemaps.run_in_thread') as run_in_thread:
+            # Nothing on disk yet: the build is started, the crawler comes back later.
+            self.assertEqual(self.client.get(reverse('sitemap-index')).status_code, 404)
+            self.assertEqual(self.client.get(reverse('sitemap-index')).status_code, 404)
+        # One build at a time.
+        run_in_thread.assert_called_once()
+        build = run_in_thread.call_args.args[0]
+        build()
+        self.assertEqual(self.client.get(reverse('sitemap-index')).status_code, 200)
+
+    @patch('blog.sitemaps.run_in_thread', lambda func, name: func())
+    def test_served_from_disk(self):
+        response = self.client.get(reverse('sitemap-index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/xml')
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn(b'sitemap-posts-0.xml', b''.join(response.streaming_content))
+
+        url = reverse('sitemap-segment', args=['posts', 0])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            index = self.client.get(reverse('sitemap-index'))
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(index.status_code, 200)
+        self.assertEqual(self.client.get(reverse('sitemap-segment', args=['posts', 7])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('sitemap-segment', args=['users', 0])).status_code, 404)
+
+
+class ImportBlogDataTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.existing = Post.objects.create(title='Existing', content='Old', author=cls.author)
+        cls.existing.tags.add('django')
+
+    def import_file(self, content, suffix='.jsonl', **options):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'import' + suffix)
+        with open(path, 'w', newline='') as f:
+            f.write(content)
+        out, err = StringIO(), StringIO()
+        call_command('import_blog_data', path, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_jsonl(self):
+        lines = [
+            {'type': 'tag', 'name': 'Web Dev', 'slug': 'web-dev'},
+            {'title': 'First', 'content': 'Streaming imports', 'author': 'author',
+             'published_date': '2024-01-02T03:04:05', 'tags': ['django', 'Web Dev', 'python'],
+             'comments': [{'author': 'author', 'content': 'Nice', 'created_at': '2024-01-03T00:00:00'}]},
+            {'title': 'Second', 'author': 'author', 'tags': 'python, sqlite'},
+            {'type': 'comment', 'post': self.existing.pk, 'author': 'author', 'content': 'Late'},
+            {'title': 'Nobody', 'author': 'ghost'},
+            {'type': 'comment', 'post': 999999, 'author': 'author', 'content': 'Lost'},
+            {'title': ''},
+        ]
+        content = '\n'.join(json.dumps(line) for line in lines) + '\nnot json\n'
+        out, err = self.import_file(content, batch_size=3)
+        self.assertIn('Imported 2 posts, 2 comments and 3 new tags from 8 records', out)
+        self.assertIn('Skipped 4 invalid records.', out)
+        self.assertIn("Line 5: unknown author 'ghost'", err)
+        self.assertIn('Line 6: unknown post 999999', err)
+        self.assertIn('Line 7: title is required', err)
+        self.assertIn('Line 8: invalid JSON', err)
+
+        first = Post.objects.get(title='First')
+        self.assertEqual(first.published_date.year, 2024)
+        self.assertEqual(sorted(first.tags.names()), ['Web Dev', 'django', 'python'])
+        self.assertEqual(first.comment_count, 1)
+        self.assertEqual(first.last_comment_at.day, 3)
+        self.assertEqual(Post.objects.get(pk=self.existing.pk).comment_count, 1)
+        # Tag statistics and the search index are kept up to date.
+        self.assertEqual(TagStats.objects.get(tag__name='python').post_count, 2)
+        self.assertEqual(TagStats.objects.get(tag__name='django').post_count, 2)
+        if search_available():
+            response = self.client.get(reverse('search-posts'), {'q': 'streaming'})
+            self.assertEqual([post.title for post in response.context['posts']], ['First'])
+
+    def test_queries_per_batch_do_not_grow(self):
+        def import_posts(count):
+            lines = [
+                json.dumps({'title': 'Post %d' % i, 'author': 'author', 'tags': ['t%d' % i, 'common'],
+                            'comments': [{'author': 'author', 'content': 'Hi'}]})
+                for i in range(count)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                self.import_file('\n'.join(lines), batch_size=100)
+            return len(queries)
+
+        self.assertEqual(import_posts(5), import_posts(50))
+
+    def test_import_csv(self):
+        content = 'title,content,author,tags\nFrom CSV,Body,newcomer,"csv, django"\n'
+        out, err = self.import_file(content, suffix='.csv')
+        self.assertIn('Skipped 1 invalid records.', out)
+        self.assertIn("unknown author 'newcomer'", err)
+
+        out, _ = self.import_file(content, suffix='.csv', create_authors=True)
+        self.assertIn('Imported 1 posts', out)
+        post = Post.objects.get(title='From CSV')
+        self.assertEqual(post.author.username, 'newcomer')
+        self.assertFalse(post.author.has_usable_password())
+        self.assertEqual(sorted(post.tags.names()), ['csv', 'django'])
+
+    def test_slug_clash_reuses_the_tag(self):
+        self.import_file(json.dumps({'title': 'Clash', 'author': 'author', 'tags': ['Django']}))
+        self.assertEqual(list(Post.objects.get(title='Clash').tags.names()), ['django'])
+
+
+class ExportTests(BlogTestData, TestCase):
+
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', password='pass-word-1', is_staff=True)
+
+    def export(self, **params):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('export-posts'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_staff_only(self):
+        self.client.force_login(self.users[0])
+        response = self.client.get(reverse('export-posts'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_ndjson(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual([record['id'] for record in records], sorted(post.pk for post in self.posts))
+        last = records[-1]
+        self.assertEqual(last['author'], self.post.author.username)
+        self.assertEqual(last['tags'], sorted(self.post.tags.names()))
+        self.assertEqual(last['comment_count'], 6)
+
+    def test_csv_gzip(self):
+        response, content = self.export(format='csv', gzip='1')
+        self.assertIn('posts.csv.gz', response['Content-Disposition'])
+        rows = list(csv.DictReader(StringIO(gzip.decompress(content).decode())))
+        self.assertEqual(len(rows), len(self.posts))
+        self.assertEqual(rows[0]['tags'], 'django, tag0')
+
+    def test_unknown_format(self):
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse('export-posts'), {'format': 'xml'}).status_code, 400)
+
+    def test_tags_are_looked_up_per_chunk(self):
+        self.add_posts(12)
+        # One query for the posts, fetched chunk by chunk, and one tag query
+        # per chunk.
+        with self.assertNumQueries(3):
+            records = list(post_records(chunk_size=10))
+        self.assertEqual(len(records), 20)
+
+    def test_command_round_trips_through_import(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'posts.ndjson')
+        call_command('export_blog_data', output=path, chunk_size=3, stderr=StringIO())
+        tags = sorted(self.post.tags.names())
+        Post.objects.all().delete()
+        call_command('import_blog_data', path, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Post.objects.count(), len(self.posts))
+        imported = Post.objects.get(title=self.post.title)
+        self.assertEqual(sorted(imported.tags.names()), tags)
+        self.assertEqual(imported.published_date, self.post.published_date)
+
+
+class BenchmarkTests(BlogTestData, TestCase):
+
+    def test_benchmark_report(self):
+        report = BlogBenchmark(requests=3, concurrency=1, warmup=1, host='testserver', seed=1).run()
+        results = {result['name']: result for result in report['results']}
+        self.assertNotIn('logout', results)
+        for name in ('post-list', 'post-by-tag', 'search-posts', 'post-detail', 'comment-update'):
+            self.assertEqual(results[name]['requests'], 3)
+        self.assertEqual(results['post-list']['errors'], 0)
+        self.assertEqual(results['post-list']['status_codes'], {'200': 3})
+        # Anonymous pages come from the page cache once warmed up.
+        self.assertEqual(results['post-list']['queries_per_request'], {'mean': 0, 'max': 0})
+        self.assertEqual(set(results['post-detail']['latency_ms']), {'mean', 'p50', 'p95', 'p99', 'max'})
+
+    def test_logged_in_clients(self):
+        report = BlogBenchmark(
+            requests=2, concurrency=1, warmup=0, names=['post-list', 'profile'],
+            username='user0', host='testserver',
+        ).run()
+        results = {result['name']: result for result in report['results']}
+        self.assertEqual(results['profile']['status_codes'], {'200': 2})
+        self.assertGreater(results['post-list']['queries_per_request']['max'], 0)
+
+    def test_command_writes_json(self):
+        out = StringIO()
+        call_command(
+            'benchmark_blog', requests=2, concurrency=1, warmup=0, url=['post-list'],
+            host='testserver', stdout=out,
+        )
+        report = json.loads(out.getvalue())
+        self.assertEqual([result['name'] for result in report['results']], ['post-list'])
+        self.assertEqual(report['data']['posts'], 8)
+        self.assertEqual(report['results'][0]['status_codes'], {'200': 2})
+
+
+class PrefixIndexTests(TestCase):
+
+    def setUp(self):
+        self.index = PrefixIndex(limit=3, cached_prefix_length=2)
+        self.index.load([
+            (1, 'Django queries', 5, None),
+            (2, 'Django templates', 9, None),
+            (3, 'Deploying Python', 1, None),
+            (4, 'Async Django views', 7, None),
+            (5, 'Query caching', 3, None),
+        ])
+
+    def keys(self, query, limit=None):
+        return [key for key, *_ in self.index.suggest(query, limit)]
+
+    def test_prefix_lookup_is_ranked(self):
+        self.assertEqual(self.keys('djan'), [2, 4, 1])
+        self.assertEqual(self.keys('que'), [1, 5])
+        self.assertEqual(self.keys('DJANGO Qu'), [1])
+        self.assertEqual(self.keys('zzz'), [])
+        self.assertEqual(self.keys('  '), [])
+
+    def test_short_prefixes_keep_top_n(self):
+        self.assertEqual(self.keys('d'), [2, 4, 1])
+        self.assertEqual(self.index._top['d'], [2, 4, 1])
+        self.assertEqual(self.keys('d', limit=1), [2])
+        # Multi-word queries look past the remembered list.
+        self.assertEqual(self.keys('d py'), [3])
+
+    def test_remembered_prefixes_are_bounded(self):
+        index = PrefixIndex(limit=3, cached_prefixes=2)
+        index.load([(1, 'alpha', 0, None), (2, 'beta', 0, None), (3, 'gamma', 0, None)])
+        for query in ('a', 'b', 'a', 'g'):
+            index.suggest(query)
+        self.assertEqual(list(index._top), ['a', 'g'])
+
+    def test_updates(self):
+        self.keys('d')
+        self.index.add(6, 'Databases', 8)
+        self.assertEqual(self.keys('d'), [2, 6, 4])
+        self.index.remove(2)
+        self.assertEqual(self.keys('d'), [6, 4, 1])
+        self.assertEqual(self.keys('templ'), [])
+        self.index.adjust_score(3, 10)
+        self.assertEqual(self.keys('d'), [3, 6, 4])
+        self.index.adjust_score(3, -10)
+        self.assertEqual(self.keys('d'), [6, 4, 1])
+        self.index.add(1, 'Renamed post', 5)
+        self.assertEqual(self.keys('quer'), [5])
+        self.assertEqual(self.keys('ren'), [1])
+
+
+class AutocompleteTests(QueryBudgetMixin, BlogTestData, TestCase):
+
+    def setUp(self):
+        autocomplete.reset()
+        self.addCleanup(autocomplete.reset)
+
+    def test_endpoint(self):
+        url = reverse('autocomplete')
+        self.client.get(url, {'q': 'x'})
+        with self.assertNumQueries(0):
+            data = self.client.get(url, {'q': 'Dja'}).json()
+        self.assertEqual(data['tags'], [{'name': 'django', 'url': '/tags/django/', 'posts': 8}])
+        self.assertEqual(len(data['posts']), 8)
+        self.assertEqual(data['posts'][0], {'title': self.post.title, 'url': '/post/%d/' % self.post.pk})
+        data = self.client.get(url, {'q': 'post 3'}).json()
+        self.assertEqual([post['title'] for post in data['posts']], ['Post 3 about django'])
+        self.assertEqual(self.client.get(url).json()['posts'], [])
+
+    def committed(self):
+        """Run the on_commit hooks the block registers, as its commit would."""
+        return self.captureOnCommitCallbacks(execute=True)
+
+    def test_signals_keep_the_index_current(self):
+        suggest = autocomplete.suggestions
+        suggest('warm up')
+        with self.committed():
+            post = Post.objects.create(title='Brand new topic', content='x', author=self.users[0])
+            post.tags.add('newtag')
+        self.assertEqual([p['title'] for p in suggest('brand')['posts']], ['Brand new topic'])
+        self.assertEqual(suggest('newt')['tags'][0]['posts'], 1)
+        with self.committed():
+            post.tags.add('tag1')
+        self.assertEqual(suggest('tag1')['tags'][0]['posts'], 4)
+        with self.committed():
+            post.title = 'Renamed topic'
+            post.save()
+        self.assertEqual(suggest('brand')['posts'], [])
+        with self.committed():
+            post.delete()
+        self.assertEqual(suggest('renamed')['posts'], [])
+        self.assertEqual(suggest('newt')['tags'], [])
+        self.assertEqual(suggest('tag1')['tags'][0]['posts'], 3)
+        with self.committed():
+            Tag.objects.get(name='tag1').delete()
+        self.assertEqual(suggest('tag1')['tags'], [])
+        # This process applied its own writes, so it has nothing to rebuild.
+        with self.assertNumQueries(0):
+            suggest('tag')
+
+    def test_rolled_back_changes_are_not_applied(self):
+        suggest = autocomplete.suggestions
+        suggest('warm up')
+        version = autocomplete.current_version()
+        with self.committed() as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                post = Post.objects.create(title='Phantom topic', content='x', author=self.users[0])
+                post.tags.add('phantomtag', 'tag1')
+                self.post.title = 'Phantom title'
+                self.post.save()
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(autocomplete.current_version(), version)
+        self.assertEqual(suggest('phantom'), {'query': 'phantom', 'tags': [], 'posts': []})
+        self.assertEqual(suggest('tag1')['tags'][0]['posts'], 3)
+        self.assertEqual(suggest('post 7')['posts'][0]['title'], 'Post 7 about django')
+
+    def test_writes_from_other_processes(self):
+        suggest = autocomplete.suggestions
+        suggest('warm up')
+        # Another worker renames a post: the rows change and it journals the
+        # post under the next version, but no receiver runs here.
+        Post.objects.filter(pk=self.post.pk).update(title='Written elsewhere')
+        self.assertEqual(suggest('elsewhere')['posts'], [])
+        version = autocomplete.current_version() + 1
+        cache.set(autocomplete.JOURNAL_CACHE_KEY % version, {'posts': {self.post.pk}, 'tags': set()})
+        cache.set(autocomplete.VERSION_CACHE_KEY, version)
+        with self.assertNumQueries(1):  # only that post is reloaded
+            self.assertEqual(suggest('elsewhere')['posts'][0]['title'], 'Written elsewhere')
+        with self.assertNumQueries(0):
+            suggest('elsewhere')
+
+    def test_unreplayable_changes_rebuild_in_the_background(self):
+        suggest = autocomplete.suggestions
+        suggest('warm up')
+        Post.objects.filter(pk=self.post.pk).update(title='Written elsewhere')
+        # No journal entry, as after an eviction or reset().
+        cache.set(autocomplete.VERSION_CACHE_KEY, autocomplete.current_version() + 1)
+        with patch('blog.autocomplete.run_in_thread') as run_in_thread:
+            with self.assertNumQueries(0):
+                self.assertEqual(suggest('elsewhere')['posts'], [])
+            suggest('elsewhere')
+        # One rebuild per index, however many lookups come meanwhile.
+        self.assertEqual(len(run_in_thread.call_args_list), 2)
+        for call in run_in_thread.call_args_list:
+            call.args[0](*call.args[1:])
+        with self.assertNumQueries(0):
+            self.assertEqual(suggest('elsewhere')['posts'][0]['title'], 'Written elsewhere')
+
+    def test_indexes_expire(self):
+        suggest = autocomplete.suggestions
+        suggest('warm up')
+        Post.objects.filter(pk=self.post.pk).update(title='Written elsewhere')
+        with patch('blog.autocomplete.time.monotonic', return_value=time.monotonic() + 3600), \
+                patch('blog.autocomplete.run_in_thread', lambda func, *args, name: func(*args)):
+            self.assertEqual(suggest('elsewhere')['posts'][0]['title'], 'Written elsewhere')
+
+
+class RequestMetricsTests(BlogTestData, TestCase):
+
+    def setUp(self):
+        self.warm_caches()
+
+    def test_server_timing_and_log(self):
+        with self.assertLogs('request_metrics', 'INFO') as logs:
+            response = self.client.get(reverse('post-detail', args=[self.post.pk]))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="3 queries"')
+        self.assertIn('tpl;dur=', timing)
+        self.assertIn('total;dur=', timing)
+        data = json.loads(logs.records[0].getMessage())
+        self.assertEqual(data['view'], 'post-detail')
+        self.assertEqual(data['status'], 200)
+        self.assertEqual(data['db_queries'], 3)
+        self.assertEqual(data['duplicate_queries'], 0)
+        self.assertGreater(data['template_ms'], 0)
+        # Content version and page lookups miss the cache, the tag cloud hits.
+        self.assertGreaterEqual(data['cache_hits'], 1)
+        self.assertGreaterEqual(data['cache_misses'], 1)
+
+        with self.assertLogs('request_metrics', 'INFO') as logs:
+            self.client.get(reverse('post-detail', args=[self.post.pk]))
+        data = json.loads(logs.records[0].getMessage())
+        self.assertEqual(data['db_queries'], 0)
+        self.assertEqual(data['template_ms'], 0)
+
+    def test_duplicate_queries(self):
+        metrics = RequestMetrics()
+        with connection.execute_wrapper(metrics):
+            for post in Post.objects.all():
+                post.author.username
+        self.assertEqual(metrics.queries, 9)
+        [(sql, count)] = metrics.duplicates()
+        self.assertIn('auth_user', sql)
+        self.assertEqual(count, 8)
+
+    def test_sampling(self):
+        with self.settings(REQUEST_METRICS_SAMPLE_RATE=0), self.assertNoLogs('request_metrics'):
+            response = self.client.get(reverse('post-list'))
+        self.assertNotIn('Server-Timing', response)
+        with self.settings(REQUEST_METRICS_SERVER_TIMING=False), self.assertLogs('request_metrics'):
+            response = self.client.get(reverse('post-list'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_streaming_responses(self):
+        staff = User.objects.create_user('staff', password='pass-word-1', is_staff=True)
+        self.client.force_login(staff)
+        # Nothing is logged until the body has been sent.
+        with self.assertNoLogs('request_metrics'):
+            response = self.client.get(reverse('export-posts'))
+        with self.assertLogs('request_metrics', 'INFO') as logs:
+            b''.join(response.streaming_content)
+        data = json.loads(logs.records[0].getMessage())
+        self.assertEqual(data['view'], 'export-posts')
+        self.assertTrue(data['streamed'])
+        # The header went out before the body ran the export's queries.
+        before = int(re.search(r'db;dur=[\d.]+;desc="(\d+) queries"', response['Server-Timing'])[1])
+        self.assertGreaterEqual(data['db_queries'], before + 2)
+
+
+@override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+class SlowQueryLogTests(BlogTestData, TestCase):
+
+    def setUp(self):
+        self.warm_caches()
+        log_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(log_dir.cleanup)
+        self.log_file = os.path.join(log_dir.name, 'slow.log')
+
+    def read_log(self):
+        with open(self.log_file) as f:
+            return [json.loads(line) for line in f]
+
+    def test_normalize(self):
+        self.assertEqual(
+            normalize("SELECT * FROM t WHERE a = 'x''y' AND b IN (%s, %s,%s) LIMIT 21"),
+            'SELECT * FROM t WHERE a = ? AND b IN (...) LIMIT ?',
+        )
+        self.assertEqual(
+            fingerprint('SELECT "id" FROM t WHERE id = %s LIMIT 1'),
+            fingerprint('SELECT  "id" FROM t\nWHERE id = %s LIMIT 5'),
+        )
+
+    def test_slow_statements_are_logged_with_their_plan(self):
+        with self.settings(SLOW_QUERY_LOG_FILE=self.log_file), self.assertLogs('slow_queries', 'WARNING'):
+            self.client.get(reverse('post-detail', args=[self.post.pk]))
+        entries = self.read_log()
+        self.assertEqual(len(entries), 3)
+        comments = next(entry for entry in entries if 'blog_comment' in entry['sql'].split('FROM')[1])
+        self.assertEqual(comments['view'], 'post-detail')
+        self.assertEqual(comments['path'], '/post/%d/' % self.post.pk)
+        self.assertEqual(len(comments['fingerprint']), 16)
+        self.assertTrue(any('blog_comment_thread_idx' in row for row in comments['plan']))
+
+    def test_streaming_responses(self):
+        staff = User.objects.create_user('staff', password='pass-word-1', is_staff=True)
+        self.client.force_login(staff)
+        with self.settings(SLOW_QUERY_LOG_FILE=self.log_file), self.assertLogs('slow_queries', 'WARNING'):
+            response = self.client.get(reverse('export-posts'))
+            logged = len(self.read_log())
+            b''.join(response.streaming_content)
+        exported = [entry for entry in self.read_log()[logged:] if entry['view'] == 'export-posts']
+        self.assertTrue(any('FROM "blog_post"' in entry['sql'] for entry in exported))
+        self.assertTrue(any('taggit_taggeditem' in entry['sql'] for entry in exported))
+
+    def test_threshold(self):
+        with self.settings(SLOW_QUERY_THRESHOLD_MS=None, SLOW_QUERY_LOG_FILE=self.log_file):
+            with self.assertNoLogs('slow_queries'):
+                self.client.get(reverse('post-detail', args=[self.post.pk]))
+        self.assertFalse(os.path.exists(self.log_file))
+
+    def test_report(self):
+        with self.settings(SLOW_QUERY_LOG_FILE=self.log_file), self.assertLogs('slow_queries'):
+            for post in self.posts[:3]:
+                self.client.get(reverse('post-detail', args=[post.pk]))
+            self.client.get(reverse('post-list'), {'q': 'django'})
+            out = StringIO()
+            call_command('slow_query_report', json=True, limit=100, stdout=out)
+        summary = json.loads(out.getvalue())
+        detail = [group for group in summary if 'post-detail' in group['views']]
+        # One fingerprint per statement, whatever the post id.
+        self.assertEqual(len(detail), 3)
+        self.assertTrue(all(group['count'] >= 3 for group in detail))
+        self.assertEqual(sum(group['count'] for group in summary), len(self.read_log()))
+
+        out = StringIO()
+        call_command('slow_query_report', file=self.log_file, sort='count', limit=2, stdout=out)
+        self.assertIn('1. ', out.getvalue())
+        self.assertNotIn('3. ', out.getvalue())
+
+
+class SQLiteTuningTests(TestCase):
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA %s' % name)
+            return cursor.fetchone()[0]
+
+    def test_pragmas_are_applied(self):
+        connection.close()
+        connection.ensure_connection()
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('temp_store'), 2)  # MEMORY
+        self.assertEqual(self.pragma('cache_size'), -20000)
+        # WAL is for database files; the test database lives in memory.
+        self.assertEqual(self.pragma('journal_mode'), 'memory')
+
+    def test_wal_on_file_databases(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_dict = dict(connection.settings_dict, NAME=os.path.join(directory.name, 'db.sqlite3'))
+        wrapper = type(connections['default'])(settings_dict, alias='tuning-test')
+        try:
+            with wrapper.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                self.assertEqual(cursor.fetchone()[0], 'wal')
+                cursor.execute('PRAGMA synchronous')
+                self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+        finally:
+            wrapper.close()
+
+    def test_invalid_pragma(self):
+        with self.settings(SQLITE_PRAGMAS={'cache_size': '1; DROP TABLE blog_post'}):
+            with self.assertRaises(ValueError):
+                apply_pragmas(None, connection)
+
+
+class RetryOnLockTests(SimpleTestCase):
+
+    def flaky(self, failures, error='database is locked'):
+        calls = []
+
+        def write():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise OperationalError(error)
+            return 'done'
+        return write, calls
+
+    @patch('perftools.sqlite_tuning.time.sleep')
+    def test_retries_with_backoff(self, sleep):
+        write, calls = self.flaky(2)
+        self.assertEqual(retry_on_lock(write)(), 'done')
+        self.assertEqual(len(calls), 3)
+        first, second = [call.args[0] for call in sleep.call_args_list]
+        self.assertLessEqual(first, 0.05)
+        self.assertLessEqual(second, 0.1)
+
+    @patch('perftools.sqlite_tuning.time.sleep')
+    def test_gives_up(self, sleep):
+        write, calls = self.flaky(5)
+        with self.assertRaises(OperationalError):
+            retry_on_lock(retries=2)(write)()
+        self.assertEqual(len(calls), 3)
+
+    @patch('perftools.sqlite_tuning.time.sleep')
+    def test_other_errors_and_open_transactions_are_not_retried(self, sleep):
+        write, calls = self.flaky(1, error='no such table: x')
+        with self.assertRaises(OperationalError):
+            retry_on_lock(write)()
+        self.assertEqual(len(calls), 1)
+
+        write, calls = self.flaky(1)
+        with patch.object(connection, 'in_atomic_block', True), self.assertRaises(OperationalError):
+            retry_on_lock(write)()
+        self.assertEqual(len(calls), 1)
+        sleep.assert_not_called()
+
+
+@patch('perftools.sqlite_tuning.time.sleep')
+class RetriedWriteViewTests(TransactionTestCase):
+    # Outside a test transaction, as retry_on_lock never retries inside one.
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('writer', password='pass-word-1')
+        self.post = Post.objects.create(title='Existing', content='Body', author=self.user)
+        self.client.force_login(self.user)
+
+    def locked_once(self, target):
+        """Patch ``target`` to fail with a lock error on its first call only."""
+        calls = []
+
+        def side_effect(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+        return patch(target, side_effect=side_effect), calls
+
+    def test_post_create_is_not_duplicated(self, sleep):
+        # The search index is written after the post's INSERT.
+        locked, calls = self.locked_once('blog.search.index_post')
+        with locked:
+            response = self.client.post(
+                reverse('post-create'), {'title': 'Retried', 'content': 'Once', 'tags': 'retry'},
+            )
+        self.assertEqual(response.status_code, 302)
+        sleep.assert_called_once()
+        post = Post.objects.get(title='Retried')
+        self.assertEqual(list(post.tags.names()), ['retry'])
+        self.assertEqual(TagStats.objects.get(tag__name='retry').post_count, 1)
+
+    def test_comment_create_is_not_duplicated(self, sleep):
+        # The post's comment counters are updated after the comment's INSERT.
+        for url in (reverse('comment-create', args=[self.post.pk]), reverse('post-detail', args=[self.post.pk])):
+            locked, calls = self.locked_once('blog.comment_stats.record_comment_added')
+            with locked:
+                self.client.post(url, {'content': 'Retried from %s' % url})
+            self.assertEqual(len(calls), 2)
+            self.assertEqual(Comment.objects.filter(content='Retried from %s' % url).count(), 1)
+
+    def test_gives_up_without_leaving_rows(self, sleep):
+        with patch('blog.search.index_post', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                self.client.post(reverse('post-create'), {'title': 'Never', 'content': 'x', 'tags': 'gone'})
+        self.assertFalse(Post.objects.filter(title='Never').exists())
+        self.assertFalse(Tag.objects.filter(name='gone').exists())
+
+
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    router = PrimaryReplicaRouter()
+
+    def test_reads_go_to_the_replica(self):
+        self.assertEqual(self.router.db_for_read(Post), 'replica')
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+
+    def test_pinned_reads_go_to_the_primary(self):
+        with pin_to_primary():
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+        self.assertEqual(self.router.db_for_read(Post), 'replica')
+
+    def test_reads_in_a_transaction_go_to_the_primary(self):
+        with patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_no_read_alias(self):
+        with self.settings(DATABASE_READ_ALIAS=None):
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_only_the_primary_is_migrated(self):
+        self.assertTrue(self.router.allow_migrate('default', 'blog'))
+        self.assertFalse(self.router.allow_migrate('replica', 'blog'))
+
+
+class ReadReplicaTests(TransactionTestCase):
+    # Outside a test transaction, so reads really leave the primary.
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('writer', password='pass-word-1')
+        self.post = Post.objects.create(title='Replicated', content='Body', author=self.user)
+
+    def get(self, url):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(primary), len(replica)
+
+    def test_replica_is_read_only(self):
+        with self.assertRaisesMessage(OperationalError, 'readonly'):
+            Post.objects.using('replica').update(title='Changed')
+
+    def test_reads_use_the_replica(self):
+        primary, replica = self.get(reverse('post-list'))
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_reads_after_a_post_stay_on_the_primary(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('comment-create', args=[self.post.pk]), {'content': 'Mine'},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+
+        primary, replica = self.get(reverse('post-detail', args=[self.post.pk]))
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+        # Once the window is over, reads go back to the replica.
+        self.client.cookies[PRIMARY_COOKIE] = '0'
+        primary, replica = self.get(reverse('post-detail', args=[self.post.pk]))
+        self.assertGreater(replica, 0)
@@ -1,6 +1,6 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import feeds, views
 from .views import (
     PostListView,
     PostByTagListView, # <--- Ensure this is imported
@@ -8,6 +8,7 @@ from .views import (
     CommentUpdateView, 
     CommentDeleteView,
     CommentCreateView,
+    PostCommentsView,
     PostCreateView,
     PostUpdateView,
     PostDeleteView
@@ -25,7 +26,19 @@ urlpatterns = [
     # Advanced Features URLs
     # FIX: Use ONLY the new class for tags
     path('tags/<slug:tag_slug>/', PostByTagListView.as_view(), name='post-by-tag'),
+    path('tags/<slug:tag_slug>/feed/', feeds.tag_posts_rss, name='tag-feed'),
+    path('tags/<slug:tag_slug>/feed/atom/', feeds.tag_posts_atom, name='tag-feed-atom'),
     path('search/', PostListView.as_view(), name='search-posts'),
+    path('search/autocomplete/', views.autocomplete, name='autocomplete'),
+    path('export/posts/', views.export_posts, name='export-posts'),
+
+    # Feeds
+    path('feed/', feeds.latest_posts_rss, name='post-feed'),
+    path('feed/atom/', feeds.latest_posts_atom, name='post-feed-atom'),
+
+    # Sitemaps, built by blog/sitemaps.py and served from disk
+    path('sitemap.xml', views.sitemap_index, name='sitemap-index'),
+    path('sitemap-<slug:section>-<int:number>.xml', views.sitemap_segment, name='sitemap-segment'),
 
     # Post URLs
     path('', PostListView.as_view(), name='post-list'),
@@ -36,6 +49,7 @@ urlpatterns = [
     path('post/<int:pk>/delete/', PostDeleteView.as_view(), name='post-delete'),
     
     # Comment URLs
+    path('post/<int:pk>/comments/', PostCommentsView.as_view(), name='post-comments'),
     path('post/<int:pk>/comments/new/', CommentCreateView.as_view(), name='comment-create'),
     path('comment/<int:pk>/update/', CommentUpdateView.as_view(), name='comment-update'),
     path('comment/<int:pk>/delete/', CommentDeleteView.as_view(), name='comment-delete'),
@@ -1,15 +1,29 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse,
+)
+from django.template.loader import render_to_string
 from django.contrib.auth import login
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.views.generic.edit import FormMixin 
 from django.urls import reverse
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.db.models import Q 
+from django.db.models import Q
+from django.utils.decorators import method_decorator
 from django.views.generic import (
-    ListView, DetailView, CreateView, UpdateView, DeleteView
+    ListView, DetailView, CreateView, UpdateView, DeleteView, View
 )
+from perftools.sqlite_tuning import retry_on_lock
+
+from .autocomplete import suggestions
+from .exporter import FORMATS, export_filename, export_stream
 from .models import Post, Comment 
+from .page_cache import AnonymousPageCacheMixin
+from .pagination import CursorPaginationMixin, CursorPaginator, InvalidCursor
+from .search import SearchResults, search_available
+from .sitemaps import INDEX_FILE, SECTIONS, segment_filename, sitemap_response
 # Import PostForm here so we can use it in the views!
 from .forms import CustomUserCreationForm, UserUpdateForm, CommentForm, PostForm
 
@@ -43,16 +57,22 @@ def profile(request):
 # POST VIEWS
 # ==========================
 
-class PostListView(ListView):
+class PostListView(AnonymousPageCacheMixin, CursorPaginationMixin, ListView):
     model = Post
     template_name = 'blog/post_list.html'
     context_object_name = 'posts'
-    ordering = ['-published_date']
+    ordering = ['-published_date', '-id']
     paginate_by = 5 
 
     def get_queryset(self):
         # FIX FOR CHECKER: Explicitly use Post.objects.filter
-        queryset = Post.objects.filter(pk__isnull=False).order_by('-published_date')
+        queryset = (
+            Post.objects.filter(pk__isnull=False)
+            # Authors come with the posts; tags are prefetched by the card
+            # cache only for the cards it has to render (blog/cards.py).
+            .select_related('author')
+            .order_by('-published_date', '-id')
+        )
         
         # 1. TAG FILTERING
         tag_slug = self.kwargs.get('tag_slug')
@@ -62,23 +82,100 @@ class PostListView(ListView):
         # 2. SEARCH FUNCTIONALITY
         query = self.request.GET.get('q')
         if query:
+            # Use the FTS5 index when it is there: ranked results with
+            # highlighted snippets instead of a LIKE scan over every post.
+            if search_available():
+                return SearchResults(
+                    query,
+                    Post.objects.select_related('author').prefetch_related('tags'),
+                    restrict_to=queryset if tag_slug else None,
+                )
             # FIX FOR CHECKER: Includes "tags__name__icontains"
             queryset = queryset.filter(
                 Q(title__icontains=query) | 
                 Q(content__icontains=query) |
                 Q(tags__name__icontains=query)
             ).distinct()
+
+        # 3. "MOST DISCUSSED" ORDERING, served by blog_post_discussed_idx
+        if self.get_sort() == 'discussed':
+            queryset = queryset.order_by('-comment_count', '-published_date', '-id')
             
         return queryset
 
-class PostDetailView(FormMixin, DetailView):
+    def get_sort(self):
+        return 'discussed' if self.request.GET.get('sort') == 'discussed' else 'newest'
+
+    def use_cursor_pagination(self):
+        # Cursors follow published_date, so "most discussed" pages by number.
+        return self.get_sort() == 'newest' and super().use_cursor_pagination()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['search_query'] = self.request.GET.get('q', '')
+        context['sort'] = self.get_sort()
+        return context
+
+def autocomplete(request):
+    """
+    Type-ahead for the search box: tags and post titles with a word starting
+    with each word of ?q=, answered from the in-memory prefix index.
+    """
+    query = request.GET.get('q', '')[:100]
+    response = JsonResponse(suggestions(query))
+    # Suggestions are hints; a minute of staleness is fine.
+    response['Cache-Control'] = 'max-age=60'
+    return response
+
+@staff_member_required
+def export_posts(request):
+    """
+    Download every post with its author, tags and comment counts, streamed
+    as ?format=ndjson (default) or csv, gzipped with ?gzip=1.
+    """
+    fmt = request.GET.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return HttpResponseBadRequest('Unknown format; use one of: %s.' % ', '.join(FORMATS))
+    compress = request.GET.get('gzip') in ('1', 'true', 'yes')
+    response = StreamingHttpResponse(
+        export_stream(fmt, compress),
+        content_type='application/gzip' if compress else FORMATS[fmt][0],
+    )
+    response['Content-Disposition'] = 'attachment; filename="%s"' % export_filename(fmt, compress)
+    return response
+
+def sitemap_index(request):
+    """The sitemap index, pointing at the segment files (see blog/sitemaps.py)."""
+    return sitemap_response(request, INDEX_FILE)
+
+
+def sitemap_segment(request, section, number):
+    if section not in SECTIONS:
+        raise Http404('No such sitemap.')
+    return sitemap_response(request, segment_filename(section, number))
+
+# Writes are re-run when SQLite stays locked past busy_timeout; each attempt
+# builds its form from the request again (see perftools/sqlite_tuning.py).
+# An attempt is one transaction: the row, its tags and what the signal
+# receivers derive from it (search index, tag and comment statistics,
+# sitemap segments) commit together or, when the lock error comes halfway,
+# are rolled back before the next attempt.
+@method_decorator(retry_on_lock(atomic=True), name='post')
+class PostDetailView(AnonymousPageCacheMixin, FormMixin, DetailView):
     model = Post
     template_name = 'blog/post_detail.html'
     form_class = CommentForm
 
+    def get_queryset(self):
+        # The post's author and tags come up front; comments are paged
+        # separately by get_comment_page().
+        return Post.objects.select_related('author').prefetch_related('tags')
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['form'] = self.get_form()
+        context['post_id'] = self.object.pk
+        context['comments_page'] = get_comment_page(self.object.pk)
         return context
 
     def get_success_url(self):
@@ -101,6 +198,7 @@ class PostDetailView(FormMixin, DetailView):
         comment.save()
         return super().form_valid(form)
 
+@method_decorator(retry_on_lock(atomic=True), name='post')
 class PostCreateView(LoginRequiredMixin, CreateView):
     model = Post
     # FIX FOR CHECKER: Use form_class instead of fields
@@ -111,6 +209,7 @@ class PostCreateView(LoginRequiredMixin, CreateView):
         form.instance.author = self.request.user
         return super().form_valid(form)
 
+@method_decorator(retry_on_lock(atomic=True), name='post')
 class PostUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     model = Post
     # FIX FOR CHECKER: Use form_class instead of fields
@@ -123,10 +222,12 @@ class PostUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
 
     def test_func(self):
         post = self.get_object()
-        if self.request.user == post.author:
+        # Compare ids so the permission check does not load the author.
+        if self.request.user.pk == post.author_id:
             return True
         return False
 
+@method_decorator(retry_on_lock(atomic=True), name='post')
 class PostDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     model = Post
     success_url = '/'
@@ -134,7 +235,7 @@ class PostDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
 
     def test_func(self):
         post = self.get_object()
-        if self.request.user == post.author:
+        if self.request.user.pk == post.author_id:
             return True
         return False
 
@@ -142,6 +243,59 @@ class PostDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
 # COMMENT VIEWS
 # ==========================
 
+COMMENTS_PER_PAGE = 20
+
+def get_comment_page(post_id, cursor=None):
+    """
+    One page of a post's comments, newest first, with their authors joined in
+    the same query. Raises InvalidCursor for a bad cursor.
+    """
+    return comment_paginator(post_id).page(cursor)
+
+def comment_paginator(post_id):
+    comments = Comment.objects.filter(post_id=post_id).select_related('author')
+    return CursorPaginator(comments, COMMENTS_PER_PAGE, date_field='created_at')
+
+class PostCommentsView(AnonymousPageCacheMixin, View):
+    """
+    Further pages of a post's comments for the "Load more" button: an HTML
+    fragment by default, JSON with ?format=json.
+    """
+
+    def get(self, request, pk):
+        if not Post.objects.filter(pk=pk).exists():
+            raise Http404('No post found matching the query')
+        try:
+            page = get_comment_page(pk, request.GET.get('cursor'))
+        except InvalidCursor as e:
+            raise Http404(str(e))
+
+        next_url = None
+        if page.has_next():
+            next_url = '%s?cursor=%s' % (reverse('post-comments', kwargs={'pk': pk}), page.next_cursor)
+
+        if request.GET.get('format') == 'json':
+            return JsonResponse({
+                'comments': [
+                    {
+                        'id': comment.pk,
+                        'author': str(comment.author),
+                        'content': comment.content,
+                        'created_at': comment.created_at.isoformat(),
+                    }
+                    for comment in page
+                ],
+                'next_cursor': page.next_cursor,
+                'next_url': next_url,
+            })
+        html = render_to_string(
+            'blog/comment_list.html',
+            {'comments_page': page, 'post_id': pk},
+            request=request,
+        )
+        return HttpResponse(html)
+
+@method_decorator(retry_on_lock(atomic=True), name='post')
 class CommentCreateView(LoginRequiredMixin, CreateView):
     model = Comment
     form_class = CommentForm
@@ -156,18 +310,23 @@ class CommentCreateView(LoginRequiredMixin, CreateView):
     def get_success_url(self):
         return reverse('post-detail', kwargs={'pk': self.kwargs['pk']})
 
-        class PostByTagListView(ListView):
+class PostByTagListView(AnonymousPageCacheMixin, CursorPaginationMixin, ListView):
     model = Post
     template_name = 'blog/post_list.html' # Reuse the same template
     context_object_name = 'posts'
-    ordering = ['-published_date']
+    ordering = ['-published_date', '-id']
     paginate_by = 5
 
     def get_queryset(self):
         # FIX FOR CHECKER: Explicitly filter by tag in this dedicated view
         tag_slug = self.kwargs.get('tag_slug')
-        return Post.objects.filter(tags__slug=tag_slug).order_by('-published_date')
+        return (
+            Post.objects.filter(tags__slug=tag_slug)
+            .select_related('author')
+            .order_by('-published_date', '-id')
+        )
 
+@method_decorator(retry_on_lock(atomic=True), name='post')
 class CommentUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     model = Comment
     fields = ['content']
@@ -179,20 +338,21 @@ class CommentUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
 
     def test_func(self):
         comment = self.get_object()
-        return self.request.user == comment.author
+        return self.request.user.pk == comment.author_id
 
     def get_success_url(self):
-        return reverse('post-detail', kwargs={'pk': self.object.post.pk})
+        return reverse('post-detail', kwargs={'pk': self.object.post_id})
 
+@method_decorator(retry_on_lock(atomic=True), name='post')
 class CommentDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     model = Comment
     template_name = 'blog/comment_confirm_delete.html'
 
     def test_func(self):
         comment = self.get_object()
-        return self.request.user == comment.author
+        return self.request.user.pk == comment.author_id
 
     def get_success_url(self):
-        return reverse('post-detail', kwargs={'pk': self.object.post.pk})
+        return reverse('post-detail', kwargs={'pk': self.object.post_id})
 
         
@@ -10,11 +10,18 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# The perftools app (see perftools/__init__.py) is shared by the projects of
+# this repository and lives at its root.
+REPO_DIR = BASE_DIR.parent
+if str(REPO_DIR) not in sys.path:
+    sys.path.append(str(REPO_DIR))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -40,8 +47,12 @@ INSTALLED_APPS = [
     # Add your app here
     'blog', 
     'taggit',
+    'perftools',
 ]
 MIDDLEWARE = [
+    'perftools.instrumentation.RequestMetricsMiddleware',
+    'perftools.slow_queries.SlowQueryMiddleware',
+    'perftools.db_router.ReadYourWritesMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,6 +62,19 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-request SQL, template and cache metrics (see perftools/instrumentation.py):
+# a Server-Timing header and a JSON line on the "request_metrics" logger.
+# Lower the sample rate to keep it on in production; 0 turns it off.
+REQUEST_METRICS_SAMPLE_RATE = 1.0
+REQUEST_METRICS_SERVER_TIMING = True
+
+# Log statements slower than SLOW_QUERY_THRESHOLD_MS with their query plan
+# (see perftools/slow_queries.py); None turns it off. Summarize
+# SLOW_QUERY_LOG_FILE with "manage.py slow_query_report".
+SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_EXPLAIN = True
+SLOW_QUERY_LOG_FILE = BASE_DIR / 'slow_queries.log'
+
 ROOT_URLCONF = 'django_blog.urls'
 
 STATICFILES_DIRS = [
@@ -60,6 +84,51 @@ STATICFILES_DIRS = [
 LOGIN_REDIRECT_URL = '/profile/'  
 LOGIN_URL = '/login/'
 
+# Page the post lists on (published_date, id) cursors instead of OFFSET.
+# Skips the COUNT query; ?page=N links still work for shallow pages.
+BLOG_CURSOR_PAGINATION = False
+
+# Number of tags kept in the cached tag cloud / popular tags sidebar.
+BLOG_TAG_CLOUD_SIZE = 30
+
+# How long rendered post cards stay in the cache. Keys are versioned, so this
+# only bounds how long unused versions linger.
+BLOG_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Serve the list, tag and detail pages to logged-out readers from the cache.
+# Any post, comment or tag write retires every cached page.
+BLOG_PAGE_CACHE = True
+BLOG_PAGE_CACHE_TIMEOUT = 60 * 5
+# The feeds (blog/feeds.py) are cached for logged-in readers too.
+BLOG_FEED_CACHE_TIMEOUT = 60 * 5
+
+# The page and feed cache (and the type-ahead index) tell the processes
+# about each other's writes through a version in the default cache. The
+# default LocMemCache is per process, so it only works for a single one
+# (runserver): other workers serve stale pages and feeds until the timeouts.
+# With more workers, make the default cache one they all share, with an
+# atomic incr(); "manage.py check --deploy" warns until then:
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#         'LOCATION': 'redis://127.0.0.1:6379',
+#     },
+# }
+
+# Serve the list, tag, search and detail pages with the async views in
+# blog/async_views.py. Only pays off under an ASGI server (django_blog.asgi).
+BLOG_ASYNC_VIEWS = False
+
+# The search box's type-ahead index (blog/autocomplete.py) replays the posts
+# and tags other processes changed (journaled in the cache), and is rebuilt
+# in the background at the latest after this many seconds.
+BLOG_AUTOCOMPLETE_MAX_AGE = 60 * 5
+
+# Segmented sitemaps (blog/sitemaps.py): written to BLOG_SITEMAP_DIR by
+# "manage.py build_sitemaps", with URLs under BLOG_SITE_URL.
+BLOG_SITE_URL = 'http://localhost:8000'
+BLOG_SITEMAP_DIR = BASE_DIR / 'sitemaps'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -70,6 +139,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'blog.context_processors.popular_tags',
             ],
         },
     },
@@ -89,8 +159,52 @@ DATABASES = {
         'PASSWORD': '',  # <--- Checker might check this too
         'HOST': '',      # <--- Checker might check this too
         'PORT': '',
-    }
+        # Reuse connections for a minute, checking them before reuse, so the
+        # PRAGMAs are not re-run on every request.
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # BEGIN IMMEDIATE takes the write lock up front, so busy_timeout
+            # applies instead of a deadlock error on lock upgrade.
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    # Read alias: the same file, opened with PRAGMA query_only (see
+    # SQLITE_READ_ONLY_ALIASES). Point it at a replica later.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
+}
+
+# PRAGMAs run on every new SQLite connection (see perftools/sqlite_tuning.py).
+# WAL lets readers carry on while a write commits; busy_timeout (ms) makes a
+# writer wait for the lock instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',        # safe with WAL, fsyncs only at checkpoints
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -20000,           # negative means KiB, so about 20 MB
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,
 }
+# Writes still hitting the lock are retried by
+# perftools.sqlite_tuning.retry_on_lock, waiting up to SQLITE_LOCK_BACKOFF
+# seconds, doubled on each retry.
+SQLITE_LOCK_RETRIES = 3
+SQLITE_LOCK_BACKOFF = 0.05
+SQLITE_READ_ONLY_ALIASES = ['replica']
+
+# Reads go to DATABASE_READ_ALIAS, writes to default (see perftools/db_router.py).
+# After a POST the same browser reads from default for READ_YOUR_WRITES_SECONDS.
+DATABASE_ROUTERS = ['perftools.db_router.PrimaryReplicaRouter']
+DATABASE_READ_ALIAS = 'replica'
+READ_YOUR_WRITES_SECONDS = 5
 
 
 # Password validation
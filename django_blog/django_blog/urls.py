@@ -16,11 +16,13 @@ Including another URLconf
 """
 
 
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     # This line connects the main project to your blog app
-    path('', include('blog.urls')), 
+    # BLOG_ASYNC_VIEWS serves the read-only pages from blog/async_views.py
+    path('', include('blog.async_urls' if settings.BLOG_ASYNC_VIEWS else 'blog.urls')),
 ]
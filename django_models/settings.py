@@ -38,9 +38,13 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'relationship_app',
+    'perftools',
 ]
 
 MIDDLEWARE = [
+    'perftools.instrumentation.RequestMetricsMiddleware',
+    'perftools.slow_queries.SlowQueryMiddleware',
+    'perftools.db_router.ReadYourWritesMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,6 +54,19 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-request SQL, template and cache metrics (see perftools/instrumentation.py):
+# a Server-Timing header and a JSON line on the "request_metrics" logger.
+# Lower the sample rate to keep it on in production; 0 turns it off.
+REQUEST_METRICS_SAMPLE_RATE = 1.0
+REQUEST_METRICS_SERVER_TIMING = True
+
+# Log statements slower than SLOW_QUERY_THRESHOLD_MS with their query plan
+# (see perftools/slow_queries.py); None turns it off. Summarize
+# SLOW_QUERY_LOG_FILE with "manage.py slow_query_report".
+SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_EXPLAIN = True
+SLOW_QUERY_LOG_FILE = BASE_DIR / 'slow_queries.log'
+
 ROOT_URLCONF = 'django_models.urls'
 
 TEMPLATES = [
@@ -77,8 +94,69 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # Reuse connections for a minute, checking them before reuse, so the
+        # PRAGMAs are not re-run on every request.
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # BEGIN IMMEDIATE takes the write lock up front, so busy_timeout
+            # applies instead of a deadlock error on lock upgrade.
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    # Read alias: the same file, opened with PRAGMA query_only (see
+    # SQLITE_READ_ONLY_ALIASES). Point it at a replica later.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
+}
+
+# PRAGMAs run on every new SQLite connection (see perftools/sqlite_tuning.py).
+# WAL lets readers carry on while a write commits; busy_timeout (ms) makes a
+# writer wait for the lock instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',        # safe with WAL, fsyncs only at checkpoints
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -20000,           # negative means KiB, so about 20 MB
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,
 }
+# Writes still hitting the lock are retried by
+# perftools.sqlite_tuning.retry_on_lock, waiting up to SQLITE_LOCK_BACKOFF
+# seconds, doubled on each retry.
+SQLITE_LOCK_RETRIES = 3
+SQLITE_LOCK_BACKOFF = 0.05
+SQLITE_READ_ONLY_ALIASES = ['replica']
+
+# Reads go to DATABASE_READ_ALIAS, writes to default (see perftools/db_router.py).
+# After a POST the same browser reads from default for READ_YOUR_WRITES_SECONDS.
+DATABASE_ROUTERS = ['perftools.db_router.PrimaryReplicaRouter']
+DATABASE_READ_ALIAS = 'replica'
+READ_YOUR_WRITES_SECONDS = 5
+
+# Book list pages (?page=N or ?cursor=<pk>) and the chunks of the streamed
+# list (?stream=1); see relationship_app/pagination.py.
+RELATIONSHIP_PAGE_SIZE = 50
+RELATIONSHIP_STREAM_CHUNK_SIZE = 500
+
+# The library membership index (relationship_app/membership.py) lives in each
+# process and learns about the other processes' changes from a version in the
+# default cache. The default LocMemCache is per process, so it only works for
+# a single one (runserver). With more workers, make the default cache one they
+# all share, with an atomic incr(); "manage.py check --deploy" warns until then:
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#         'LOCATION': 'redis://127.0.0.1:6379',
+#     },
+# }
 
 
 # Password validation
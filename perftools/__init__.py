@@ -0,0 +1,17 @@
+"""
+Performance tooling shared by the Django projects of this repository.
+
+* ``perftools.caches``: the deploy check for a cache every process shares.
+* ``perftools.db_router``: the primary/read-alias router and
+  ReadYourWritesMiddleware.
+* ``perftools.instrumentation``: per-request SQL, template and cache metrics.
+* ``perftools.slow_queries``: the slow-query log, summarized by
+  ``manage.py slow_query_report``.
+* ``perftools.sqlite_tuning``: PRAGMAs for every SQLite connection and
+  ``retry_on_lock`` for writes.
+* ``perftools.streaming``: lets the middleware measure the body of
+  streaming responses.
+
+Each project adds the repository root to ``sys.path`` in its settings and
+lists ``perftools`` in INSTALLED_APPS.
+"""
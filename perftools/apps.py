@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class PerftoolsConfig(AppConfig):
+    name = 'perftools'
+    verbose_name = 'Performance tools'
+
+    def ready(self):
+        # Tune every SQLite connection the project opens.
+        from .sqlite_tuning import install
+        install()
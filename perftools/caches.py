@@ -0,0 +1,44 @@
+"""
+Deploy check for state the processes share through the default cache.
+
+Several features keep a version in the cache and let every process see the
+others' writes through it: the blog's page and feed cache and its type-ahead
+index, the library membership index. That only works when the default cache
+is one every process talks to, with an atomic ``incr()`` (Memcached,
+Redis). With a per-process cache each worker only sees its own writes.
+
+shared_cache_check() builds the check; apps register it with
+``deploy=True``, so ``manage.py check --deploy`` warns.
+"""
+from django.conf import settings
+from django.core import checks
+from django.core.cache import DEFAULT_CACHE_ALIAS
+
+# Cache backends such a version cannot be shared through: they live in one
+# process, or two processes bumping at once can both write the same version.
+UNSHARED_CACHES = {
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.filebased.FileBasedCache',
+    'django.core.cache.backends.db.DatabaseCache',
+}
+
+
+def shared_cache_check(feature, id, see):
+    """
+    A system check warning that ``feature`` (documented in ``see``) needs a
+    shared default cache, with the check ``id``.
+    """
+
+    def check(app_configs=None, **kwargs):
+        backend = settings.CACHES.get(DEFAULT_CACHE_ALIAS, {}).get('BACKEND')
+        if backend not in UNSHARED_CACHES:
+            return []
+        return [checks.Warning(
+            "%s cannot tell the processes about each other's changes through %s." % (feature, backend),
+            hint='Use one cache for every process with an atomic incr(), such as '
+                 'Memcached or Redis, as the default cache (see %s).' % see,
+            id=id,
+        )]
+
+    return check
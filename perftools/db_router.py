@@ -0,0 +1,90 @@
+"""
+Read/write split between the primary database and a read alias.
+
+PrimaryReplicaRouter sends writes to ``default``. It sends reads to
+``DATABASE_READ_ALIAS``. For now that alias opens the same SQLite file with
+``PRAGMA query_only`` (SQLITE_READ_ONLY_ALIASES in
+perftools/sqlite_tuning.py). In WAL mode its reads never wait for a write
+transaction. Later it can point at a real replica.
+
+Reads stay on the primary:
+
+* inside a transaction on the primary, so a transaction sees its own
+  writes;
+* while ReadYourWritesMiddleware handles a POST (or any unsafe method);
+* for ``READ_YOUR_WRITES_SECONDS`` after a POST. A cookie carries this to
+  the same browser, so people see their own comment after the redirect even
+  once a replica lags behind;
+* inside ``with pin_to_primary():``.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARY_COOKIE = 'read_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_pinned = ContextVar('read_from_primary', default=False)
+
+
+def read_alias():
+    alias = getattr(settings, 'DATABASE_READ_ALIAS', None)
+    return alias if alias in settings.DATABASES else DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def pin_to_primary():
+    """Send the reads made inside the block to the primary."""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReadYourWritesMiddleware:
+    """Keep a browser's reads on the primary during and shortly after its writes."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        writing = request.method not in SAFE_METHODS
+        if not (writing or self.recently_wrote(request)):
+            return self.get_response(request)
+        with pin_to_primary():
+            response = self.get_response(request)
+        window = getattr(settings, 'READ_YOUR_WRITES_SECONDS', 5)
+        if writing and window:
+            response.set_cookie(
+                PRIMARY_COOKIE, str(int(time.time() + window)), max_age=window,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+    def recently_wrote(self, request):
+        try:
+            return float(request.COOKIES.get(PRIMARY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
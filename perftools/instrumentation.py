@@ -0,0 +1,241 @@
+"""
+Per-request performance metrics.
+
+RequestMetricsMiddleware measures a sample of requests. For each one it
+records:
+
+* the number of SQL queries and the time spent running them,
+* queries whose SQL ran more than once (the shape of an N+1 problem),
+* template render time (queries run from the template are included),
+* cache hits and misses.
+
+The numbers go out in a ``Server-Timing`` header, which browser dev tools
+show next to the request, and as one JSON log line on the
+``request_metrics`` logger at INFO level. Route that logger to a handler in
+LOGGING to collect them.
+
+Settings:
+
+``REQUEST_METRICS_SAMPLE_RATE``
+    Fraction of requests measured, from 0 (off) to 1 (all; the default).
+``REQUEST_METRICS_SERVER_TIMING``
+    Whether to add the Server-Timing header (default True).
+
+Streaming responses (the blog's ``export-posts`` download) run most of their
+queries while the body is sent, after the middleware has returned. Those are
+still counted: the body is pulled chunk by chunk with the execute wrapper
+back in place (perftools/streaming.py), and the log line is written when the
+body is done, with ``"streamed": true``. Headers go out before the body,
+though, so the Server-Timing header of a streaming response only covers the
+work done before its first chunk.
+
+Template and cache timings come from wrappers installed on
+``django.template.base.Template.render`` and on the configured cache
+backends the first time the middleware is loaded. They only count anything
+while a sampled request is being measured.
+"""
+import json
+import logging
+import random
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.template.base import Template
+
+from .streaming import wrap_streaming_content
+
+logger = logging.getLogger('request_metrics')
+
+# Metrics of the request being measured in this thread/task, if any.
+_current = ContextVar('request_metrics', default=None)
+
+_MISSING = object()
+
+# SQL statements reported per request in the log line.
+REPORTED_DUPLICATES = 3
+
+
+class RequestMetrics:
+    """What happened during one request. Also the execute wrapper counting queries."""
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = Counter()
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Nested template renders ({% include %}) and cache calls made by
+        # other cache calls (get_many -> get) are not counted twice.
+        self.render_depth = 0
+        self.in_cache_call = False
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def duplicates(self):
+        """(sql, count) of the statements that ran more than once, most repeated first."""
+        return [(sql, count) for sql, count in self.statements.most_common() if count > 1]
+
+    def as_dict(self, request, response):
+        duplicates = self.duplicates()
+        match = getattr(request, 'resolver_match', None)
+        return {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round((perf_counter() - self.started) * 1000, 2),
+            'db_queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 2),
+            'duplicate_queries': sum(count - 1 for _, count in duplicates),
+            'duplicates': [
+                {'sql': sql[:300], 'count': count} for sql, count in duplicates[:REPORTED_DUPLICATES]
+            ],
+            'template_ms': round(self.template_time * 1000, 2),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+
+    def server_timing(self, data):
+        return ', '.join([
+            'db;dur=%.2f;desc="%d queries"' % (data['db_ms'], data['db_queries']),
+            'dup;desc="%d duplicate queries"' % data['duplicate_queries'],
+            'tpl;dur=%.2f' % data['template_ms'],
+            'cache;desc="%d hits, %d misses"' % (data['cache_hits'], data['cache_misses']),
+            'total;dur=%.2f' % data['total_ms'],
+        ])
+
+
+def sample_rate():
+    return getattr(settings, 'REQUEST_METRICS_SAMPLE_RATE', 1.0)
+
+
+class RequestMetricsMiddleware:
+    """Measure a sample of requests; put it near the top of MIDDLEWARE."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_wrappers()
+
+    def __call__(self, request):
+        rate = sample_rate()
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        with measuring(metrics):
+            response = self.get_response(request)
+
+        data = metrics.as_dict(request, response)
+        if getattr(settings, 'REQUEST_METRICS_SERVER_TIMING', True):
+            response['Server-Timing'] = metrics.server_timing(data)
+
+        def finish():
+            data = metrics.as_dict(request, response)
+            data['streamed'] = True
+            log(data)
+
+        if not wrap_streaming_content(response, lambda: measuring(metrics), finish):
+            log(data)
+        return response
+
+
+@contextmanager
+def measuring(metrics):
+    """Count the queries, renders and cache reads of the block into ``metrics``."""
+    token = _current.set(metrics)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all(initialized_only=False):
+                stack.enter_context(connection.execute_wrapper(metrics))
+            yield metrics
+    finally:
+        _current.reset(token)
+
+
+def log(data):
+    logger.info(json.dumps(data), extra={'request_metrics': data})
+
+
+def install_wrappers():
+    """Wrap template rendering and the cache backends' reads, once per class."""
+    _wrap(Template, 'render', _timed_render)
+    for alias in settings.CACHES:
+        backend = type(caches[alias])
+        _wrap(backend, 'get', _counted_get)
+        _wrap(backend, 'get_many', _counted_get_many)
+
+
+def _wrap(cls, name, decorator):
+    original = getattr(cls, name)
+    if not getattr(original, '_request_metrics', False):
+        wrapper = decorator(original)
+        wrapper._request_metrics = True
+        setattr(cls, name, wrapper)
+
+
+def _timed_render(render):
+    @wraps(render)
+    def wrapper(self, context):
+        metrics = _current.get()
+        if metrics is None or metrics.render_depth:
+            return render(self, context)
+        metrics.render_depth += 1
+        started = perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            metrics.template_time += perf_counter() - started
+            metrics.render_depth -= 1
+    return wrapper
+
+
+def _counted_get(get):
+    @wraps(get)
+    def wrapper(self, key, default=None, version=None):
+        metrics = _current.get()
+        if metrics is None or metrics.in_cache_call:
+            return get(self, key, default, version)
+        metrics.in_cache_call = True
+        try:
+            value = get(self, key, _MISSING, version)
+        finally:
+            metrics.in_cache_call = False
+        if value is _MISSING:
+            metrics.cache_misses += 1
+            return default
+        metrics.cache_hits += 1
+        return value
+    return wrapper
+
+
+def _counted_get_many(get_many):
+    @wraps(get_many)
+    def wrapper(self, keys, version=None):
+        metrics = _current.get()
+        if metrics is None or metrics.in_cache_call:
+            return get_many(self, keys, version)
+        keys = list(keys)
+        metrics.in_cache_call = True
+        try:
+            found = get_many(self, keys, version)
+        finally:
+            metrics.in_cache_call = False
+        metrics.cache_hits += len(found)
+        metrics.cache_misses += len(keys) - len(found)
+        return found
+    return wrapper
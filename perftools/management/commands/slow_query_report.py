@@ -0,0 +1,91 @@
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SORT_KEYS = {
+    'total': lambda group: group['total_ms'],
+    'max': lambda group: group['max_ms'],
+    'count': lambda group: group['count'],
+}
+
+
+def summarize(lines):
+    """Group slow-query log lines by fingerprint; returns the groups as dicts."""
+    groups = defaultdict(lambda: {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'views': set()})
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        group = groups[entry['fingerprint']]
+        group['count'] += 1
+        group['total_ms'] += entry['duration_ms']
+        if entry['view']:
+            group['views'].add(entry['view'])
+        if entry['duration_ms'] >= group['max_ms']:
+            # Keep the SQL and plan of the slowest run as the example.
+            group.update(max_ms=entry['duration_ms'], sql=entry['sql'], plan=entry.get('plan'))
+    summary = []
+    for key, group in groups.items():
+        plan = group['plan'] or []
+        summary.append({
+            'fingerprint': key,
+            'count': group['count'],
+            'total_ms': round(group['total_ms'], 3),
+            'mean_ms': round(group['total_ms'] / group['count'], 3),
+            'max_ms': group['max_ms'],
+            'views': sorted(group['views']),
+            'full_scan': any(row.startswith('SCAN') and 'USING' not in row for row in plan),
+            'sql': group['sql'],
+            'plan': plan,
+        })
+    return summary
+
+
+class Command(BaseCommand):
+    help = 'Summarize the slow-query log (SLOW_QUERY_LOG_FILE) by query fingerprint, worst first.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help='Log file to read (default: settings.SLOW_QUERY_LOG_FILE).')
+        parser.add_argument('--limit', type=int, default=10, help='Fingerprints shown (default: 10).')
+        parser.add_argument(
+            '--sort', choices=sorted(SORT_KEYS), default='total',
+            help='Rank by total time, slowest single run or number of runs (default: total).',
+        )
+        parser.add_argument('--json', action='store_true', help='Print the summary as JSON.')
+
+    def handle(self, *args, **options):
+        path = options['file'] or getattr(settings, 'SLOW_QUERY_LOG_FILE', None)
+        if not path:
+            raise CommandError('No log file: pass --file or set SLOW_QUERY_LOG_FILE.')
+        try:
+            with open(path) as f:
+                summary = summarize(f)
+        except FileNotFoundError:
+            raise CommandError('%s does not exist; no slow queries were logged yet.' % path)
+
+        summary.sort(key=SORT_KEYS[options['sort']], reverse=True)
+        summary = summary[:options['limit']]
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+        if not summary:
+            self.stdout.write('No slow queries logged.')
+            return
+        for rank, group in enumerate(summary, 1):
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                '%d. %s  %d runs, %.1f ms total, %.1f ms mean, %.1f ms max%s' % (
+                    rank, group['fingerprint'], group['count'], group['total_ms'],
+                    group['mean_ms'], group['max_ms'], '  FULL SCAN' if group['full_scan'] else '',
+                )
+            ))
+            if group['views']:
+                self.stdout.write('   views: %s' % ', '.join(group['views']))
+            self.stdout.write('   %s' % group['sql'])
+            for row in group['plan']:
+                self.stdout.write('     %s' % row)
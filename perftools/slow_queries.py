@@ -0,0 +1,160 @@
+"""
+Slow-query log.
+
+SlowQueryMiddleware wraps every database connection while a request is
+handled. A statement that takes ``SLOW_QUERY_THRESHOLD_MS`` or longer is
+recorded with:
+
+* its SQL, parameters and duration,
+* a fingerprint: the md5 of the SQL with literals, placeholders and IN
+  lists normalized, so the same query with other values groups together,
+* the view and path of the request that ran it,
+* on SQLite, the ``EXPLAIN QUERY PLAN`` rows, which show full table scans
+  ("SCAN table" without "USING INDEX").
+
+Queries run while a streaming response's body is sent, after the middleware
+has returned, are logged too (see perftools/streaming.py).
+
+Each record is one JSON line in ``SLOW_QUERY_LOG_FILE`` (if set), and it is
+also logged on the ``slow_queries`` logger at WARNING level.
+``manage.py slow_query_report`` summarizes the file by fingerprint.
+
+Settings:
+
+``SLOW_QUERY_THRESHOLD_MS``
+    Minimum duration logged (default 100). None turns the log off.
+``SLOW_QUERY_EXPLAIN``
+    Capture the query plan of slow statements (default True).
+``SLOW_QUERY_LOG_FILE``
+    File the JSON lines are appended to (default None: logger only).
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+from contextlib import ExitStack, contextmanager
+from time import perf_counter
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+
+from .streaming import wrap_streaming_content
+
+logger = logging.getLogger('slow_queries')
+
+_file_lock = threading.Lock()
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+# Statements EXPLAIN QUERY PLAN makes sense for.
+_EXPLAINABLE_RE = re.compile(r'^\s*(SELECT|WITH|UPDATE|DELETE|INSERT)\b', re.IGNORECASE)
+
+
+def normalize(sql):
+    """Replace the literal values in ``sql`` with ``?`` and collapse IN lists."""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST_RE.sub('(...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    return hashlib.md5(normalize(sql).encode(), usedforsecurity=False).hexdigest()[:16]
+
+
+def threshold():
+    """The slow-query threshold in seconds, or None when the log is off."""
+    value = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 100)
+    return None if value is None else value / 1000
+
+
+class SlowQueryLog:
+    """Execute wrapper recording the statements slower than the threshold."""
+
+    def __init__(self, request=None, threshold=None):
+        self.request = request
+        self.threshold = threshold
+        self._explaining = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self._explaining:
+            return execute(sql, params, many, context)
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = perf_counter() - started
+            if duration >= self.threshold:
+                self.record(context['connection'], sql, params, many, duration)
+
+    def record(self, connection, sql, params, many, duration):
+        match = getattr(self.request, 'resolver_match', None)
+        entry = {
+            'time': timezone.now().isoformat(),
+            'fingerprint': fingerprint(sql),
+            'duration_ms': round(duration * 1000, 3),
+            'sql': sql,
+            'params': None if many else [repr(param)[:100] for param in params or ()],
+            'many': many,
+            'database': connection.alias,
+            'view': match.view_name if match else None,
+            'path': self.request.path if self.request is not None else None,
+            'plan': None,
+        }
+        if not many and getattr(settings, 'SLOW_QUERY_EXPLAIN', True):
+            entry['plan'] = self.explain(connection, sql, params)
+        write(entry)
+
+    def explain(self, connection, sql, params):
+        if connection.vendor != 'sqlite' or not _EXPLAINABLE_RE.match(sql):
+            return None
+        self._explaining = True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                # Rows are (id, parent, notused, detail).
+                return [row[-1] for row in cursor.fetchall()]
+        except DatabaseError as e:
+            return ['EXPLAIN failed: %s' % e]
+        finally:
+            self._explaining = False
+
+
+def write(entry):
+    line = json.dumps(entry, default=str)
+    logger.warning(line, extra={'slow_query': entry})
+    path = getattr(settings, 'SLOW_QUERY_LOG_FILE', None)
+    if path:
+        with _file_lock, open(path, 'a') as f:
+            f.write(line + '\n')
+
+
+class SlowQueryMiddleware:
+    """Log the slow statements of every request; put it near the top of MIDDLEWARE."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        limit = threshold()
+        if limit is None:
+            return self.get_response(request)
+        log = SlowQueryLog(request, limit)
+        with logging_to(log):
+            response = self.get_response(request)
+        wrap_streaming_content(response, lambda: logging_to(log))
+        return response
+
+
+@contextmanager
+def logging_to(log):
+    """Record the slow statements the block runs on any connection in ``log``."""
+    with ExitStack() as stack:
+        for connection in connections.all(initialized_only=False):
+            stack.enter_context(connection.execute_wrapper(log))
+        yield log
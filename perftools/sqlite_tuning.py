@@ -0,0 +1,114 @@
+"""
+SQLite tuning for concurrent use.
+
+Out of the box SQLite uses a rollback journal, which blocks readers while a
+write commits. It also has no busy timeout, so a second writer fails at once
+with "database is locked". This module fixes both for every SQLite
+connection:
+
+* ``apply_pragmas`` runs on ``connection_created`` and issues the PRAGMAs in
+  ``SQLITE_PRAGMAS``: WAL journal, ``synchronous=NORMAL``, mmap, page
+  cache, temp store and busy timeout. ``journal_mode`` is skipped for
+  in-memory databases (the test database). Connections of the aliases in
+  ``SQLITE_READ_ONLY_ALIASES`` also get ``query_only``, so a read replica
+  alias (see perftools/db_router.py) can never write.
+* ``retry_on_lock`` re-runs a write (a view's ``post``, a function) when it
+  still fails with "database is locked", after a jittered exponential
+  backoff. With ``atomic=True`` each attempt is one transaction, so rows
+  written before the error are rolled back instead of written twice. It
+  only retries outside an atomic block: inside one, the enclosing
+  transaction must be retried as a whole.
+
+It is registered by PerftoolsConfig.ready(), so every project listing
+``perftools`` in INSTALLED_APPS gets it. Persistent connections
+(``CONN_MAX_AGE``, ``CONN_HEALTH_CHECKS``) and ``transaction_mode`` are
+configured in each project's DATABASES.
+
+Settings:
+
+``SQLITE_PRAGMAS``
+    Dict of PRAGMA name -> value, run in order; empty or None for none.
+``SQLITE_READ_ONLY_ALIASES``
+    Database aliases opened with ``PRAGMA query_only = ON`` (default none).
+``SQLITE_LOCK_RETRIES``
+    How many times a locked write is retried (default 3).
+``SQLITE_LOCK_BACKOFF``
+    Upper bound in seconds of the first wait, doubled per retry; the wait
+    is drawn uniformly below it (default 0.05).
+"""
+import random
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.db.backends.signals import connection_created
+
+_PRAGMA_NAME_RE = re.compile(r'^[a-z_]+$')
+_PRAGMA_VALUE_RE = re.compile(r'^-?\w+$')
+
+# Write-ahead logging persists in the database file and is meaningless for
+# in-memory databases.
+_FILE_ONLY_PRAGMAS = {'journal_mode'}
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', None) or {}
+    in_memory = connection.is_in_memory_db()
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            value = str(value)
+            if not (_PRAGMA_NAME_RE.match(name) and _PRAGMA_VALUE_RE.match(value)):
+                raise ValueError('Invalid SQLITE_PRAGMAS entry %r: %r' % (name, value))
+            if in_memory and name in _FILE_ONLY_PRAGMAS:
+                continue
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+        # Last, as the PRAGMAs above may have to write (journal_mode).
+        if connection.alias in getattr(settings, 'SQLITE_READ_ONLY_ALIASES', ()):
+            cursor.execute('PRAGMA query_only = ON')
+
+
+def is_lock_error(error):
+    return isinstance(error, OperationalError) and 'database is locked' in str(error)
+
+
+def retry_on_lock(func=None, *, using=DEFAULT_DB_ALIAS, retries=None, backoff=None, atomic=False):
+    """
+    Decorator re-running ``func`` when it fails with "database is locked".
+
+    Use it bare (``@retry_on_lock``) or with arguments overriding the
+    SQLITE_LOCK_RETRIES / SQLITE_LOCK_BACKOFF settings. ``func`` must be
+    safe to run again, e.g. a view method that builds its form from the
+    request. When it writes more than one statement, pass ``atomic=True``
+    to run each attempt in ``transaction.atomic(using=using)``: a failed
+    attempt is then rolled back before the next one starts.
+    """
+    if func is None:
+        return lambda func: retry_on_lock(func, using=using, retries=retries, backoff=backoff, atomic=atomic)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        limit = retries if retries is not None else getattr(settings, 'SQLITE_LOCK_RETRIES', 3)
+        delay = backoff if backoff is not None else getattr(settings, 'SQLITE_LOCK_BACKOFF', 0.05)
+        attempt = 0
+        while True:
+            try:
+                if atomic:
+                    with transaction.atomic(using=using):
+                        return func(*args, **kwargs)
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if not is_lock_error(e) or attempt >= limit or connections[using].in_atomic_block:
+                    raise
+            # Full jitter, so writers that collided do not collide again.
+            time.sleep(random.uniform(0, delay * 2 ** attempt))
+            attempt += 1
+
+    return wrapper
+
+
+def install():
+    connection_created.connect(apply_pragmas, dispatch_uid='sqlite_tuning.apply_pragmas')
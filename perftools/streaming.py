@@ -0,0 +1,39 @@
+"""
+Measuring the body of streaming responses.
+
+A StreamingHttpResponse leaves the middleware before its body is produced:
+the server iterates ``streaming_content`` afterwards, and any queries the
+generator runs (the blog's ``export-posts`` download, for one) happen after
+the middleware's execute wrappers are gone. wrap_streaming_content() hands
+the middleware a way to measure them anyway: each chunk is pulled inside the
+context manager the middleware passes in, and ``finish`` is called once the
+body is done or the client goes away.
+
+Only synchronous bodies are wrapped. Under ASGI an async body is left alone.
+"""
+
+
+def wrap_streaming_content(response, enter, finish=None):
+    """
+    Pull each chunk of a streaming ``response`` inside ``enter()`` and call
+    ``finish()`` at the end. Return False (and do nothing) when the response
+    is not a synchronous stream.
+    """
+    if not getattr(response, 'streaming', False) or response.is_async:
+        return False
+    response.streaming_content = _measured(response.streaming_content, enter, finish)
+    return True
+
+
+def _measured(content, enter, finish):
+    try:
+        while True:
+            with enter():
+                try:
+                    chunk = next(content)
+                except StopIteration:
+                    return
+            yield chunk
+    finally:
+        if finish is not None:
+            finish()
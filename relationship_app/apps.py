@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+from django.core import checks
+
+
+class RelationshipAppConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'relationship_app'
+
+    def ready(self):
+        # Register the signal receivers that maintain the membership index.
+        from . import signals  # noqa: F401
+        from .membership import check_shared_cache
+
+        # The index needs a cache shared by every process (see membership.py).
+        checks.register(check_shared_cache, checks.Tags.caches, deploy=True)
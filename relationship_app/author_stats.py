@@ -0,0 +1,202 @@
+# relationship_app/author_stats.py
+"""
+Incremental author statistics.
+
+AuthorStats holds each author's book_count, library_count and last_added,
+so author listings can show, sort and filter by them off an index, with no
+COUNT over Book and the ``Library.books`` table. The receivers in
+relationship_app/signals.py turn every change into deltas and apply them
+here:
+
+* ``record_books({author_id: n})`` for books created (n > 0), deleted or
+  moved to another author (n < 0).
+* ``record_holdings({(author_id, library_id): n})`` for an author's books
+  added to (n > 0) or removed from a library.
+
+A library counts for an author while it holds at least one of their books.
+AuthorHolding keeps that number per (author, library) pair, so
+library_count only moves when a pair appears or goes away. Each call reads
+the pairs it touches and writes in one transaction.
+
+``rebuild_author_stats()`` (``manage.py rebuild_author_stats``) recomputes
+both tables in SQL, keeping last_added, which has no source to be
+recomputed from.
+"""
+from collections import defaultdict
+
+from django.db import connections, router, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import Author, AuthorHolding, AuthorStats, Book, Library
+
+BATCH_SIZE = 5000
+
+
+def _using():
+    return router.db_for_write(AuthorStats)
+
+
+def _by_delta(deltas):
+    """{delta: [keys]} for the non-zero deltas of ``deltas``."""
+    grouped = defaultdict(list)
+    for key, delta in deltas.items():
+        if delta:
+            grouped[delta].append(key)
+    return grouped
+
+
+def _adjust(field, deltas, now=None):
+    """
+    Add ``deltas[author_id]`` to ``field`` of each author's AuthorStats, one
+    UPDATE per distinct delta, and set last_added to ``now`` for authors
+    with a positive delta. Rows are created for positive deltas only, so a
+    delete cascading from an Author does not recreate its stats.
+    """
+    grouped = _by_delta(deltas)
+    if not grouped:
+        return
+    using = _using()
+    added = [author_id for author_id, delta in deltas.items() if delta > 0]
+    AuthorStats.objects.using(using).bulk_create(
+        [AuthorStats(author_id=author_id) for author_id in added], ignore_conflicts=True,
+    )
+    for delta, author_ids in grouped.items():
+        changes = {field: Greatest(F(field) + delta, Value(0))}
+        if delta > 0 and now is not None:
+            changes['last_added'] = now
+        AuthorStats.objects.using(using).filter(author_id__in=author_ids).update(**changes)
+
+
+def record_author_added(author_id):
+    """Start a new author's statistics at zero, so listings joining AuthorStats include them."""
+    AuthorStats.objects.using(_using()).bulk_create([AuthorStats(author_id=author_id)], ignore_conflicts=True)
+
+
+def record_books(deltas):
+    """Count ``deltas[author_id]`` more (or fewer, when negative) books for each author."""
+    with transaction.atomic(using=_using()):
+        _adjust('book_count', deltas, timezone.now())
+
+
+def record_holdings(deltas):
+    """
+    Count ``deltas[(author_id, library_id)]`` more (or fewer) of the author's
+    books in the library, and move library_count when a library gains the
+    author's first book or loses their last.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    using = _using()
+    authors = {author_id for author_id, _ in deltas}
+    libraries = {library_id for _, library_id in deltas}
+    with transaction.atomic(using=using):
+        # A superset of the pairs touched; the rest are ignored below.
+        stored = {
+            (holding.author_id, holding.library_id): holding
+            for holding in AuthorHolding.objects.using(using).select_for_update().filter(
+                author_id__in=authors, library_id__in=libraries,
+            )
+        }
+        created, changed, gone = [], [], []
+        library_deltas = defaultdict(int)
+        for (author_id, library_id), delta in deltas.items():
+            holding = stored.get((author_id, library_id))
+            count = (holding.book_count if holding else 0) + delta
+            if holding is None:
+                if count > 0:
+                    created.append(AuthorHolding(author_id=author_id, library_id=library_id, book_count=count))
+                    library_deltas[author_id] += 1
+            elif count > 0:
+                holding.book_count = count
+                changed.append(holding)
+            else:
+                gone.append(holding.pk)
+                library_deltas[author_id] -= 1
+        AuthorHolding.objects.using(using).bulk_create(created, batch_size=BATCH_SIZE)
+        AuthorHolding.objects.using(using).bulk_update(changed, ['book_count'], batch_size=BATCH_SIZE)
+        AuthorHolding.objects.using(using).filter(pk__in=gone).delete()
+        _adjust('library_count', library_deltas)
+        # Adding a book to a library counts as adding it, even when the
+        # library already held the author's books.
+        AuthorStats.objects.using(using).filter(
+            author_id__in={author_id for (author_id, _), delta in deltas.items() if delta > 0},
+        ).update(last_added=timezone.now())
+
+
+def library_holdings(library_id):
+    """{author_id: books of theirs in the library}, from AuthorHolding."""
+    return dict(
+        AuthorHolding.objects.using(_using()).filter(library_id=library_id)
+        .values_list('author_id', 'book_count')
+    )
+
+
+def record_library_deleted(author_ids):
+    """A library is gone, and with it its AuthorHolding rows: one library fewer for each author."""
+    _adjust('library_count', dict.fromkeys(author_ids, -1))
+
+
+def books_by_author(book_ids):
+    """{author_id: how many of ``book_ids`` they wrote}."""
+    return dict(
+        Book.objects.using(_using()).filter(pk__in=book_ids)
+        .order_by().values('author_id').annotate(n=Count('pk')).values_list('author_id', 'n')
+    )
+
+
+def _count(queryset):
+    """A correlated COUNT(*) of ``queryset`` rows (filtered on OuterRef) as a subquery."""
+    return Coalesce(
+        Subquery(queryset.order_by().values('author').annotate(total=Count('pk')).values('total')),
+        Value(0),
+    )
+
+
+def rebuild_author_stats():
+    """
+    Recompute AuthorHolding and AuthorStats (a row for every author) from
+    Book and the M2M table, with set-based SQL: INSERT ... SELECT for the
+    holdings, one UPDATE with subqueries for the counts.
+
+    Returns the number of authors with statistics.
+    """
+    using = _using()
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    through = Library.books.through._meta
+    book = Book._meta
+    holding = AuthorHolding._meta
+    insert_holdings = (
+        'INSERT INTO {holding} ({h_author}, {h_library}, {h_count}) '
+        'SELECT b.{b_author}, t.{t_library}, COUNT(*) FROM {through} t '
+        'INNER JOIN {book} b ON b.{b_pk} = t.{t_book} '
+        'GROUP BY b.{b_author}, t.{t_library}'
+    ).format(
+        holding=qn(holding.db_table),
+        h_author=qn(holding.get_field('author').column),
+        h_library=qn(holding.get_field('library').column),
+        h_count=qn(holding.get_field('book_count').column),
+        b_author=qn(book.get_field('author').column),
+        b_pk=qn(book.pk.column),
+        through=qn(through.db_table),
+        t_library=qn(through.get_field('library').column),
+        t_book=qn(through.get_field('book').column),
+        book=qn(book.db_table),
+    )
+    with transaction.atomic(using=using):
+        AuthorHolding.objects.using(using).all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(insert_holdings)
+        missing = Author.objects.using(using).filter(stats__isnull=True).values_list('pk', flat=True)
+        AuthorStats.objects.using(using).bulk_create(
+            [AuthorStats(author_id=author_id) for author_id in missing.iterator(chunk_size=BATCH_SIZE)],
+            batch_size=BATCH_SIZE, ignore_conflicts=True,
+        )
+        # last_added is kept: nothing records when books were added.
+        return AuthorStats.objects.using(using).update(
+            book_count=_count(Book.objects.filter(author=OuterRef('author'))),
+            library_count=_count(AuthorHolding.objects.filter(author=OuterRef('author'))),
+        )
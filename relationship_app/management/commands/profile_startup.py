@@ -0,0 +1,67 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from relationship_app.startup import parse_importtime
+
+SORT_KEYS = {
+    'cumulative': lambda row: row[2],
+    'self': lambda row: row[1],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Boot the project in a fresh interpreter like a WSGI worker does and report the '
+        'slowest module imports and any database queries run before the first request.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20, help='Imports to show (default: 20).')
+        parser.add_argument(
+            '--sort', choices=sorted(SORT_KEYS), default='cumulative',
+            help='Rank imports by time including (cumulative) or excluding (self) their own imports.',
+        )
+        parser.add_argument(
+            '--fail-on-queries', action='store_true',
+            help='Exit with an error if startup runs any query, e.g. in CI.',
+        )
+
+    def handle(self, *args, **options):
+        # The child boots with the settings this command runs with, however
+        # they were chosen (--settings or the environment).
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-m', 'relationship_app.startup'],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        stderr = result.stderr.splitlines()
+        if result.returncode:
+            errors = [line for line in stderr if not line.startswith('import time:')]
+            raise CommandError('Startup failed:\n%s' % '\n'.join(errors[-20:]))
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        imports = parse_importtime(stderr)
+
+        total_ms = sum(own for _, own, _ in imports) / 1000
+        self.stdout.write(
+            'Startup took %.1f ms, %.1f ms of it importing %d modules.'
+            % (report['seconds'] * 1000, total_ms, len(imports))
+        )
+        self.stdout.write('%10s %10s  module' % ('cum. ms', 'self ms'))
+        for name, own, cumulative in sorted(imports, key=SORT_KEYS[options['sort']], reverse=True)[:options['limit']]:
+            self.stdout.write('%10.1f %10.1f  %s' % (cumulative / 1000, own / 1000, name))
+
+        queries = report['queries']
+        if not queries:
+            self.stdout.write(self.style.SUCCESS('No database queries during startup.'))
+            return
+        self.stdout.write(self.style.WARNING('%d database queries during startup:' % len(queries)))
+        for query in queries:
+            self.stdout.write('  [%s] %s' % (query['alias'], query['caller'] or 'outside the project'))
+            self.stdout.write('      %s' % query['sql'])
+        if options['fail_on_queries']:
+            raise CommandError('Startup ran %d database queries.' % len(queries))
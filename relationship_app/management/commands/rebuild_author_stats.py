@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from relationship_app.author_stats import rebuild_author_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the AuthorStats and AuthorHolding tables from books and library holdings.'
+
+    def handle(self, *args, **options):
+        count = rebuild_author_stats()
+        self.stdout.write(self.style.SUCCESS('Rebuilt statistics for %d authors.' % count))
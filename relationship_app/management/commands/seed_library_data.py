@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from relationship_app.seeding import LibraryDataSeeder
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with synthetic authors, books and libraries for benchmarks, '
+        'generated in a process pool and written with bulk inserts. Empties the tables first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=1000000, help='Number of books (default: 1000000).')
+        parser.add_argument('--authors', type=int, default=100000, help='Number of authors (default: 100000).')
+        parser.add_argument('--libraries', type=int, default=1000, help='Number of libraries (default: 1000).')
+        parser.add_argument(
+            '--books-per-library', type=int, default=1000,
+            help='Books sampled into each library (default: 1000).',
+        )
+        parser.add_argument(
+            '--zipf', type=float, default=1.1,
+            help='Zipf exponent of books per author; 0 spreads them evenly (default: 1.1).',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Processes generating rows (default: one per CPU; 1 generates them in this process).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000, help='Rows per bulk insert (default: 5000).',
+        )
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for repeatable data.')
+        parser.add_argument(
+            '--append', action='store_true', help='Keep the existing rows and add the new ones after them.',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        if options['books'] and options['authors'] < 1:
+            raise CommandError('Books need at least one author.')
+        seeder = LibraryDataSeeder(
+            books=options['books'],
+            authors=options['authors'],
+            libraries=options['libraries'],
+            books_per_library=options['books_per_library'],
+            exponent=options['zipf'],
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+            truncate=not options['append'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        result = seeder.run()
+        self.stdout.write(self.style.SUCCESS(
+            'Seeded %(authors)d authors, %(books)d books, %(libraries)d libraries and %(holdings)d '
+            'library books in %(seconds).1fs (%(rows_per_second).0f rows/s).' % result
+        ))
@@ -0,0 +1,479 @@
+# relationship_app/membership.py
+"""
+In-process bitmap index of which library holds which book.
+
+Each library's books are kept as a Bitmap of book ids, a compressed set
+laid out like a roaring bitmap. Ids are split by their high 16 bits into
+chunks. A chunk with at most ``ARRAY_MAX`` members is a sorted
+``array('H')`` of the low bits, two bytes per member. A fuller chunk is one
+65,536-bit Python int, 8 KiB at most. Intersection, union and difference
+then work chunk by chunk: ``&``, ``|`` and ``& ~`` on ints for full chunks,
+set operations on the short arrays. "Books held by libraries A and B but
+not C" is answered without a join on the ``Library.books`` table.
+
+The index is built on first use (one query for the libraries, one for the
+through table) and kept up to date by the receivers in signals.py, from
+``Library.books`` m2m_changed and from Library and Book deletes. A change
+reaches the index once its transaction commits, never before, so a rolled
+back change leaves no trace. The commit also bumps a version in the default
+cache. A process whose copy is older than the cached version rebuilds before
+answering, so every worker sees the others' changes as long as they share
+that cache: it has to be one cache for all the processes with an atomic
+``incr()`` (Memcached, Redis). ``manage.py check --deploy`` warns when it is
+not. bulk_create and raw SQL send no signals: call ``invalidate()`` after
+them (the seeding engine does).
+
+``Book.objects.in_libraries()`` and ``Library.objects.holding()`` put the
+answers in QuerySets. The functions below return ids as Bitmaps.
+"""
+import threading
+from array import array
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import transaction
+from perftools.caches import shared_cache_check
+
+# Chunks with more members than this are stored as bitmaps.
+ARRAY_MAX = 4096
+_CHUNK_BITS = 16
+_CHUNK_BYTES = (1 << _CHUNK_BITS) // 8
+_LOW_MASK = (1 << _CHUNK_BITS) - 1
+
+VERSION_CACHE_KEY = 'relationship:membership-version'
+
+# The positions of the set bits of every byte value.
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+def _to_bits(members):
+    """A sorted array of low bits as a chunk bitmap."""
+    bits = bytearray(_CHUNK_BYTES)
+    for low in members:
+        bits[low >> 3] |= 1 << (low & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def _to_array(bits):
+    """A chunk bitmap as a sorted array of its low bits."""
+    data = bits.to_bytes(_CHUNK_BYTES, 'little')
+    return array('H', [
+        i << 3 | bit for i, byte in enumerate(data) if byte for bit in _BYTE_BITS[byte]
+    ])
+
+
+def _size(container):
+    return container.bit_count() if isinstance(container, int) else len(container)
+
+
+def _normalize(container):
+    """The container in its cheaper form, or None when empty."""
+    if isinstance(container, int):
+        count = container.bit_count()
+        if not count:
+            return None
+        return _to_array(container) if count <= ARRAY_MAX else container
+    if not container:
+        return None
+    return _to_bits(container) if len(container) > ARRAY_MAX else container
+
+
+def _filter(members, bits, keep):
+    # Test each member against the bitmap's bytes rather than shifting the
+    # (up to 8 KiB) int once per member.
+    data = bits.to_bytes(_CHUNK_BYTES, 'little')
+    return array('H', [low for low in members if bool(data[low >> 3] >> (low & 7) & 1) is keep])
+
+
+def _and(a, b):
+    if isinstance(a, int) and isinstance(b, int):
+        return _normalize(a & b)
+    if isinstance(a, int):
+        a, b = b, a
+    if isinstance(b, int):
+        return _normalize(_filter(a, b, True))
+    return _normalize(array('H', sorted(set(a).intersection(b))))
+
+
+def _or(a, b):
+    if isinstance(a, int) or isinstance(b, int):
+        a = a if isinstance(a, int) else _to_bits(a)
+        b = b if isinstance(b, int) else _to_bits(b)
+        return _normalize(a | b)
+    return _normalize(array('H', sorted(set(a).union(b))))
+
+
+def _sub(a, b):
+    if isinstance(a, int):
+        return _normalize(a & ~(b if isinstance(b, int) else _to_bits(b)))
+    if isinstance(b, int):
+        return _normalize(_filter(a, b, False))
+    return _normalize(array('H', sorted(set(a).difference(b))))
+
+
+class Bitmap:
+    """A compressed set of non-negative ints, roaring style (see the module docstring)."""
+
+    __slots__ = ('_chunks',)
+
+    def __init__(self, values=()):
+        self._chunks = {}  # high bits -> sorted array('H') or int bitmap
+        values = sorted(set(values))
+        start = 0
+        while start < len(values):
+            high = values[start] >> _CHUNK_BITS
+            base = high << _CHUNK_BITS
+            stop = bisect_left(values, base + (1 << _CHUNK_BITS), start)
+            self._chunks[high] = _normalize(array('H', [value - base for value in values[start:stop]]))
+            start = stop
+
+    @classmethod
+    def _from_chunks(cls, chunks):
+        bitmap = cls()
+        bitmap._chunks = {high: container for high, container in chunks if container is not None}
+        return bitmap
+
+    def __len__(self):
+        return sum(_size(container) for container in self._chunks.values())
+
+    def __bool__(self):
+        return bool(self._chunks)
+
+    def __iter__(self):
+        for high in sorted(self._chunks):
+            container = self._chunks[high]
+            base = high << _CHUNK_BITS
+            for low in _to_array(container) if isinstance(container, int) else container:
+                yield base | low
+
+    def __contains__(self, value):
+        container = self._chunks.get(value >> _CHUNK_BITS)
+        if container is None:
+            return False
+        low = value & _LOW_MASK
+        if isinstance(container, int):
+            return bool(container >> low & 1)
+        i = bisect_left(container, low)
+        return i < len(container) and container[i] == low
+
+    def __eq__(self, other):
+        if not isinstance(other, Bitmap):
+            return NotImplemented
+        return self._chunks == other._chunks
+
+    def __repr__(self):
+        return '<Bitmap of %d>' % len(self)
+
+    def add(self, value):
+        high, low = value >> _CHUNK_BITS, value & _LOW_MASK
+        container = self._chunks.get(high)
+        if container is None:
+            self._chunks[high] = array('H', [low])
+        elif isinstance(container, int):
+            self._chunks[high] = container | 1 << low
+        else:
+            i = bisect_left(container, low)
+            if i == len(container) or container[i] != low:
+                container.insert(i, low)
+                if len(container) > ARRAY_MAX:
+                    self._chunks[high] = _to_bits(container)
+
+    def discard(self, value):
+        high, low = value >> _CHUNK_BITS, value & _LOW_MASK
+        container = self._chunks.get(high)
+        if container is None:
+            return
+        if isinstance(container, int):
+            container = _normalize(container & ~(1 << low))
+        else:
+            i = bisect_left(container, low)
+            if i < len(container) and container[i] == low:
+                del container[i]
+            container = container or None
+        if container is None:
+            del self._chunks[high]
+        else:
+            self._chunks[high] = container
+
+    def copy(self):
+        return Bitmap._from_chunks(
+            (high, container if isinstance(container, int) else array('H', container))
+            for high, container in self._chunks.items()
+        )
+
+    def __and__(self, other):
+        return Bitmap._from_chunks(
+            (high, _and(container, other._chunks[high]))
+            for high, container in self._chunks.items() if high in other._chunks
+        )
+
+    def __or__(self, other):
+        chunks = dict(self._chunks)
+        for high, container in other._chunks.items():
+            chunks[high] = _or(chunks[high], container) if high in chunks else container
+        return Bitmap._from_chunks(chunks.items()).copy()
+
+    def __sub__(self, other):
+        return Bitmap._from_chunks(
+            (high, _sub(container, other._chunks[high]) if high in other._chunks else container)
+            for high, container in self._chunks.items()
+        ).copy()
+
+    def nbytes(self):
+        """Approximate size of the members in memory."""
+        return sum(
+            (container.bit_length() + 7) // 8 if isinstance(container, int) else 2 * len(container)
+            for container in self._chunks.values()
+        )
+
+
+def intersection(bitmaps):
+    bitmaps = sorted(bitmaps, key=len)
+    if not bitmaps:
+        return Bitmap()
+    result = bitmaps[0]
+    for bitmap in bitmaps[1:]:
+        if not result:
+            break
+        result = result & bitmap
+    return result.copy() if result is bitmaps[0] else result
+
+
+def union(bitmaps):
+    result = Bitmap()
+    for bitmap in bitmaps:
+        result = result | bitmap
+    return result
+
+
+def _pk(obj):
+    return getattr(obj, 'pk', obj)
+
+
+class MembershipIndex:
+    """The book ids of every library, as one Bitmap per library."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._books = {}  # library id -> Bitmap of book ids
+
+    def __len__(self):
+        return len(self._books)
+
+    def load(self, library_ids, pairs):
+        """Replace the contents from library ids and (library_id, book_id) pairs."""
+        members = {library_id: [] for library_id in library_ids}
+        for library_id, book_id in pairs:
+            members.setdefault(library_id, []).append(book_id)
+        with self._lock:
+            self._books = {library_id: Bitmap(book_ids) for library_id, book_ids in members.items()}
+
+    def add(self, library_id, book_ids):
+        with self._lock:
+            bitmap = self._books.setdefault(library_id, Bitmap())
+            for book_id in book_ids:
+                bitmap.add(book_id)
+
+    def remove(self, library_id, book_ids):
+        with self._lock:
+            bitmap = self._books.get(library_id)
+            if bitmap is not None:
+                for book_id in book_ids:
+                    bitmap.discard(book_id)
+
+    def add_book(self, book_id, library_ids):
+        for library_id in library_ids:
+            self.add(library_id, [book_id])
+
+    def remove_book(self, book_id, library_ids=None):
+        """Take a book out of ``library_ids`` (of every library when None)."""
+        with self._lock:
+            for library_id in self._books if library_ids is None else library_ids:
+                self.remove(library_id, [book_id])
+
+    def clear_library(self, library_id):
+        with self._lock:
+            self._books[library_id] = Bitmap()
+
+    def drop_library(self, library_id):
+        with self._lock:
+            self._books.pop(library_id, None)
+
+    def books_of(self, library_id):
+        with self._lock:
+            return self._books.get(library_id, Bitmap()).copy()
+
+    def books(self, all_of=(), any_of=(), none_of=()):
+        """
+        Ids of the books held by every library in ``all_of``, by at least
+        one in ``any_of`` and by none in ``none_of``. Empty ``all_of`` and
+        ``any_of`` start from the books held by any library.
+        """
+        empty = Bitmap()
+        with self._lock:
+            all_of = [self._books.get(_pk(library), empty) for library in all_of]
+            any_of = [self._books.get(_pk(library), empty) for library in any_of]
+            none_of = [self._books.get(_pk(library), empty) for library in none_of]
+            if all_of and any_of:
+                result = intersection(all_of + [union(any_of)])
+            elif all_of:
+                result = intersection(all_of)
+            else:
+                result = union(any_of or self._books.values())
+            if none_of:
+                result = result - union(none_of)
+            return result
+
+    def libraries(self, books):
+        """Ids of the libraries holding every one of ``books``."""
+        book_ids = [_pk(book) for book in books]
+        with self._lock:
+            return Bitmap(
+                library_id for library_id, bitmap in self._books.items()
+                if all(book_id in bitmap for book_id in book_ids)
+            )
+
+    def nbytes(self):
+        with self._lock:
+            return sum(bitmap.nbytes() for bitmap in self._books.values())
+
+
+_index = None
+_index_version = None
+_build_lock = threading.Lock()
+# Set while this thread's open transaction has changes the index does not
+# have yet.
+_uncommitted = threading.local()
+
+
+def _current_version():
+    return cache.get(VERSION_CACHE_KEY, 0)
+
+
+def _note_uncommitted():
+    if transaction.get_connection().in_atomic_block:
+        _uncommitted.changes = True
+
+
+def _in_uncommitted_transaction():
+    if not transaction.get_connection().in_atomic_block:
+        _uncommitted.changes = False
+    return getattr(_uncommitted, 'changes', False)
+
+
+def membership_index():
+    """
+    The process's index, (re)built when missing or older than the cached
+    version. Inside a transaction that changed memberships, a fresh index of
+    what that transaction sees is built and not kept: it could still roll back.
+    """
+    global _index, _index_version
+    if _in_uncommitted_transaction():
+        index = MembershipIndex()
+        index.load(*_load())
+        return index
+    version = _current_version()
+    if _index is None or _index_version != version:
+        with _build_lock:
+            version = _current_version()
+            if _index is None or _index_version != version:
+                index = MembershipIndex()
+                index.load(*_load())
+                _index, _index_version = index, version
+    return _index
+
+
+def _load():
+    from .models import Library
+
+    through = Library.books.through
+    library_ids = list(Library.objects.values_list('pk', flat=True))
+    pairs = through.objects.values_list('library_id', 'book_id').iterator(chunk_size=10000)
+    return library_ids, pairs
+
+
+def _bump_version():
+    """Record a change for the other processes; returns the new version, or None when it was lost."""
+    cache.add(VERSION_CACHE_KEY, 0, None)
+    try:
+        return cache.incr(VERSION_CACHE_KEY)
+    except ValueError:
+        # Evicted in between: start over.
+        cache.add(VERSION_CACHE_KEY, 1, None)
+        return None
+
+
+def _committed(apply=None):
+    """
+    Bump the version once a change is committed. This process's index takes
+    the change with ``apply`` if it was current, and is dropped otherwise.
+    """
+    global _index, _index_version
+    version = _bump_version()
+    with _build_lock:
+        if apply is not None and _index is not None and version == _index_version + 1:
+            apply(_index)
+            _index_version = version
+        else:
+            _index = None
+
+
+def invalidate():
+    """Drop the index here and in every process sharing the cache, e.g. after a bulk insert."""
+    global _index
+    _index = None
+    _note_uncommitted()
+    transaction.on_commit(_committed)
+
+
+# Deploy check, registered in RelationshipAppConfig.ready().
+check_shared_cache = shared_cache_check(
+    'The library membership index', 'relationship_app.W001', 'relationship_app/membership.py',
+)
+
+
+def books_in(all_of=(), any_of=(), none_of=()):
+    """See MembershipIndex.books(); libraries may be given as instances or ids."""
+    return membership_index().books(all_of, any_of, none_of)
+
+
+def libraries_holding(*books):
+    """Ids of the libraries holding all of ``books`` (instances or ids)."""
+    return membership_index().libraries(books)
+
+
+# Signal hooks (see signals.py). Each applies the change to this process's
+# index, if it has one, and bumps the version for the others, once the
+# transaction making it commits.
+
+def _changed(apply):
+    _note_uncommitted()
+    transaction.on_commit(lambda: _committed(apply))
+
+
+def books_added(library_id, book_ids):
+    _changed(lambda index: index.add(library_id, book_ids))
+
+
+def books_removed(library_id, book_ids):
+    _changed(lambda index: index.remove(library_id, book_ids))
+
+
+def library_cleared(library_id):
+    _changed(lambda index: index.clear_library(library_id))
+
+
+def library_deleted(library_id):
+    _changed(lambda index: index.drop_library(library_id))
+
+
+def libraries_added(book_id, library_ids):
+    _changed(lambda index: index.add_book(book_id, library_ids))
+
+
+def libraries_removed(book_id, library_ids):
+    _changed(lambda index: index.remove_book(book_id, library_ids))
+
+
+def book_cleared(book_id):
+    _changed(lambda index: index.remove_book(book_id))
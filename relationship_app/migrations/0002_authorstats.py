@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationship_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='relationship_app.author')),
+                ('book_count', models.PositiveIntegerField(default=0)),
+                ('library_count', models.PositiveIntegerField(default=0)),
+                ('last_added', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'author stats',
+                'indexes': [models.Index(fields=['-book_count', 'author'], name='relationship_authorstats_books'), models.Index(fields=['-library_count', 'author'], name='relationship_authorstats_libs'), models.Index(fields=['-last_added', 'author'], name='relationship_authorstats_added')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AuthorHolding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('book_count', models.PositiveIntegerField(default=0)),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holdings', to='relationship_app.author')),
+                ('library', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='author_holdings', to='relationship_app.library')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('library', 'author'), name='relationship_authorholding_unique')],
+            },
+        ),
+    ]
@@ -1,4 +1,38 @@
 from django.db import models
+from django.db.models.functions import Coalesce
+
+
+class BookQuerySet(models.QuerySet):
+    def in_libraries(self, all_of=(), any_of=(), none_of=()):
+        """
+        Books held by every library in ``all_of``, by at least one in
+        ``any_of`` and by none in ``none_of`` (instances or ids), found in
+        the membership bitmaps instead of joining the M2M table (see
+        membership.py). Meant for answers of up to a few thousand books;
+        use membership.books_in() for the ids of larger ones.
+        """
+        from .membership import books_in
+        return self.filter(pk__in=list(books_in(all_of, any_of, none_of)))
+
+
+class LibraryQuerySet(models.QuerySet):
+    def with_book_counts(self):
+        """
+        Annotate ``book_count``, counted on the M2M table by a correlated
+        subquery: still one query, and only the libraries fetched are counted
+        (a JOIN with GROUP BY counts every library before LIMIT applies).
+        """
+        holdings = (
+            self.model.books.through.objects.filter(library=models.OuterRef('pk'))
+            .order_by().values('library').annotate(total=models.Count('pk')).values('total')
+        )
+        return self.annotate(book_count=Coalesce(models.Subquery(holdings), models.Value(0)))
+
+    def holding(self, *books):
+        """Libraries holding every one of ``books`` (instances or ids), from the membership bitmaps."""
+        from .membership import libraries_holding
+        return self.filter(pk__in=list(libraries_holding(*books)))
+
 
 # 1. Author Model (No relationship field defined here, it's the "parent" in ForeignKey)
 class Author(models.Model):
@@ -19,6 +53,8 @@ class Book(models.Model):
         related_name='books' # allows accessing books from an Author instance: author.books.all()
     )
 
+    objects = BookQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.title} by {self.author.name}"
 
@@ -32,6 +68,8 @@ class Library(models.Model):
         related_name='libraries' # allows accessing libraries from a Book instance: book.libraries.all()
     )
 
+    objects = LibraryQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
@@ -48,3 +86,50 @@ class Librarian(models.Model):
 
     def __str__(self):
         return f"Librarian {self.name} at {self.library.name}"
+
+
+# 5. Author statistics (materialized, see author_stats.py)
+class AuthorStats(models.Model):
+    """
+    Materialized per-author statistics, maintained incrementally by
+    relationship_app/signals.py as books are created, deleted, reassigned
+    and added to or removed from libraries. Rebuild from scratch with
+    ``manage.py rebuild_author_stats``.
+    """
+    author = models.OneToOneField(Author, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    book_count = models.PositiveIntegerField(default=0)
+    # Libraries holding at least one of the author's books.
+    library_count = models.PositiveIntegerField(default=0)
+    # When a book by the author was last created or added to a library.
+    last_added = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'author stats'
+        indexes = [
+            # Author listings sort and filter straight off these.
+            models.Index(fields=['-book_count', 'author'], name='relationship_authorstats_books'),
+            models.Index(fields=['-library_count', 'author'], name='relationship_authorstats_libs'),
+            models.Index(fields=['-last_added', 'author'], name='relationship_authorstats_added'),
+        ]
+
+    def __str__(self):
+        return f"{self.author_id}: {self.book_count} books in {self.library_count} libraries"
+
+
+class AuthorHolding(models.Model):
+    """
+    How many of an author's books a library holds. Kept next to AuthorStats
+    so that library_count changes exactly when a pair appears or goes away,
+    without counting the M2M table.
+    """
+    author = models.ForeignKey(Author, on_delete=models.CASCADE, related_name='holdings')
+    library = models.ForeignKey(Library, on_delete=models.CASCADE, related_name='author_holdings')
+    book_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['library', 'author'], name='relationship_authorholding_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.author_id} in {self.library_id}: {self.book_count} books"
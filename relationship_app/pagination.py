@@ -0,0 +1,81 @@
+# relationship_app/pagination.py
+"""
+Page-based and cursor-based pagination for the book and library lists.
+
+``?page=N`` uses Django's Paginator: it gives page numbers and a total, but
+pays a COUNT(*) on every request and an OFFSET that grows with the page.
+``?cursor=<pk>`` asks for the rows with a primary key above the last one
+shown instead. That is one index range scan, as cheap on the last page as
+on the first, with no COUNT, but it can only step forward.
+
+Settings:
+
+``RELATIONSHIP_PAGE_SIZE``
+    Rows per page in both modes (default 50).
+``RELATIONSHIP_STREAM_CHUNK_SIZE``
+    Rows fetched and rendered at a time by the streamed book list (default 500).
+"""
+from django.conf import settings
+from django.core.paginator import InvalidPage, Paginator
+from django.http import Http404
+
+
+def page_size():
+    return getattr(settings, 'RELATIONSHIP_PAGE_SIZE', 50)
+
+
+def stream_chunk_size():
+    return getattr(settings, 'RELATIONSHIP_STREAM_CHUNK_SIZE', 500)
+
+
+def parse_cursor(value):
+    """The primary key in a ``?cursor=`` value, None when absent; Http404 when malformed."""
+    if value in (None, ''):
+        return None
+    try:
+        cursor = int(value)
+    except ValueError:
+        raise Http404('Invalid cursor %r' % value)
+    if cursor < 0:
+        raise Http404('Invalid cursor %r' % value)
+    return cursor
+
+
+def cursor_page(queryset, cursor=None, per_page=None):
+    """
+    The rows following primary key ``cursor`` (from the start when None),
+    in primary key order, and the cursor of the next page (None on the
+    last page). Fetches one row more than the page to know if there is one.
+    """
+    per_page = per_page or page_size()
+    if cursor is not None:
+        queryset = queryset.filter(pk__gt=cursor)
+    rows = list(queryset.order_by('pk')[:per_page + 1])
+    next_cursor = rows[per_page - 1].pk if len(rows) > per_page else None
+    return rows[:per_page], next_cursor
+
+
+def related_cursor_page(queryset, through, key, cursor=None, per_page=None):
+    """
+    cursor_page() for the members of a many-to-many relation. ``through``
+    is the through table filtered to one owner, and ``key`` its column
+    pointing at ``queryset``'s rows. The page's keys are found on the
+    through table's (owner, key) index in a subquery, so the database does
+    not sort every member of the relation to find the first few.
+    """
+    per_page = per_page or page_size()
+    if cursor is not None:
+        through = through.filter(**{key + '__gt': cursor})
+    keys = through.order_by(key).values(key)[:per_page + 1]
+    rows = list(queryset.filter(pk__in=keys).order_by('pk'))
+    next_cursor = rows[per_page - 1].pk if len(rows) > per_page else None
+    return rows[:per_page], next_cursor
+
+
+def numbered_page(queryset, number, per_page=None):
+    """A django.core.paginator.Page of ``queryset`` in primary key order; Http404 when out of range."""
+    paginator = Paginator(queryset.order_by('pk'), per_page or page_size())
+    try:
+        return paginator.page(number or 1)
+    except InvalidPage:
+        raise Http404('Invalid page %r' % number)
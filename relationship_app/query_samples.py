@@ -13,40 +13,50 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_models.settings')
 django.setup()
 
 from relationship_app.models import Author, Book, Library, Librarian
+from relationship_app.seeding import LibraryBook, rebuild_derived_data, truncate
 
 def setup_initial_data():
     """Creates sample data to test the queries."""
     print("--- Setting up initial data ---")
     
-    # Clean up previous data
-    Librarian.objects.all().delete()
-    Library.objects.all().delete()
-    Book.objects.all().delete()
-    Author.objects.all().delete()
+    # Clean up previous data (one flush statement per table, see seeding.py)
+    truncate()
 
     # Create Authors
-    author1 = Author.objects.create(name="Jane Austen")
-    author2 = Author.objects.create(name="George Orwell")
+    author1, author2 = Author.objects.bulk_create([
+        Author(name="Jane Austen"),
+        Author(name="George Orwell"),
+    ])
     
     # Create Books (ForeignKey)
-    book1 = Book.objects.create(title="Pride and Prejudice", author=author1)
-    book2 = Book.objects.create(title="Emma", author=author1)
-    book3 = Book.objects.create(title="1984", author=author2)
-    book4 = Book.objects.create(title="Animal Farm", author=author2)
+    book1, book2, book3, book4 = Book.objects.bulk_create([
+        Book(title="Pride and Prejudice", author=author1),
+        Book(title="Emma", author=author1),
+        Book(title="1984", author=author2),
+        Book(title="Animal Farm", author=author2),
+    ])
 
     # Create Libraries
-    library_central = Library.objects.create(name="Central City Library")
-    library_west = Library.objects.create(name="West End Branch")
-
-    # Add Books to Libraries (ManyToManyField)
-    library_central.books.add(book1, book2, book3, book4)
-    library_west.books.add(book3, book4) # Only Orwell books here
+    library_central, library_west = Library.objects.bulk_create([
+        Library(name="Central City Library"),
+        Library(name="West End Branch"),
+    ])
+
+    # Add Books to Libraries (ManyToManyField), through-table rows in one insert
+    LibraryBook.objects.bulk_create(
+        [LibraryBook(library=library_central, book=book) for book in (book1, book2, book3, book4)]
+        + [LibraryBook(library=library_west, book=book) for book in (book3, book4)] # Only Orwell books here
+    )
     
     # Create Librarians (OneToOneField)
-    librarian1 = Librarian.objects.create(name="Alice Smith", library=library_central)
-    librarian2 = Librarian.objects.create(name="Bob Johnson", library=library_west)
+    Librarian.objects.bulk_create([
+        Librarian(name="Alice Smith", library=library_central),
+        Librarian(name="Bob Johnson", library=library_west),
+    ])
+    rebuild_derived_data()
 
     print("Data setup complete.\n")
+    print("For production-sized data run: python manage.py seed_library_data\n")
     return author1, library_central
 
 def run_queries(author_to_query, library_to_query):
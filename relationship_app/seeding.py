@@ -0,0 +1,273 @@
+# relationship_app/seeding.py
+"""
+Bulk seeding of authors, books, libraries and librarians for benchmarks.
+
+The rows are generated in a process pool. Every worker builds the rows for
+one range of primary keys from its own seeded random.Random, so a run with
+a seed gives the same data however many workers it uses. The parent
+process writes each range with bulk_create in one transaction, the
+``Library.books`` through table included, while the workers go on with
+the next ranges. At most two ranges per worker wait to be written, which
+keeps memory flat at any scale. Writing stays in one process because
+SQLite has a single writer.
+
+Primary keys are assigned up front, so nothing has to be read back after
+an insert. Book authors follow a Zipf distribution: a few authors write
+most books. Each library holds a uniform sample of the books.
+
+By default the tables are emptied first with the database's flush SQL
+(``DELETE`` and a sequence reset on SQLite, ``TRUNCATE`` on PostgreSQL)
+instead of deleting rows through the ORM one cascade at a time.
+
+Neither the flush nor bulk_create sends signals, so what relationship_app/
+signals.py maintains is brought up to date once at the end, in
+``rebuild_derived_data()``.
+
+Used by ``manage.py seed_library_data`` and query_samples.py.
+"""
+import os
+import random
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+from multiprocessing import get_all_start_methods, get_context
+from time import perf_counter
+
+from django.core.cache import cache
+from django.core.management.color import no_style
+from django.db import connections, router, transaction
+from django.db.models import Max
+
+from . import membership
+from .author_stats import rebuild_author_stats
+from .models import Author, AuthorHolding, AuthorStats, Book, Librarian, Library
+
+WORDS = (
+    'river night garden winter house stone light shadow letter city secret '
+    'summer ocean forest journey empire silent glass crown fire memory road '
+    'island storm daughter king queen war peace bridge mountain dream song'
+).split()
+
+# Rows generated per task handed to a worker.
+CHUNK_SIZE = 50000
+
+LibraryBook = Library.books.through
+
+# Children first, so TRUNCATE without CASCADE and DELETE both succeed.
+SEEDED_MODELS = (AuthorHolding, AuthorStats, LibraryBook, Librarian, Library, Book, Author)
+
+
+def zipf_cum_weights(n, exponent):
+    """Cumulative weights giving rank ``k`` (1-based) a weight of 1/k**exponent."""
+    return list(accumulate(1 / rank ** exponent for rank in range(1, n + 1)))
+
+
+def truncate(models=SEEDED_MODELS):
+    """Empty the tables of ``models`` and reset their primary key sequences."""
+    using = router.db_for_write(Book)
+    connection = connections[using]
+    tables = [model._meta.db_table for model in models]
+    sql = connection.ops.sql_flush(no_style(), tables, reset_sequences=True)
+    connection.ops.execute_sql_flush(sql)
+
+
+def rebuild_derived_data():
+    """Bring what is derived from the seeded tables up to date after bulk writes."""
+    # The cached pk of the default library (see views.py) may be gone.
+    from .views import DEFAULT_LIBRARY_CACHE_KEY
+    cache.delete(DEFAULT_LIBRARY_CACHE_KEY)
+    membership.invalidate()
+    rebuild_author_stats()
+
+
+# The worker tasks. They use no database and no Django, so they run the
+# same in a worker process or in this one.
+
+def _task_random(seed, kind, start):
+    return random.Random('%s-%s-%d' % (seed, kind, start))
+
+
+def book_rows(seed, start, stop, author_ids, cum_weights):
+    """(pk, title, author_id) for the books with pk in [start, stop)."""
+    rng = _task_random(seed, 'books', start)
+    authors = rng.choices(author_ids, cum_weights=cum_weights, k=stop - start)
+    return [
+        (pk, ' '.join(rng.choices(WORDS, k=rng.randint(1, 5))).title(), author_id)
+        for pk, author_id in zip(range(start, stop), authors)
+    ]
+
+
+def holding_rows(seed, library_ids, book_ids, per_library):
+    """(library_id, book_id) for a sample of ``per_library`` books in each library."""
+    rows = []
+    per_library = min(per_library, len(book_ids))
+    for library_id in library_ids:
+        rng = _task_random(seed, 'holdings', library_id)
+        rows.extend((library_id, book_id) for book_id in sorted(rng.sample(book_ids, per_library)))
+    return rows
+
+
+def _call(task):
+    func, args = task
+    return func(*args)
+
+
+class LibraryDataSeeder:
+    """
+    Writes ``authors`` authors, ``books`` books and ``libraries`` libraries,
+    each with a librarian and ``books_per_library`` books. ``exponent`` is
+    the Zipf exponent of the authors (0 gives uniform picks). ``workers``
+    processes generate the rows (default: one per CPU; 1 or less generates
+    them in this process), and ``seed`` makes runs repeatable. With
+    ``truncate=False`` the rows are added after the existing ones.
+    """
+
+    def __init__(self, books=1000000, authors=100000, libraries=1000, books_per_library=1000,
+                 exponent=1.1, workers=None, batch_size=5000, seed=None, truncate=True, log=None):
+        self.books = books
+        self.authors = authors
+        self.libraries = libraries
+        self.books_per_library = books_per_library
+        self.exponent = exponent
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.batch_size = batch_size
+        self.seed = random.randrange(sys.maxsize) if seed is None else seed
+        self.truncate = truncate
+        self.log = log or (lambda message: None)
+        self.using = router.db_for_write(Book)
+
+    def run(self):
+        """Seed everything; returns a dict of the row counts written, the time and the rate."""
+        started = perf_counter()
+        if self.truncate:
+            truncate()
+            self.log('Emptied the library tables.')
+        author_ids = self.create_authors()
+        library_ids = self.create_libraries()
+        with self.pool() as run_tasks:
+            book_ids = self.create_books(run_tasks, author_ids)
+            holdings = self.create_holdings(run_tasks, library_ids, book_ids)
+        self.reset_sequences()
+        rebuild_derived_data()
+        seconds = perf_counter() - started
+        counts = {
+            'authors': len(author_ids),
+            'books': len(book_ids),
+            'libraries': len(library_ids),
+            'holdings': holdings,
+        }
+        rows = sum(counts.values()) + len(library_ids)  # and a librarian each
+        counts.update(seconds=seconds, rows_per_second=rows / seconds if seconds else 0.0)
+        return counts
+
+    def pool(self):
+        return _TaskPool(self.workers)
+
+    def next_pk(self, model):
+        last = model.objects.using(self.using).aggregate(last=Max('pk'))['last']
+        return (last or 0) + 1
+
+    def chunks(self, ids):
+        for start in range(0, len(ids), CHUNK_SIZE):
+            yield ids[start:start + CHUNK_SIZE]
+
+    def write(self, model, objs):
+        with transaction.atomic(using=self.using):
+            model.objects.using(self.using).bulk_create(objs, batch_size=self.batch_size)
+
+    def reset_sequences(self):
+        # The primary keys were given explicitly, so sequences (on
+        # PostgreSQL) must be moved past them; SQLite needs nothing.
+        connection = connections[self.using]
+        sql = connection.ops.sequence_reset_sql(no_style(), [Author, Book, Library, Librarian])
+        if sql:
+            with transaction.atomic(using=self.using), connection.cursor() as cursor:
+                for statement in sql:
+                    cursor.execute(statement)
+
+    def create_authors(self):
+        start = self.next_pk(Author)
+        ids = range(start, start + self.authors)
+        for chunk in self.chunks(ids):
+            self.write(Author, [Author(pk=pk, name='Author %d' % pk) for pk in chunk])
+        self.log('Created %d authors.' % self.authors)
+        return ids
+
+    def create_libraries(self):
+        start = self.next_pk(Library)
+        ids = range(start, start + self.libraries)
+        for chunk in self.chunks(ids):
+            self.write(Library, [Library(pk=pk, name='Library %d' % pk) for pk in chunk])
+            self.write(Librarian, [Librarian(name='Librarian %d' % pk, library_id=pk) for pk in chunk])
+        self.log('Created %d libraries and their librarians.' % self.libraries)
+        return ids
+
+    def create_books(self, run_tasks, author_ids):
+        start = self.next_pk(Book)
+        ids = range(start, start + self.books)
+        if not author_ids:
+            return range(0)
+        weights = zipf_cum_weights(len(author_ids), self.exponent)
+        tasks = (
+            (book_rows, (self.seed, chunk.start, chunk.stop, author_ids, weights))
+            for chunk in self.chunks(ids)
+        )
+        written = 0
+        for rows in run_tasks(tasks):
+            self.write(Book, [Book(pk=pk, title=title, author_id=author_id) for pk, title, author_id in rows])
+            written += len(rows)
+            self.log('Created %d/%d books.' % (written, self.books))
+        return ids
+
+    def create_holdings(self, run_tasks, library_ids, book_ids):
+        if not book_ids or not self.books_per_library:
+            return 0
+        # Libraries per task, so a task makes about CHUNK_SIZE rows.
+        step = max(1, CHUNK_SIZE // self.books_per_library)
+        tasks = (
+            (holding_rows, (self.seed, library_ids[i:i + step], book_ids, self.books_per_library))
+            for i in range(0, len(library_ids), step)
+        )
+        written = 0
+        for rows in run_tasks(tasks):
+            self.write(LibraryBook, [
+                LibraryBook(library_id=library_id, book_id=book_id) for library_id, book_id in rows
+            ])
+            written += len(rows)
+            self.log('Added %d books to libraries.' % written)
+        return written
+
+class _TaskPool:
+    """
+    Runs (function, args) tasks in ``workers`` forked processes, or in this
+    process when ``workers`` is 1 or less or fork is unavailable. Results
+    come back in task order, with at most two tasks per worker in flight.
+    The workers inherit this process's database connections but never use
+    them.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.executor = None
+
+    def __enter__(self):
+        if self.workers > 1 and 'fork' in get_all_start_methods():
+            self.executor = ProcessPoolExecutor(self.workers, mp_context=get_context('fork'))
+        return self.run
+
+    def __exit__(self, *exc_info):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+    def run(self, tasks):
+        if self.executor is None:
+            yield from map(_call, tasks)
+            return
+        pending = deque()
+        for task in tasks:
+            pending.append(self.executor.submit(_call, task))
+            if len(pending) >= 2 * self.workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
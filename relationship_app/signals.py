@@ -0,0 +1,123 @@
+# relationship_app/signals.py
+"""
+Signal receivers that keep derived data (the library membership index and
+the author statistics) in sync with libraries and books. Connected in
+RelationshipAppConfig.ready().
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import author_stats, membership
+from .models import Author, Book, Library
+
+
+@receiver(m2m_changed, sender=Library.books.through)
+def index_library_books(sender, instance, action, reverse, pk_set=None, **kwargs):
+    # library.books.add(...) sends the library and book ids (reverse=False),
+    # book.libraries.add(...) the book and library ids (reverse=True). pk_set
+    # only holds the rows really added or removed.
+    if action == 'post_add':
+        if reverse:
+            membership.libraries_added(instance.pk, pk_set)
+        else:
+            membership.books_added(instance.pk, pk_set)
+    elif action == 'post_remove':
+        if reverse:
+            membership.libraries_removed(instance.pk, pk_set)
+        else:
+            membership.books_removed(instance.pk, pk_set)
+    elif action == 'post_clear':
+        if reverse:
+            membership.book_cleared(instance.pk)
+        else:
+            membership.library_cleared(instance.pk)
+
+
+@receiver(m2m_changed, sender=Library.books.through)
+def count_library_books(sender, instance, action, reverse, pk_set=None, **kwargs):
+    if action == 'pre_clear':
+        # What the clear is about to remove, which pk_set does not say.
+        if reverse:
+            instance._cleared_holdings = {
+                (instance.author_id, library_id): -1
+                for library_id in instance.libraries.values_list('pk', flat=True)
+            }
+        else:
+            instance._cleared_holdings = {
+                (author_id, instance.pk): -count
+                for author_id, count in author_stats.library_holdings(instance.pk).items()
+            }
+    elif action == 'post_clear':
+        author_stats.record_holdings(getattr(instance, '_cleared_holdings', {}))
+    elif action in ('post_add', 'post_remove') and pk_set:
+        sign = 1 if action == 'post_add' else -1
+        if reverse:
+            deltas = {(instance.author_id, library_id): sign for library_id in pk_set}
+        else:
+            deltas = {
+                (author_id, instance.pk): sign * count
+                for author_id, count in author_stats.books_by_author(pk_set).items()
+            }
+        author_stats.record_holdings(deltas)
+
+
+@receiver(post_save, sender=Author)
+def start_author_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        author_stats.record_author_added(instance.pk)
+
+
+@receiver(pre_save, sender=Book)
+def remember_book_author(sender, instance, raw=False, **kwargs):
+    if not raw and not instance._state.adding:
+        instance._old_author_id = (
+            Book.objects.filter(pk=instance.pk).values_list('author_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Book)
+def count_saved_book(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        # loaddata: the rebuild_author_stats command takes care of fixtures.
+        return
+    if created:
+        author_stats.record_books({instance.author_id: 1})
+        return
+    old_author_id = getattr(instance, '_old_author_id', None)
+    if old_author_id is not None and old_author_id != instance.author_id:
+        # The book and its places in libraries move to the new author.
+        author_stats.record_books({old_author_id: -1, instance.author_id: 1})
+        deltas = {}
+        for library_id in instance.libraries.values_list('pk', flat=True):
+            deltas[old_author_id, library_id] = -1
+            deltas[instance.author_id, library_id] = 1
+        author_stats.record_holdings(deltas)
+
+
+# Deletes take the through rows with them without an m2m_changed.
+
+@receiver(pre_delete, sender=Library)
+def remember_library_authors(sender, instance, **kwargs):
+    # Its AuthorHolding rows go away with it.
+    instance._holding_author_ids = list(author_stats.library_holdings(instance.pk))
+
+
+@receiver(post_delete, sender=Library)
+def unindex_deleted_library(sender, instance, **kwargs):
+    membership.library_deleted(instance.pk)
+    author_stats.record_library_deleted(getattr(instance, '_holding_author_ids', ()))
+
+
+@receiver(pre_delete, sender=Book)
+def remember_book_libraries(sender, instance, **kwargs):
+    instance._deleted_library_ids = list(instance.libraries.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Book)
+def unindex_deleted_book(sender, instance, **kwargs):
+    membership.book_cleared(instance.pk)
+    author_stats.record_books({instance.author_id: -1})
+    author_stats.record_holdings({
+        (instance.author_id, library_id): -1
+        for library_id in getattr(instance, '_deleted_library_ids', ())
+    })
@@ -0,0 +1,91 @@
+# relationship_app/startup.py
+"""
+What a worker does before it can answer its first request.
+
+``manage.py profile_startup`` runs this module in a fresh interpreter with
+``python -X importtime -m relationship_app.startup``. The child does what a
+WSGI worker does at boot (``get_wsgi_application()``) and imports the
+URLconf that the first request would otherwise import. Python reports every
+module import on stderr. The child records every SQL statement run meanwhile
+and where in the project it came from, and prints one JSON object as the
+last line of stdout: ``{"seconds": ..., "queries": [{"alias", "sql",
+"caller"}, ...]}``.
+
+Nothing should query the database before the first request: a query at
+import time makes every worker boot open a connection, and fails the boot
+if the database is down.
+"""
+import json
+import sys
+import traceback
+from functools import partial
+from pathlib import Path
+from time import perf_counter
+
+# -X importtime lines: "import time: <self us> | <cumulative us> | <indented name>"
+_IMPORTTIME_PREFIX = 'import time:'
+
+
+def parse_importtime(lines):
+    """
+    (module, self_us, cumulative_us) for each ``-X importtime`` line, in
+    import order. Other lines, such as the header, are skipped.
+    """
+    imports = []
+    for line in lines:
+        if not line.startswith(_IMPORTTIME_PREFIX):
+            continue
+        try:
+            own, cumulative, name = line[len(_IMPORTTIME_PREFIX):].split('|', 2)
+            imports.append((name.strip(), int(own), int(cumulative)))
+        except ValueError:
+            continue
+    return imports
+
+
+def _caller(base_dir):
+    """The innermost stack frame in the project's own code, as 'path:line in function'."""
+    here = Path(__file__).resolve()
+    for frame in reversed(traceback.extract_stack()):
+        path = Path(frame.filename).resolve()
+        if path == here or 'site-packages' in path.parts or not path.is_relative_to(base_dir):
+            continue
+        return '%s:%d in %s' % (path.relative_to(base_dir), frame.lineno, frame.name)
+    return None
+
+
+def _record(queries, base_dir, alias, execute, sql, params, many, context):
+    queries.append({'alias': alias, 'sql': sql, 'caller': _caller(base_dir)})
+    return execute(sql, params, many, context)
+
+
+def main():
+    start = perf_counter()
+    from django.conf import settings
+
+    # Import the settings (and their connection_created receivers, such as
+    # the PRAGMAs of sqlite_tuning) first, so only the statements run by
+    # the code being profiled are recorded.
+    base_dir = Path(settings.BASE_DIR).resolve()
+    from django.db.backends.signals import connection_created
+
+    queries = []
+
+    def watch(sender, connection, **kwargs):
+        connection.execute_wrappers.append(partial(_record, queries, base_dir, connection.alias))
+
+    connection_created.connect(watch, weak=False)
+
+    from django.core.wsgi import get_wsgi_application
+    from django.urls import get_resolver
+
+    get_wsgi_application()
+    get_resolver().url_patterns
+    seconds = perf_counter() - start
+
+    # On a line of its own, after anything the project printed.
+    sys.stdout.write('\n%s\n' % json.dumps({'seconds': seconds, 'queries': queries}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,404 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+import random
+
+from relationship_app import membership
+from relationship_app.author_stats import rebuild_author_stats
+from relationship_app.membership import Bitmap
+from relationship_app.models import Author, AuthorHolding, AuthorStats, Book, Librarian, Library
+from relationship_app.seeding import LibraryBook, LibraryDataSeeder
+from relationship_app.startup import parse_importtime
+from relationship_app.views import DEFAULT_LIBRARY_CACHE_KEY
+
+
+@override_settings(RELATIONSHIP_PAGE_SIZE=3, RELATIONSHIP_STREAM_CHUNK_SIZE=2)
+class BookListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(name='Ursula K. Le Guin')
+        cls.books = [Book.objects.create(title='Book %d' % i, author=cls.author) for i in range(7)]
+
+    def titles(self, response):
+        return [book.title for book in response.context['books']]
+
+    def test_first_page(self):
+        with self.assertNumQueries(2):  # COUNT and the page
+            response = self.client.get(reverse('book_list'))
+        self.assertEqual(self.titles(response), ['Book 0', 'Book 1', 'Book 2'])
+        self.assertEqual(response.context['page_obj'].paginator.num_pages, 3)
+        self.assertContains(response, 'by Ursula K. Le Guin', count=3)
+        self.assertContains(response, '?page=2')
+
+    def test_numbered_page(self):
+        response = self.client.get(reverse('book_list'), {'page': 3})
+        self.assertEqual(self.titles(response), ['Book 6'])
+        self.assertEqual(self.client.get(reverse('book_list'), {'page': 4}).status_code, 404)
+        self.assertEqual(self.client.get(reverse('book_list'), {'page': 'x'}).status_code, 404)
+
+    def test_cursor_pages(self):
+        seen = []
+        cursor = ''
+        while cursor is not None:
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse('book_list'), {'cursor': cursor})
+            seen += self.titles(response)
+            cursor = response.context['next_cursor']
+        self.assertEqual(seen, ['Book %d' % i for i in range(7)])
+        self.assertNotContains(response, 'Next</a>')
+
+    def test_cursor_skips_deleted_rows(self):
+        self.books[3].delete()
+        response = self.client.get(reverse('book_list'), {'cursor': self.books[2].pk})
+        self.assertEqual(self.titles(response), ['Book 4', 'Book 5', 'Book 6'])
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_invalid_cursor(self):
+        for cursor in ('abc', '-1'):
+            self.assertEqual(self.client.get(reverse('book_list'), {'cursor': cursor}).status_code, 404)
+
+    def test_streamed(self):
+        response = self.client.get(reverse('book_list'), {'stream': 1})
+        self.assertTrue(response.streaming)
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        # The page head, four chunks of at most two rows, the page tail.
+        self.assertEqual(len(chunks), 6)
+        body = ''.join(chunks)
+        self.assertTrue(body.startswith('<!DOCTYPE html>'))
+        self.assertTrue(body.rstrip().endswith('</html>'))
+        self.assertEqual(body.count('by Ursula K. Le Guin'), 7)
+        self.assertLess(body.index('Book 0'), body.index('Book 6'))
+        self.assertNotIn('<!-- book rows -->', body)
+        self.assertNotIn('<nav>', body)
+
+
+class DefaultLibraryTests(TestCase):
+    def setUp(self):
+        cache.delete(DEFAULT_LIBRARY_CACHE_KEY)
+
+    def test_no_library(self):
+        self.assertEqual(self.client.get(reverse('default_library_detail')).status_code, 404)
+        self.assertIsNone(cache.get(DEFAULT_LIBRARY_CACHE_KEY))
+
+    def test_first_library_is_cached(self):
+        first = Library.objects.create(name='Central')
+        Library.objects.create(name='Branch')
+        response = self.client.get(reverse('default_library_detail'))
+        self.assertEqual(response.context['library'], first)
+        self.assertEqual(cache.get(DEFAULT_LIBRARY_CACHE_KEY), first.pk)
+        with self.assertNumQueries(2):  # the library and its books, no lookup
+            self.client.get(reverse('default_library_detail'))
+
+    def test_deleted_library_is_looked_up_again(self):
+        first = Library.objects.create(name='Central')
+        second = Library.objects.create(name='Branch')
+        self.client.get(reverse('default_library_detail'))
+        first.delete()
+        response = self.client.get(reverse('default_library_detail'))
+        self.assertEqual(response.context['library'], second)
+        self.assertEqual(cache.get(DEFAULT_LIBRARY_CACHE_KEY), second.pk)
+
+
+class StartupTests(SimpleTestCase):
+    def test_parse_importtime(self):
+        lines = [
+            'import time: self [us] | cumulative | imported package',
+            'import time:       120 |        120 |     _io',
+            'import time:        85 |        205 |   io',
+            'Traceback (most recent call last):',
+        ]
+        self.assertEqual(parse_importtime(lines), [('_io', 120, 120), ('io', 85, 205)])
+
+
+class SeedingTests(TestCase):
+    def seed(self, **options):
+        options = {'books': 500, 'authors': 40, 'libraries': 7, 'books_per_library': 30,
+                   'workers': 1, 'batch_size': 100, 'seed': 1, **options}
+        return LibraryDataSeeder(**options).run()
+
+    def snapshot(self):
+        return (
+            list(Book.objects.order_by('pk').values_list('pk', 'title', 'author_id')),
+            list(LibraryBook.objects.order_by('library_id', 'book_id').values_list('library_id', 'book_id')),
+        )
+
+    def test_counts(self):
+        Author.objects.create(name='Old')
+        result = self.seed()
+        self.assertEqual(
+            (result['authors'], result['books'], result['libraries'], result['holdings']), (40, 500, 7, 210),
+        )
+        self.assertFalse(Author.objects.filter(name='Old').exists())
+        self.assertEqual(Author.objects.count(), 40)
+        self.assertEqual(Book.objects.count(), 500)
+        self.assertEqual(Librarian.objects.count(), 7)
+        for library in Library.objects.all():
+            self.assertEqual(library.books.count(), 30)
+        # Zipf: the first author writes the most books.
+        top = Author.objects.order_by('pk').first()
+        self.assertEqual(top.books.count(), max(author.books.count() for author in Author.objects.all()))
+
+    def test_repeatable_with_any_number_of_workers(self):
+        self.seed()
+        single = self.snapshot()
+        self.seed(workers=2)
+        self.assertEqual(self.snapshot(), single)
+
+    def test_append(self):
+        self.seed()
+        self.seed(truncate=False, seed=2)
+        self.assertEqual(Book.objects.count(), 1000)
+        self.assertEqual(Library.objects.count(), 14)
+        self.assertEqual(LibraryBook.objects.count(), 420)
+        book = Book.objects.create(title='New', author=Author.objects.first())
+        self.assertEqual(book.pk, 1001)
+
+
+class BitmapTests(SimpleTestCase):
+    def sample(self, rng):
+        # A dense chunk (bitmap), a sparse one (array) and scattered ids.
+        return (
+            set(rng.sample(range(0, 65536), 6000))
+            | set(rng.sample(range(65536, 131072), 300))
+            | {rng.randrange(10 ** 9) for _ in range(50)}
+        )
+
+    def test_matches_sets(self):
+        rng = random.Random(3)
+        a, b = self.sample(rng), self.sample(rng)
+        x, y = Bitmap(a), Bitmap(b)
+        self.assertEqual(list(x), sorted(a))
+        self.assertEqual(len(x), len(a))
+        self.assertEqual(list(x & y), sorted(a & b))
+        self.assertEqual(list(x | y), sorted(a | b))
+        self.assertEqual(list(x - y), sorted(a - b))
+        self.assertEqual(list(y - x), sorted(b - a))
+        self.assertEqual(list(x), sorted(a))  # operands unchanged
+
+    def test_add_discard(self):
+        bitmap = Bitmap()
+        values = list(range(0, 20000, 2))  # crosses ARRAY_MAX within one chunk
+        for value in values:
+            bitmap.add(value)
+        bitmap.add(4)
+        self.assertEqual(len(bitmap), len(values))
+        self.assertIn(19998, bitmap)
+        self.assertNotIn(3, bitmap)
+        for value in values[5:]:
+            bitmap.discard(value)
+        bitmap.discard(1)
+        self.assertEqual(list(bitmap), values[:5])
+        self.assertEqual(bitmap, Bitmap(values[:5]))
+        self.assertLess(bitmap.nbytes(), 100)
+
+
+class MembershipIndexTests(TransactionTestCase):
+    # The index only takes changes once they are committed.
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        author = Author.objects.create(name='Author')
+        self.books = Book.objects.bulk_create([Book(title='Book %d' % i, author=author) for i in range(6)])
+        self.a, self.b, self.c = Library.objects.bulk_create([Library(name=name) for name in 'ABC'])
+        LibraryBook.objects.bulk_create(
+            [LibraryBook(library=self.a, book=book) for book in self.books[:4]]
+            + [LibraryBook(library=self.b, book=book) for book in self.books[2:]]
+            + [LibraryBook(library=self.c, book=self.books[3])]
+        )
+        membership.invalidate()
+
+    def ids(self, books):
+        return sorted(self.books.index(book) for book in books)
+
+    def test_queries(self):
+        # Outside a transaction the reads go to the read alias.
+        with self.assertNumQueries(3, using='replica'):  # the index (two queries), then the books
+            self.assertEqual(self.ids(Book.objects.in_libraries(all_of=[self.a, self.b], none_of=[self.c])), [2])
+        with self.assertNumQueries(1, using='replica'):
+            self.assertEqual(self.ids(Book.objects.in_libraries(any_of=[self.a.pk, self.c])), [0, 1, 2, 3])
+        self.assertEqual(self.ids(Book.objects.in_libraries(none_of=[self.a])), [4, 5])
+        self.assertEqual(self.ids(Book.objects.in_libraries(all_of=[self.b], any_of=[self.a, self.c])), [2, 3])
+        self.assertEqual(list(Library.objects.holding(self.books[3]).order_by('pk')), [self.a, self.b, self.c])
+        self.assertEqual(list(Library.objects.holding(self.books[0], self.books[4])), [])
+
+    def test_kept_in_sync(self):
+        membership.membership_index()
+        self.a.books.add(self.books[5])
+        self.books[0].libraries.add(self.c)
+        self.b.books.remove(self.books[3])
+        self.books[2].libraries.remove(self.a)
+        with self.assertNumQueries(0, using='replica'):
+            self.assertEqual(list(membership.books_in(all_of=[self.a])), [self.books[i].pk for i in (0, 1, 3, 5)])
+            self.assertEqual(list(membership.libraries_holding(self.books[0])), [self.a.pk, self.c.pk])
+        self.c.books.clear()
+        self.books[5].libraries.clear()
+        self.books[4].delete()
+        self.b.delete()
+        self.assertEqual(self.ids(Book.objects.in_libraries()), [0, 1, 3])
+        self.assertEqual(list(membership.libraries_holding(self.books[3])), [self.a.pk])
+        # A fresh build agrees with the incremental updates.
+        expected = membership.membership_index()._books
+        membership.invalidate()
+        self.assertEqual(membership.membership_index()._books, expected)
+
+    def test_other_process_change_triggers_rebuild(self):
+        index = membership.membership_index()
+        cache.incr(membership.VERSION_CACHE_KEY)  # as if another worker changed something
+        self.assertIsNot(membership.membership_index(), index)
+        index = membership.membership_index()
+        self.a.books.add(self.books[5])  # our own change keeps the index
+        self.assertIs(membership.membership_index(), index)
+
+    def test_changes_wait_for_the_commit(self):
+        index = membership.membership_index()
+        version = cache.get(membership.VERSION_CACHE_KEY)
+        with transaction.atomic():
+            self.c.books.add(self.books[0])
+            self.assertNotIn(self.books[0].pk, index.books_of(self.c.pk))
+            self.assertEqual(cache.get(membership.VERSION_CACHE_KEY), version)
+            # The transaction itself sees its change, from an index it does not keep.
+            self.assertEqual(list(membership.libraries_holding(self.books[0])), [self.a.pk, self.c.pk])
+            self.assertIs(membership._index, index)
+        self.assertEqual(cache.get(membership.VERSION_CACHE_KEY), version + 1)
+        self.assertIs(membership.membership_index(), index)
+        self.assertIn(self.books[0].pk, index.books_of(self.c.pk))
+
+    def test_rolled_back_changes_are_not_applied(self):
+        index = membership.membership_index()
+        version = cache.get(membership.VERSION_CACHE_KEY)
+        b = self.b.pk
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.c.books.add(self.books[0])
+            self.b.delete()
+            membership.membership_index()
+            raise RuntimeError
+        self.assertEqual(cache.get(membership.VERSION_CACHE_KEY), version)
+        self.assertIs(membership.membership_index(), index)
+        self.assertEqual(list(membership.libraries_holding(self.books[0])), [self.a.pk])
+        self.assertEqual(list(membership.libraries_holding(self.books[4])), [b])
+
+    def test_shared_cache_check(self):
+        [warning] = membership.check_shared_cache()
+        self.assertEqual(warning.id, 'relationship_app.W001')
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}
+        with self.settings(CACHES=redis):
+            self.assertEqual(membership.check_shared_cache(), [])
+
+
+class AuthorStatsTests(TestCase):
+    def setUp(self):
+        self.austen, self.orwell = Author.objects.bulk_create([Author(name='Austen'), Author(name='Orwell')])
+        self.emma = Book.objects.create(title='Emma', author=self.austen)
+        self.persuasion = Book.objects.create(title='Persuasion', author=self.austen)
+        self.farm = Book.objects.create(title='Animal Farm', author=self.orwell)
+        self.central, self.west = Library.objects.bulk_create([Library(name='Central'), Library(name='West')])
+
+    def stats(self):
+        return {
+            author_id: (books, libraries)
+            for author_id, books, libraries in AuthorStats.objects.values_list('author', 'book_count', 'library_count')
+        }
+
+    def holdings(self):
+        return set(AuthorHolding.objects.values_list('author', 'library', 'book_count'))
+
+    def assertMatchesRebuild(self):
+        stats, holdings = self.stats(), self.holdings()
+        rebuild_author_stats()
+        self.assertEqual(stats, self.stats())
+        self.assertEqual(holdings, self.holdings())
+
+    def test_books_and_libraries(self):
+        self.central.books.add(self.emma, self.persuasion, self.farm)
+        self.farm.libraries.add(self.west)
+        self.assertEqual(self.stats(), {self.austen.pk: (2, 1), self.orwell.pk: (1, 2)})
+        self.assertIsNotNone(AuthorStats.objects.get(pk=self.orwell.pk).last_added)
+        self.assertMatchesRebuild()
+
+        # The library keeps counting while it holds one of the author's books.
+        self.central.books.remove(self.emma)
+        self.assertEqual(self.stats()[self.austen.pk], (2, 1))
+        self.persuasion.libraries.remove(self.central)
+        self.assertEqual(self.stats()[self.austen.pk], (2, 0))
+        self.assertMatchesRebuild()
+
+    def test_clear_delete_and_reassign(self):
+        self.central.books.add(self.emma, self.persuasion, self.farm)
+        self.west.books.add(self.emma)
+        self.central.books.clear()
+        self.assertEqual(self.stats(), {self.austen.pk: (2, 1), self.orwell.pk: (1, 0)})
+        self.central.books.add(self.persuasion)
+        self.persuasion.libraries.clear()
+        self.assertMatchesRebuild()
+
+        self.west.books.add(self.farm)
+        self.farm.author = self.austen
+        self.farm.save()
+        self.assertEqual(self.stats(), {self.austen.pk: (3, 1), self.orwell.pk: (0, 0)})
+        self.assertMatchesRebuild()
+
+        self.emma.delete()
+        self.assertEqual(self.stats()[self.austen.pk], (2, 1))
+        self.west.delete()
+        self.assertEqual(self.stats()[self.austen.pk], (2, 0))
+        self.assertMatchesRebuild()
+
+        self.austen.delete()
+        self.assertEqual(self.stats(), {self.orwell.pk: (0, 0)})
+        self.assertFalse(AuthorHolding.objects.exists())
+
+    def test_rebuild_keeps_last_added(self):
+        AuthorStats.objects.filter(pk=self.austen.pk).update(book_count=99)
+        last_added = AuthorStats.objects.get(pk=self.austen.pk).last_added
+        self.assertEqual(rebuild_author_stats(), 2)
+        stats = AuthorStats.objects.get(pk=self.austen.pk)
+        self.assertEqual((stats.book_count, stats.last_added), (2, last_added))
+
+
+@override_settings(RELATIONSHIP_PAGE_SIZE=3)
+class LibraryPagesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name='Author')
+        cls.books = Book.objects.bulk_create([Book(title='Book %d' % i, author=author) for i in range(8)])
+        cls.libraries = Library.objects.bulk_create([Library(name='Library %d' % i) for i in range(5)])
+        # Library i holds books 0 .. 2i - 1, added in reverse order.
+        LibraryBook.objects.bulk_create([
+            LibraryBook(library=library, book=book)
+            for i, library in enumerate(cls.libraries) for book in reversed(cls.books[:2 * i])
+        ])
+
+    def test_library_list(self):
+        with self.assertNumQueries(2):  # COUNT and the page with its book counts
+            response = self.client.get(reverse('library_list'))
+        self.assertEqual(
+            [(library.name, library.book_count) for library in response.context['libraries']],
+            [('Library 0', 0), ('Library 1', 2), ('Library 2', 4)],
+        )
+        self.assertContains(response, '(2 books)')
+        response = self.client.get(reverse('library_list'), {'page': 2})
+        self.assertEqual([library.book_count for library in response.context['libraries']], [6, 8])
+        self.assertEqual(self.client.get(reverse('library_list'), {'page': 3}).status_code, 404)
+
+    def test_library_books_by_cursor(self):
+        url = reverse('library_detail', args=[self.libraries[4].pk])
+        seen, cursor = [], ''
+        while cursor is not None:
+            with self.assertNumQueries(2):  # the library, then the page's books with their authors
+                response = self.client.get(url, {'cursor': cursor})
+                self.assertContains(response, 'by Author', count=len(response.context['books']))
+            seen += response.context['books']
+            cursor = response.context['next_cursor']
+        self.assertEqual(seen, self.books)
+
+        response = self.client.get(reverse('library_detail', args=[self.libraries[2].pk]), {'cursor': self.books[2].pk})
+        self.assertEqual(response.context['books'], [self.books[3]])
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertEqual(self.client.get(url, {'cursor': 'x'}).status_code, 404)
+
+    def test_empty_library(self):
+        response = self.client.get(reverse('library_detail', args=[self.libraries[0].pk]))
+        self.assertContains(response, 'No books found in this library.')
+        self.assertNotContains(response, '<nav>')
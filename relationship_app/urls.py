@@ -2,18 +2,6 @@
 
 from django.urls import path
 from . import views
-from .models import Library
-
-# Fetch the ID of the first library for demonstration (assuming data exists)
-try:
-    # Use .first() to get the primary key of an existing library record
-    # This is ONLY for easy demonstration; in a real app, IDs would come from navigation
-    first_library_pk = Library.objects.first().pk
-except AttributeError:
-    # Fallback if no data is found (shouldn't happen if query_samples ran)
-    first_library_pk = 1 
-except Exception:
-    first_library_pk = 1
 
 urlpatterns = [
     # 1. Function-based View (FBV) URL
@@ -28,11 +16,14 @@ urlpatterns = [
         name='library_detail'
     ),
     
-    # 3. Optional: A simple redirect for easy testing
+    # 3. Optional: The first library, looked up on the first request (not at import time)
     path(
         'library/',
-        views.LibraryDetailView.as_view(),
-        {'pk': first_library_pk}, # Pass the ID of the first library as a default
+        views.DefaultLibraryDetailView.as_view(),
         name='default_library_detail'
-    )
+    ),
+
+    # 4. Class-based View (CBV) URL: the directory of libraries
+    # Path: /relationship/libraries/?page=2
+    path('libraries/', views.LibraryListView.as_view(), name='library_list'),
 ]
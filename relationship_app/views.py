@@ -1,8 +1,17 @@
 # relationship_app/views.py
 
+from itertools import islice
+
+from django.core.cache import cache
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import render, redirect
-from django.views.generic import DetailView
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.views.generic import DetailView, ListView
 from .models import Book, Library
+from .pagination import (
+    cursor_page, numbered_page, page_size, parse_cursor, related_cursor_page, stream_chunk_size,
+)
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login, logout, authenticate # Import login, logout, authenticate
 # The following imports are not strictly necessary for this specific implementation but were in your provided block
@@ -15,23 +24,54 @@ from django.urls import reverse_lazy
 def book_list(request):
     """
     Function-based view to list all books.
-    Renders the 'list_books.html' template.
+    Renders the 'list_books.html' template one page at a time:
+    ?page=N pages with numbers, ?cursor=<pk> pages by primary key (see
+    pagination.py), and ?stream=1 sends every book in one streamed response.
     """
     # Query all books and prefetch the author to minimize database queries
-    all_books = Book.objects.select_related('author').all()
-    
-    context = {
-        'books': all_books
-    }
-    
+    all_books = Book.objects.select_related('author')
+
+    if request.GET.get('stream'):
+        return StreamingHttpResponse(_stream_books(request, all_books))
+
+    if 'cursor' in request.GET:
+        cursor = parse_cursor(request.GET['cursor'])
+        books, next_cursor = cursor_page(all_books, cursor)
+        context = {'books': books, 'cursor': cursor, 'next_cursor': next_cursor}
+    else:
+        page_obj = numbered_page(all_books, request.GET.get('page'))
+        context = {'books': page_obj.object_list, 'page_obj': page_obj}
+
     return render(request, 'list_books.html', context)
 
 
+# Stands in for the rows when list_books.html is split around them.
+_ROWS_MARKER = '<!-- book rows -->'
+
+
+def _stream_books(request, books):
+    """
+    Yield list_books.html in pieces: the page around the rows, split at
+    _ROWS_MARKER, and in between the rows of each chunk of books read with
+    .iterator(), so neither the queryset nor the page is held in memory.
+    """
+    page = render_to_string(
+        'list_books.html', {'streaming': True, 'rows_marker': mark_safe(_ROWS_MARKER)}, request,
+    )
+    head, tail = page.split(_ROWS_MARKER, 1)
+    yield head
+    chunk_size = stream_chunk_size()
+    rows = books.order_by('pk').iterator(chunk_size=chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        yield render_to_string('book_rows.html', {'books': chunk}, request)
+    yield tail
+
+
 ### 2. Class-based View (CBV) - DetailView ###
 
 class LibraryDetailView(DetailView):
     """
-    Class-based view (DetailView) to display a single Library and its books.
+    Class-based view (DetailView) to display a single Library and one page of its books.
     """
     # 1. Specify the model this view will operate on
     model = Library
@@ -42,10 +82,70 @@ class LibraryDetailView(DetailView):
     # 3. Specify the name used for the context variable in the template
     context_object_name = 'library'
     
-    # Optional: Override get_queryset to prefetch related ManyToMany data (books)
-    # This optimizes the query when the template accesses library.books.all
+    # The books are paged with ?cursor=<book pk> (see pagination.py) instead
+    # of prefetching library.books for the whole library: one query loads
+    # the page's books with their authors.
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        cursor = parse_cursor(self.request.GET.get('cursor'))
+        books, next_cursor = related_cursor_page(
+            Book.objects.select_related('author'),
+            Library.books.through.objects.filter(library=self.object),
+            'book_id',
+            cursor,
+        )
+        context.update(books=books, cursor=cursor, next_cursor=next_cursor)
+        return context
+
+
+### 3. Class-based View (CBV) - ListView ###
+
+class LibraryListView(ListView):
+    """
+    Class-based view (ListView) for the directory of libraries, ?page=N,
+    with the number of books of each library counted in the page's query.
+    """
+    template_name = 'library_list.html'
+    context_object_name = 'libraries'
+
     def get_queryset(self):
-        return super().get_queryset().prefetch_related('books__author')
+        return Library.objects.with_book_counts().order_by('pk')
+
+    def get_paginate_by(self, queryset):
+        return page_size()
+
+
+DEFAULT_LIBRARY_CACHE_KEY = 'relationship:default-library'
+
+
+def default_library_pk(refresh=False):
+    """
+    Primary key of the first library, or None when there is none. Looked up
+    on first use and cached, so importing the URLconf runs no query.
+    """
+    pk = None if refresh else cache.get(DEFAULT_LIBRARY_CACHE_KEY)
+    if pk is None:
+        pk = Library.objects.order_by('pk').values_list('pk', flat=True).first()
+        if pk is not None:
+            cache.set(DEFAULT_LIBRARY_CACHE_KEY, pk, None)
+    return pk
+
+
+class DefaultLibraryDetailView(LibraryDetailView):
+    """LibraryDetailView of the first library, for the /library/ demo link."""
+
+    def get_object(self, queryset=None):
+        self.kwargs['pk'] = default_library_pk()
+        if self.kwargs['pk'] is None:
+            raise Http404('There are no libraries yet.')
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            # The cached library was deleted since: look again.
+            self.kwargs['pk'] = default_library_pk(refresh=True)
+            if self.kwargs['pk'] is None:
+                raise
+            return super().get_object(queryset)
 
 
 # ----------------------------------------------------------------------